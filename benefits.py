@@ -0,0 +1,165 @@
+"""
+Income-tested social benefits: old-age pension, disability benefits and student support.
+
+Each scheme pays a full annual amount to eligible people (by age and status) and reduces it
+by `rate` for every krona of countable income above `allowance`. Countable income is capital
+gains, private other income (pension funds etc.) and wages above `wage_allowance`.
+A person receives at most one scheme, in the order of BENEFIT_POLICY.
+
+The generated `other_income` already reproduces the official means, which include benefits.
+apply_benefits therefore splits it instead of adding to it: for every eligible person it
+solves other_income = private + benefit(private) for the private part (f is monotone, so a
+vectorized bisection converges in a few dozen array passes). Totals are unchanged and the
+population gains `benefits` and `private_other_income` columns. A reform is evaluated by
+recomputing benefits on the fixed private incomes (with_benefit_policy), which feeds the new
+other_income and total_income straight into calculate_taxes.compute_taxes.
+"""
+import copy
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from population_store import load_population
+
+# Approximate 2025 annual amounts (ISK); `status` None means any status
+BENEFIT_POLICY = {
+    'old_age_pension': {
+        'min_age': 67, 'max_age': None, 'status': None,
+        'full': 4_530_000, 'rate': 0.45, 'allowance': 438_000, 'wage_allowance': 2_400_000,
+    },
+    'disability': {
+        'min_age': 18, 'max_age': 66, 'status': 'Disabled',
+        'full': 4_800_000, 'rate': 0.45, 'allowance': 1_200_000, 'wage_allowance': 0,
+    },
+    'student_support': {
+        'min_age': 18, 'max_age': 29, 'status': 'Student',
+        'full': 1_200_000, 'rate': 0.5, 'allowance': 1_360_000, 'wage_allowance': 0,
+    },
+}
+BISECTION_STEPS = 50
+BENEFIT_COLUMNS = ['benefits', 'private_other_income', 'benefit_take_up']
+
+
+def eligible_scheme(population_df: pd.DataFrame, policy: dict = BENEFIT_POLICY) -> np.ndarray:
+    """Index into `policy` of each person's scheme, or -1 when not eligible for any."""
+    age = population_df['age'].to_numpy()
+    status = population_df['status'].to_numpy()
+    scheme = np.full(len(population_df), -1)
+    for idx, rules in enumerate(policy.values()):
+        mask = (scheme == -1) & (age >= rules['min_age'])
+        if rules['max_age'] is not None:
+            mask &= age <= rules['max_age']
+        if rules['status'] is not None:
+            mask &= status == rules['status']
+        scheme[mask] = idx
+    return scheme
+
+
+def _rule_arrays(scheme: np.ndarray, policy: dict) -> dict:
+    """Per-person rule parameters (zeros for people outside every scheme)."""
+    keys = ('full', 'rate', 'allowance', 'wage_allowance')
+    table = np.array([[rules[k] for k in keys] for rules in policy.values()] + [[0.0] * len(keys)], dtype=float)
+    return dict(zip(keys, table[scheme].T))  # scheme -1 picks the trailing zero row
+
+
+def benefit_amount(private_other: np.ndarray, wages: np.ndarray, capital_gains: np.ndarray, rules: dict) -> np.ndarray:
+    """Income-tested benefit for each person given their rule arrays."""
+    countable = private_other + capital_gains + np.maximum(0, wages - rules['wage_allowance'])
+    reduction = rules['rate'] * np.maximum(0, countable - rules['allowance'])
+    return np.maximum(0, rules['full'] - reduction)
+
+
+def split_other_income(population_df: pd.DataFrame, policy: dict = BENEFIT_POLICY):
+    """Solve other_income = private + benefit(private) per person; returns (private, benefit, take_up)."""
+    other = population_df['other_income'].to_numpy(dtype=float)
+    wages = population_df['wages'].to_numpy(dtype=float)
+    capital_gains = population_df['capital_gains'].to_numpy(dtype=float)
+    rules = _rule_arrays(eligible_scheme(population_df, policy), policy)
+
+    # f(p) = p + benefit(p) is nondecreasing, so bisect p on [0, other]
+    low, high = np.zeros_like(other), other.copy()
+    for _ in range(BISECTION_STEPS):
+        mid = (low + high) / 2
+        above = mid + benefit_amount(mid, wages, capital_gains, rules) > other
+        high = np.where(above, mid, high)
+        low = np.where(above, low, mid)
+    private = low
+    benefit = other - private
+    # Where even zero private income implies more benefit than observed, only part is taken up
+    entitled = benefit_amount(private, wages, capital_gains, rules)
+    take_up = np.divide(benefit, entitled, out=np.zeros_like(benefit), where=entitled > 0)
+    return private, benefit, np.minimum(take_up, 1.0)
+
+
+def apply_benefits(population_df: pd.DataFrame, rng: np.random.Generator | None = None,
+                   policy: dict = BENEFIT_POLICY) -> None:
+    """Post-processing step: add `benefits`, `private_other_income` and `benefit_take_up` (in place)."""
+    private, benefit, take_up = split_other_income(population_df, policy)
+    population_df['private_other_income'] = np.round(private)
+    population_df['benefits'] = population_df['other_income'] - population_df['private_other_income']
+    population_df['benefit_take_up'] = take_up
+
+
+def with_benefit_policy(population_df: pd.DataFrame, policy: dict) -> pd.DataFrame:
+    """Copy of the population with benefits, other_income and total_income under `policy`."""
+    df = population_df.copy()
+    if 'private_other_income' not in df.columns:
+        apply_benefits(df)
+    rules = _rule_arrays(eligible_scheme(df, policy), policy)
+    benefit = np.round(df['benefit_take_up'].to_numpy() * benefit_amount(
+        df['private_other_income'].to_numpy(dtype=float),
+        df['wages'].to_numpy(dtype=float),
+        df['capital_gains'].to_numpy(dtype=float),
+        rules,
+    ))
+    df['benefits'] = benefit
+    df['other_income'] = df['private_other_income'] + benefit
+    df['total_income'] = df['wages'] + df['capital_gains'] + df['other_income']
+    return df
+
+
+def reform(**changes) -> dict:
+    """BENEFIT_POLICY with scheme parameters replaced, e.g. reform(old_age_pension={'rate': 0.4})."""
+    policy = copy.deepcopy(BENEFIT_POLICY)
+    for scheme, values in changes.items():
+        policy[scheme].update(values)
+    return policy
+
+
+def benefit_totals(population_df: pd.DataFrame, policy: dict = BENEFIT_POLICY) -> dict:
+    """Weighted benefit spending and recipients per scheme."""
+    weights = population_weights(population_df)
+    scheme = eligible_scheme(population_df, policy)
+    benefit = population_df['benefits'].to_numpy()
+    totals = {}
+    for idx, name in enumerate(policy):
+        mask = (scheme == idx) & (benefit > 0)
+        totals[name] = {'spending': float(benefit[mask] @ weights[mask]), 'recipients': float(weights[mask].sum())}
+    return totals
+
+
+def main():
+    from calculate_taxes import compute_taxes, tax_totals
+
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    conn.close()
+    if 'benefits' not in population_df.columns or population_df['benefits'].isna().any():
+        apply_benefits(population_df)
+
+    # Example reform: lower the old-age pension reduction rate from 45% to 40%
+    scenarios = {'baseline': BENEFIT_POLICY, 'pension rate 40%': reform(old_age_pension={'rate': 0.40})}
+    for label, policy in scenarios.items():
+        df = with_benefit_policy(population_df, policy)
+        totals = benefit_totals(df, policy)
+        taxes = tax_totals(compute_taxes(df))
+        print(f"{label}:")
+        for name, values in totals.items():
+            print(f"  {name}: {format_number(values['spending'])} to {format_number(values['recipients'])} people")
+        print(f"  Total tax: {format_number(taxes['total_tax'])}")
+
+
+if __name__ == "__main__":
+    main()
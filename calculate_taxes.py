@@ -1,23 +1,18 @@
+import numpy as np
 import pandas as pd
 import sqlite3
 import matplotlib.pyplot as plt
 from pathlib import Path
-from helpers import get_db_path, format_number
-
-# Define constants for the tax calculation
-PERSONAL_TAX_CREDIT = 779112  # Annual personal tax credit in ISK
-TAX_BRACKETS = [
-    (446136 * 12, 0.3148),     # Up to 5,353,632 ISK at 31.48%
-    (1252501 * 12, 0.3798),    # 5,353,633 - 15,030,012 ISK at 37.98%
-    (float('inf'), 0.4628),    # Above 15,030,012 ISK at 46.28%
-]
-CHILD_TAX_RATE = 0.06  # Tax rate for children under 16
-CAPITAL_GAINS_TAX_RATE = 0.22  # 22% tax rate on capital gains
-FREE_CAPITAL_GAINS_LIMIT = 300000  # Free capital gains limit in ISK
-RADIO_FEE = 20900  # Radio fee in ISK for individuals 18 and older
-ELDERLY_FUND_FEE = 13749  # Fee for the Elderly Fund for individuals 18 and older
+from helpers import get_db_path, format_number, population_weights
+from policy import TaxPolicy, load_policy
+from households import records_can_pair
+from population_store import load_population
+
+# Tax rules (brackets, credits, allowances, fees) come from the policy file; see policy.py
+POLICY = load_policy()
 MUNICIPAL_TAX_PATH = Path("data/utsvar_sveitarfelaga.xls")
-FALLBACK_MUNICIPAL_TAX_RATE = 0.1494  # 14.94% average if file cannot be read
+FALLBACK_MUNICIPAL_TAX_RATE = POLICY.municipal_fallback_rate  # average if the file cannot be read
+TAX_COLUMNS = ['income_tax', 'municipal_tax', 'capital_gains_tax', 'fixed_fees', 'total_tax']
 
 
 def load_municipal_tax_rate(path: Path = MUNICIPAL_TAX_PATH, fallback: float = FALLBACK_MUNICIPAL_TAX_RATE) -> float:
@@ -34,85 +29,133 @@ def load_municipal_tax_rate(path: Path = MUNICIPAL_TAX_PATH, fallback: float = F
         return fallback
 
 
+def load_municipal_tax_rates(path: Path = MUNICIPAL_TAX_PATH) -> pd.Series:
+    """Per-municipality rates from the XLS file, indexed by municipality number (svnr).
+
+    Municipalities merged into others have no current rate and are left out.
+    """
+    try:
+        df = pd.read_excel(path, sheet_name="Öll", header=None)
+        codes = pd.to_numeric(df[0], errors="coerce")
+        rates = pd.to_numeric(df[2], errors="coerce")
+        valid = codes.notna() & rates.between(0, 1, inclusive="neither")
+        return pd.Series(rates[valid].to_numpy(), index=codes[valid].astype(int).to_numpy(), name="rate")
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read municipal tax rates from {path}: {exc}. Using the average rate everywhere.")
+        return pd.Series(dtype=float, name="rate")
+
+
+def municipal_rate_lookup(rates: pd.Series, fallback: float) -> np.ndarray:
+    """Dense array indexed by municipality number; unknown numbers get `fallback`."""
+    lookup = np.full(int(rates.index.max()) + 1 if len(rates) else 1, fallback)
+    lookup[rates.index.to_numpy(dtype=np.intp)] = rates.to_numpy()
+    return lookup
+
+
 MUNICIPAL_TAX_RATE = load_municipal_tax_rate()
+MUNICIPAL_RATE_LOOKUP = municipal_rate_lookup(load_municipal_tax_rates(), MUNICIPAL_TAX_RATE)
 
-# Function to calculate income tax based on annual income
-def calculate_income_tax(total_income, age, municipal_tax_rate=MUNICIPAL_TAX_RATE):
-    if age < 16:
-        # Apply children's tax rate (no municipal component)
-        taxable_income = max(0, total_income - 180000)
-        child_tax = taxable_income * CHILD_TAX_RATE
-        return child_tax, 0.0
-
-    # Calculate state tax based on tax brackets
-    state_tax = 0.0
-    remaining_income = total_income
-    for limit, rate in TAX_BRACKETS:
-        if remaining_income <= 0:
-            break
-        portion = min(remaining_income, limit)
-        state_tax += portion * rate
-        remaining_income -= portion
-        if remaining_income <= 0:
-            break
-
-    municipal_tax = total_income * municipal_tax_rate
-    gross_tax = state_tax + municipal_tax
-    net_tax = max(0, gross_tax - PERSONAL_TAX_CREDIT)  # Apply personal tax credit after combining
-
-    # Allocate the personal tax credit proportionally between state and municipal components
-    if gross_tax > 0 and net_tax > 0:
-        net_municipal_tax = municipal_tax * (net_tax / gross_tax)
-    else:
-        net_municipal_tax = 0.0
 
+def municipal_rates(population_df: pd.DataFrame, municipal_tax_rate=None):
+    """Municipal tax rate per person: `municipal_tax_rate` if given, else the rate of each
+    person's `municipality`, else the national average."""
+    if municipal_tax_rate is not None:
+        return municipal_tax_rate
+    if 'municipality' not in population_df.columns or population_df['municipality'].isna().any():
+        return MUNICIPAL_TAX_RATE
+    codes = population_df['municipality'].to_numpy(dtype=np.intp)
+    return MUNICIPAL_RATE_LOOKUP[np.clip(codes, 0, len(MUNICIPAL_RATE_LOOKUP) - 1)]
+
+# Array evaluation for the whole population at once; `policy` defaults to POLICY
+def state_tax_array(total_income, policy: TaxPolicy = POLICY) -> np.ndarray:
+    """State tax by exact bracket lookup."""
+    return policy.state_tax(total_income)
+
+
+def gross_income_tax_array(total_income, municipal_tax_rate=MUNICIPAL_TAX_RATE, policy: TaxPolicy = POLICY):
+    """State plus municipal tax before the personal credit: returns (gross_tax, municipal_tax) arrays."""
+    return policy.gross_tax(total_income, municipal_tax_rate)
+
+
+def calculate_income_tax_array(total_income, age, municipal_tax_rate=MUNICIPAL_TAX_RATE, policy: TaxPolicy = POLICY):
+    """Income tax after the personal credit (or the children's tax): returns (net_tax, net_municipal_tax) arrays.
+
+    Pass a scaled policy (policy.scaled(1 / 12)) to compute withholding for a single month.
+    """
+    return policy.income_tax(total_income, age, municipal_tax_rate)
+
+
+def transfer_unused_credit(total_income, age, household_id, is_adult, municipal_tax_rate=MUNICIPAL_TAX_RATE,
+                           policy: TaxPolicy = POLICY):
+    """Income tax with unused personal credit shared between the adults of each household.
+
+    Returns (net_tax, net_municipal_tax) like calculate_income_tax_array. Each adult's unused
+    credit is pooled per household with np.bincount and the partner's share is deducted from
+    the remaining tax; people outside a couple are unaffected.
+    """
+    net_tax, net_municipal_tax = policy.income_tax(total_income, age, municipal_tax_rate)
+    gross_tax, municipal_tax = policy.gross_tax(total_income, municipal_tax_rate)
+    eligible = np.asarray(is_adult) & (np.asarray(age) >= policy.credit_transfer_min_age)
+    household_id = np.asarray(household_id)
+
+    unused = np.where(eligible, np.maximum(0, policy.personal_credit - gross_tax), 0.0)
+    pooled = np.bincount(household_id[eligible], weights=unused[eligible], minlength=household_id.max() + 1)
+    received = np.where(eligible, pooled[household_id] - unused, 0.0)
+
+    transferred = np.maximum(0, gross_tax - policy.personal_credit - received)
+    share = np.divide(transferred, gross_tax, out=np.zeros_like(gross_tax), where=gross_tax > 0)
+    net_tax = np.where(eligible, transferred, net_tax)
+    net_municipal_tax = np.where(eligible, municipal_tax * share, net_municipal_tax)
     return net_tax, net_municipal_tax
 
-# Function to calculate capital gains tax based on annual capital gains
-def calculate_capital_gains_tax(capital_gains):
-    taxable_capital_gains = max(0, capital_gains - FREE_CAPITAL_GAINS_LIMIT)
-    return taxable_capital_gains * CAPITAL_GAINS_TAX_RATE
 
-# Function to calculate other fixed annual fees
-def calculate_fixed_fees(age):
-    if age >= 18:
-        return RADIO_FEE + ELDERLY_FUND_FEE
-    return 0
+def calculate_capital_gains_tax_array(capital_gains, policy: TaxPolicy = POLICY):
+    return policy.capital_gains_tax(capital_gains)
+
 
-# Connect to the SQLite database
-conn = sqlite3.connect(get_db_path())
+def calculate_fixed_fees_array(age, policy: TaxPolicy = POLICY):
+    return policy.fixed_fees(age)
 
-# Fetch the generated population data
-generated_population_query = "SELECT * FROM population"
-generated_population_df = pd.read_sql_query(generated_population_query, conn)
 
-# Calculate taxes for each individual in the population
-generated_population_df[['income_tax', 'municipal_tax']] = generated_population_df.apply(
-    lambda row: calculate_income_tax(row['total_income'], row['age'], MUNICIPAL_TAX_RATE),
-    axis=1,
-    result_type='expand'
-)
+def compute_taxes(population_df: pd.DataFrame, municipal_tax_rate=None, policy: TaxPolicy | None = None) -> pd.DataFrame:
+    """Return a copy of the population with per-person tax columns (amounts per person, not weighted).
+
+    Without an explicit `municipal_tax_rate` everyone pays the rate of their municipality.
+    `policy` (a compiled policy.TaxPolicy) defaults to POLICY.
+    """
+    policy = POLICY if policy is None else policy
+    df = population_df.copy()
+    municipal_tax_rate = municipal_rates(df, municipal_tax_rate)
+    if policy.credit_transfer and 'household_id' in df.columns and df['household_id'].notna().all() \
+            and records_can_pair(df):
+        # Spouses can use each other's unused personal credit (exact populations only, see households.py)
+        df['income_tax'], df['municipal_tax'] = transfer_unused_credit(
+            df['total_income'].to_numpy(), df['age'].to_numpy(), df['household_id'].to_numpy(),
+            (df['household_role'] == 'adult').to_numpy(), municipal_tax_rate, policy,
+        )
+    else:
+        df['income_tax'], df['municipal_tax'] = calculate_income_tax_array(
+            df['total_income'].to_numpy(), df['age'].to_numpy(), municipal_tax_rate, policy
+        )
+    df['capital_gains_tax'] = calculate_capital_gains_tax_array(df['capital_gains'].to_numpy(), policy)
+    df['fixed_fees'] = calculate_fixed_fees_array(df['age'].to_numpy(), policy)
 
-generated_population_df['capital_gains_tax'] = generated_population_df.apply(
-    lambda row: calculate_capital_gains_tax(row['capital_gains']), axis=1
-)
+    # Calculate the total tax for each individual
+    df['total_tax'] = df['income_tax'] + df['capital_gains_tax'] + df['fixed_fees']
+    return df
 
-generated_population_df['fixed_fees'] = generated_population_df.apply(
-    lambda row: calculate_fixed_fees(row['age']), axis=1
-)
 
-# Calculate the total tax for each individual
-generated_population_df['total_tax'] = generated_population_df['income_tax'] + \
-                                       generated_population_df['capital_gains_tax'] + \
-                                       generated_population_df['fixed_fees']
+def tax_totals(taxed_df: pd.DataFrame) -> dict:
+    """Population totals of each tax column, honoring the `weight` column."""
+    weights = population_weights(taxed_df)
+    return {col: float(taxed_df[col].to_numpy() @ weights) for col in TAX_COLUMNS}
 
-# Close the connection
-conn.close()
 
 # Plot and save the tax distributions by age
-def plot_tax_by_age(tax_type, tax_column, title, file_name):
+def plot_tax_by_age(taxed_df, tax_type, tax_column, title, file_name, age_range=range(1, 109)):
     # Sum the tax by age
-    tax_by_age = generated_population_df.groupby('age')[tax_column].sum().reindex(age_range, fill_value=0)
+    weighted_tax = taxed_df[tax_column] * population_weights(taxed_df)
+    tax_by_age = weighted_tax.groupby(taxed_df['age']).sum().reindex(age_range, fill_value=0)
 
     # Plot the tax distribution by age
     plt.figure(figsize=(10, 6))
@@ -122,30 +165,45 @@ def plot_tax_by_age(tax_type, tax_column, title, file_name):
     plt.ylabel('Tax Amount')
     plt.legend()
     plt.grid(True)
-    
+
     # Save the plot
     plt.savefig('tests/' + file_name)
     plt.close()
 
-# Define age range for plotting
-age_range = range(1, 109)
 
-# Plot and save the income tax distribution by age
-plot_tax_by_age('Income Tax', 'income_tax', 'Income Tax Distribution by Age', 'income_tax_distribution_by_age.png')
+def main():
+    # Connect to the SQLite database
+    conn = sqlite3.connect(get_db_path())
+
+    # Fetch the generated population data (memory-mapped from the column store when it is current)
+    generated_population_df = load_population(conn)
+
+    # Close the connection
+    conn.close()
+
+    # Calculate taxes for each individual in the population, at the útsvar rate of their municipality
+    generated_population_df = compute_taxes(generated_population_df)
 
-# Plot and save the capital gains tax distribution by age
-plot_tax_by_age('Capital Gains Tax', 'capital_gains_tax', 'Capital Gains Tax Distribution by Age', 'capital_gains_tax_distribution_by_age.png')
+    # Plot and save the income tax distribution by age
+    plot_tax_by_age(generated_population_df, 'Income Tax', 'income_tax', 'Income Tax Distribution by Age', 'income_tax_distribution_by_age.png')
+
+    # Plot and save the capital gains tax distribution by age
+    plot_tax_by_age(generated_population_df, 'Capital Gains Tax', 'capital_gains_tax', 'Capital Gains Tax Distribution by Age', 'capital_gains_tax_distribution_by_age.png')
+
+    # Calculate and print the total amount for each tax
+    totals = tax_totals(generated_population_df)
+
+    if 'municipality' in generated_population_df.columns and generated_population_df['municipality'].notna().all():
+        print(f"Tax policy: {POLICY.name}; municipal tax rates per municipality (average {MUNICIPAL_TAX_RATE*100:.2f}%)")
+    else:
+        print(f"Tax policy: {POLICY.name}; municipal tax rate (average): {MUNICIPAL_TAX_RATE*100:.2f}%")
+    print(f"Total Income Tax: {format_number(totals['income_tax'])}")
+    print(f"  of which municipal (net after credit allocation): {format_number(totals['municipal_tax'])}")
+    print(f"Total Capital Gains Tax: {format_number(totals['capital_gains_tax'])}")
+    print(f"Total Fixed Fees (Radio and Elderly Fund): {format_number(totals['fixed_fees'])}")
 
-# Calculate and print the total amount for each tax
-total_income_tax = round(generated_population_df['income_tax'].sum())
-total_capital_gains_tax = round(generated_population_df['capital_gains_tax'].sum())
-total_municipal_tax = round(generated_population_df['municipal_tax'].sum())
-total_fixed_fees = round(generated_population_df['fixed_fees'].sum())
+    print("Tax distributions and totals have been saved and printed.")
 
-print(f"Municipal tax rate (average): {MUNICIPAL_TAX_RATE*100:.2f}%")
-print(f"Total Income Tax: {format_number(total_income_tax)}")
-print(f"  of which municipal (net after credit allocation): {format_number(total_municipal_tax)}")
-print(f"Total Capital Gains Tax: {format_number(total_capital_gains_tax)}")
-print(f"Total Fixed Fees (Radio and Elderly Fund): {format_number(total_fixed_fees)}")
 
-print("Tax distributions and totals have been saved and printed.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Raking (iterative proportional fitting) of the generated population to official marginals.
+
+Person weights are adjusted so that several marginals hold at once:
+- population by age (population_distribution),
+- employed people by age and gender (employment_data),
+and income components are rescaled per age/gender cell so weighted means match
+gender_and_age_income_distribution. Records in the same group of every margin always get
+the same factor, so rake_cells collapses them into cells (age x gender x employed), rakes
+the few hundred cell totals with a handful of np.bincount calls per iteration and writes
+the factors back to the records once.
+
+Run as a script to calibrate the `population` table in place (DB_PATH honoured).
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from income_model import INCOME_COMPONENTS
+from benefits import apply_benefits
+from population_store import load_population
+
+MAX_ITER = 200
+TOLERANCE = 1e-6  # max relative error over all margins
+
+
+def count_margin(name: str, codes: np.ndarray, targets: np.ndarray) -> dict:
+    """Sum of weights per group must equal targets; rows with code -1 are outside the margin."""
+    return {'name': name, 'codes': codes, 'targets': np.asarray(targets, dtype=float)}
+
+
+def _group_sums(codes, inside, weights, n_groups):
+    return np.bincount(codes[inside], weights=weights[inside], minlength=n_groups)
+
+
+def margin_error(margin: dict, weights: np.ndarray) -> float:
+    """Largest relative gap between achieved and target totals over the reachable groups of one margin.
+
+    Groups without any records (e.g. no employed 13 year olds were drawn) cannot be raked and are skipped.
+    """
+    codes, targets = margin['codes'], margin['targets']
+    inside = codes >= 0
+    achieved = _group_sums(codes, inside, weights, len(targets))
+    active = (targets > 0) & (np.bincount(codes[inside], minlength=len(targets)) > 0)
+    if not active.any():
+        return 0.0
+    return float(np.max(np.abs(achieved[active] - targets[active]) / targets[active]))
+
+
+def _apply_count(margin, weights):
+    codes, targets = margin['codes'], margin['targets']
+    inside = codes >= 0
+    totals = _group_sums(codes, inside, weights, len(targets))
+    # Groups without any records cannot be reached; leave their members untouched
+    factor = np.divide(targets, totals, out=np.ones_like(targets), where=totals > 0)
+    weights[inside] *= factor[codes[inside]]
+
+
+def rake(weights: np.ndarray, margins: list, max_iter: int = MAX_ITER, tol: float = TOLERANCE):
+    """Cycle through the margins until all hold within `tol`. Returns (weights, iterations, max error)."""
+    weights = np.asarray(weights, dtype=float).copy()
+    error = max((margin_error(m, weights) for m in margins), default=0.0)
+    for iteration in range(1, max_iter + 1):
+        for margin in margins:
+            _apply_count(margin, weights)
+        error = max(margin_error(m, weights) for m in margins)
+        if error < tol:
+            return weights, iteration, error
+    return weights, max_iter, error
+
+
+def rake_cells(weights: np.ndarray, margins: list, max_iter: int = MAX_ITER, tol: float = TOLERANCE):
+    """rake() on the cells of records that share a group in every margin. Returns (weights, iterations, max error).
+
+    Every factor rake() applies is per group, so records of one cell keep their relative weights
+    and only the cell totals need raking.
+    """
+    # One integer per combination of groups (code -1, outside a margin, is a group of its own)
+    key = np.zeros(len(weights), dtype=np.intp)
+    for margin in margins:
+        key = key * (len(margin['targets']) + 1) + margin['codes'] + 1
+    keys = np.flatnonzero(np.bincount(key))
+    lookup = np.zeros(keys[-1] + 1, dtype=np.intp)
+    lookup[keys] = np.arange(len(keys))
+    cells = lookup[key]
+    totals = np.bincount(cells, weights=weights)
+
+    # Decode each margin's group of every cell from its key, last margin first
+    cell_margins = []
+    for margin in reversed(margins):
+        radix = len(margin['targets']) + 1
+        cell_margins.insert(0, dict(margin, codes=keys % radix - 1))
+        keys = keys // radix
+    raked, iterations, error = rake(totals, cell_margins, max_iter, tol)
+    factor = np.divide(raked, totals, out=np.ones_like(totals), where=totals > 0)
+    return weights * factor[cells], iterations, error
+
+
+def scale_income_means(population_df: pd.DataFrame, weights: np.ndarray, cell_codes: np.ndarray,
+                       target_means: dict) -> None:
+    """Rescale each income component per cell so its weighted mean equals the official mean (in place).
+
+    Cells whose target is NaN (no official figure) or whose current mean is zero are left unchanged.
+    """
+    n_cells = len(next(iter(target_means.values())))
+    cell_weight = np.bincount(cell_codes, weights=weights, minlength=n_cells)
+    for column, targets in target_means.items():
+        values = population_df[column].to_numpy(dtype=float)
+        sums = np.bincount(cell_codes, weights=weights * values, minlength=n_cells)
+        means = np.divide(sums, cell_weight, out=np.zeros(n_cells), where=cell_weight > 0)
+        factor = np.ones(n_cells)
+        reachable = ~np.isnan(targets) & (means > 0)
+        factor[reachable] = targets[reachable] / means[reachable]
+        population_df[column] = values * factor[cell_codes]
+    population_df['total_income'] = population_df[list(target_means)].sum(axis=1)
+
+
+def cell_codes_for(population_df: pd.DataFrame) -> np.ndarray:
+    """Code (age, gender) cells as age * 2 + is_female."""
+    return population_df['age'].to_numpy(dtype=np.intp) * 2 + (population_df['gender'].to_numpy() == 'Female')
+
+
+def build_margins(population_df: pd.DataFrame, population_dist: pd.DataFrame, employment_df: pd.DataFrame) -> list:
+    """Assemble the count margins from the silver tables."""
+    ages = population_df['age'].to_numpy(dtype=np.intp)
+    n_ages = int(max(ages.max(), population_dist['age'].max())) + 1
+    age_targets = np.zeros(n_ages)
+    age_targets[population_dist['age'].to_numpy(dtype=np.intp)] = population_dist['population'].to_numpy(dtype=float)
+    margins = [count_margin('population by age', ages, age_targets)]
+
+    cells = cell_codes_for(population_df)
+    n_cells = n_ages * 2
+    employed_targets = np.zeros(n_cells)
+    employment = employment_df.groupby(['age', 'gender'])['employed'].sum().reset_index()
+    employment = employment[employment['age'] < n_ages]
+    employment_cells = employment['age'].to_numpy(dtype=np.intp) * 2 + (employment['gender'].str.lower() == 'female')
+    np.add.at(employed_targets, employment_cells.to_numpy(), employment['employed'].to_numpy(dtype=float))
+    # Employment counts can exceed the generated cell (registers include non-residents); cap at 95%
+    employed_targets = np.minimum(employed_targets, 0.95 * age_targets.repeat(2) / 2)
+    employed = population_df['status'].to_numpy() == 'Employed'
+    margins.append(count_margin('employed by age/gender', np.where(employed, cells, -1), employed_targets))
+
+    return margins
+
+
+def official_cell_means(income_df: pd.DataFrame, n_cells: int) -> dict:
+    """Official mean per (age, gender) cell for each income component, NaN where unpublished."""
+    official = income_df.rename(columns={'Aldur': 'age', 'Kyn': 'gender'})
+    official = official[official['age'] * 2 + 1 < n_cells]
+    codes = official['age'].to_numpy(dtype=np.intp) * 2 + (official['gender'] == 'Konur').to_numpy()
+    means = {}
+    for column, source in INCOME_COMPONENTS.items():
+        values = np.full(n_cells, np.nan)
+        values[codes] = official[source].to_numpy(dtype=float)
+        means[column] = values
+    return means
+
+
+def calibrate(population_df: pd.DataFrame, population_dist: pd.DataFrame, employment_df: pd.DataFrame,
+              income_df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """Rake weights and rescale incomes; returns the calibrated population and a fit summary."""
+    df = population_df.copy()
+    cells = cell_codes_for(df)
+    n_cells = int(max(cells.max() + 1, (population_dist['age'].max() + 1) * 2))
+    target_means = official_cell_means(income_df, n_cells)
+
+    # Count margins do not depend on incomes, so one raking pass before the income step is enough
+    margins = build_margins(df, population_dist, employment_df)
+    weights, iterations, error = rake_cells(population_weights(df), margins)
+    scale_income_means(df, weights, cells, target_means)
+    if 'benefits' in df.columns:
+        apply_benefits(df)  # other_income was rescaled; split it again
+
+    df['weight'] = weights
+    summary = {m['name']: margin_error(m, weights) for m in margins}
+    summary['iterations'] = iterations
+    summary['max_error'] = error
+    return df, summary
+
+
+def main():
+    from generate_population import write_population
+
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    population_dist = pd.read_sql_query("SELECT * FROM population_distribution", conn)
+    employment_df = pd.read_sql_query("SELECT * FROM employment_data", conn)
+    income_df = pd.read_sql_query("SELECT * FROM gender_and_age_income_distribution", conn)
+
+    population_df['weight'] = population_weights(population_df)
+    calibrated, summary = calibrate(population_df, population_dist, employment_df, income_df)
+    write_population(conn, calibrated)
+    conn.close()
+
+    print(f"Calibrated {len(calibrated)} records in {summary.pop('iterations')} raking iterations "
+          f"(max relative margin error {summary.pop('max_error'):.2e}).")
+    for name, err in summary.items():
+        print(f"  {name}: max relative error {err:.2e}")
+    print(f"  Weighted population: {format_number(calibrated['weight'].sum())}")
+
+
+if __name__ == "__main__":
+    main()
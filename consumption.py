@@ -0,0 +1,183 @@
+"""
+Household consumption and indirect taxes (VAT and excise).
+
+Spending comes from the household budget survey in data/cost_of_living.csv: the average
+household (Fjöldi í heimili, 2.9 people) spends a known amount on each of twelve COICOP
+categories. Every category is brought to current prices with its own consumer price index
+(first to last month of data/consumer_price_index.csv), and national spending per
+category is the average household's spending times the number of such households.
+
+Each household spends on a category in proportion to its OECD equivalence scale times its
+relative equivalised disposable income to the power SPENDING_ELASTICITY (total spending
+rises less than income, so saving rises with income) times the category's expenditure
+elasticity (food below 1, hotels and restaurants above 1). The shares are then scaled so the
+national totals hold exactly; the elasticities only shape who spends what.
+
+Taxes are a (households x categories) @ (categories x 2) matrix product with the effective
+VAT and excise rate of every category (prices include VAT, so VAT is rate / (1 + rate) of
+the VAT-liable share). The result is compared with "Skattar á vöru og þjónustu" in the
+2026 budget (fjárlög, table 4-1), which also covers tourists, firms and the public sector.
+Run as a script to write `indirect_tax_by_decile`.
+"""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights, weighted_deciles
+from households import equivalence_scales, household_heads, household_index
+from calculate_taxes import compute_taxes
+from population_store import load_population
+
+COST_OF_LIVING_PATH = Path("data/cost_of_living.csv")
+CPI_PATH = Path("data/consumer_price_index.csv")
+BUDGET_LINE = "Skattar á vöru og þjónustu"
+SURVEY_HOUSEHOLD_SIZE = 2.9  # used if the survey file has no "Fjöldi í heimili" row
+
+# Per COICOP category: expenditure elasticity, VAT rate, VAT-liable share of spending and excise
+# (share of consumer prices). Rent, health care, education and insurance are VAT exempt.
+CATEGORIES = {
+    '01': {'name': 'Food and non-alcoholic beverages', 'elasticity': 0.5, 'vat_rate': 0.11, 'vat_share': 1.0, 'excise': 0.01},
+    '02': {'name': 'Alcohol and tobacco', 'elasticity': 0.8, 'vat_rate': 0.11, 'vat_share': 1.0, 'excise': 0.45},
+    '03': {'name': 'Clothing and footwear', 'elasticity': 1.1, 'vat_rate': 0.24, 'vat_share': 1.0, 'excise': 0.0},
+    '04': {'name': 'Housing, heating and electricity', 'elasticity': 0.6, 'vat_rate': 0.11, 'vat_share': 0.15, 'excise': 0.01},
+    '05': {'name': 'Furnishings and household equipment', 'elasticity': 1.2, 'vat_rate': 0.24, 'vat_share': 1.0, 'excise': 0.02},
+    '06': {'name': 'Health', 'elasticity': 0.9, 'vat_rate': 0.24, 'vat_share': 0.3, 'excise': 0.0},
+    '07': {'name': 'Transport', 'elasticity': 1.2, 'vat_rate': 0.24, 'vat_share': 0.8, 'excise': 0.15},
+    '08': {'name': 'Post and telecommunications', 'elasticity': 0.6, 'vat_rate': 0.24, 'vat_share': 1.0, 'excise': 0.0},
+    '09': {'name': 'Recreation and culture', 'elasticity': 1.3, 'vat_rate': 0.24, 'vat_share': 0.7, 'excise': 0.0},
+    '10': {'name': 'Education', 'elasticity': 1.0, 'vat_rate': 0.24, 'vat_share': 0.1, 'excise': 0.0},
+    '11': {'name': 'Hotels and restaurants', 'elasticity': 1.4, 'vat_rate': 0.11, 'vat_share': 1.0, 'excise': 0.0},
+    '12': {'name': 'Other goods and services', 'elasticity': 1.0, 'vat_rate': 0.24, 'vat_share': 0.5, 'excise': 0.0},
+}
+SPENDING_ELASTICITY = 0.7  # of total spending with respect to disposable income
+
+
+def load_spending(path: Path = COST_OF_LIVING_PATH, cpi_path: Path = CPI_PATH) -> tuple[pd.Series, float]:
+    """Average household spending per category code in current prices, and the survey household size.
+
+    Returns (None, None) with a warning if the survey cannot be read; categories without a
+    price index keep their survey prices.
+    """
+    try:
+        survey = pd.read_csv(path, encoding='utf-8')
+        labels = survey.iloc[:, 0].astype(str)
+        codes = labels.str.extract(r'^(\d{2})\s')[0]
+        spending = pd.Series(survey.iloc[:, 1].to_numpy(dtype=float)[codes.notna()], index=codes.dropna().to_numpy())
+        size_row = survey[labels.str.strip() == "Fjöldi í heimili"]
+        size = float(size_row.iloc[0, 1]) if not size_row.empty else SURVEY_HOUSEHOLD_SIZE
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read the household budget survey from {path}: {exc}. Skipping consumption.")
+        return None, None
+    try:
+        cpi = pd.read_csv(cpi_path, sep=';', encoding='utf-8-sig').set_index('Mánuður')
+        growth = cpi.iloc[-1] / cpi.iloc[0]
+        growth.index = growth.index.str[:2]  # "031 Föt" prices clothing and footwear
+        spending = spending * growth.reindex(spending.index).fillna(1.0).to_numpy()
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read consumer price index from {cpi_path}: {exc}. Using survey prices.")
+    return spending.reindex(list(CATEGORIES)).fillna(0.0), size
+
+
+def load_budget_target(conn, line: str = BUDGET_LINE) -> float | None:
+    """A revenue line of the 2026 budget proposal (ISK) from the `fjarlog_2026_revenue` silver table, or None."""
+    try:
+        row = pd.read_sql_query("SELECT frumvarp_2026 FROM fjarlog_2026_revenue WHERE line = ?", conn, params=(line,))
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read fjarlog_2026_revenue: {exc}.")
+        return None
+    return float(row.iloc[0, 0]) * 1e6 if not row.empty else None  # m.kr.
+
+
+def tax_rates() -> np.ndarray:
+    """Effective (VAT, excise) rate of every category as a (categories x 2) matrix."""
+    return np.array([
+        [rules['vat_share'] * rules['vat_rate'] / (1 + rules['vat_rate']), rules['excise']]
+        for rules in CATEGORIES.values()
+    ])
+
+
+def household_resources(population_df: pd.DataFrame) -> dict:
+    """Per household: head row, weight, equivalence scale and disposable income."""
+    if 'total_tax' not in population_df.columns:
+        population_df = compute_taxes(population_df)
+    household = household_index(population_df)
+    heads, _ = household_heads(population_df)
+    disposable = (population_df['total_income'] - population_df['total_tax']).to_numpy(dtype=float)
+    return {
+        'heads': heads,
+        'weight': population_weights(population_df)[heads],
+        'persons': np.bincount(household)[household[heads]],
+        'scale': equivalence_scales(population_df)[household[heads]],
+        'disposable': np.bincount(household, weights=disposable)[household[heads]],
+    }
+
+
+def household_spending(resources: dict, spending: pd.Series, survey_size: float) -> np.ndarray:
+    """Spending matrix (households x categories) scaled to the national category totals."""
+    weight, scale = resources['weight'], resources['scale']
+    equivalised = np.maximum(resources['disposable'], 0) / scale
+    relative = np.maximum(equivalised / np.average(equivalised, weights=weight), 0.05)
+    elasticity = np.array([rules['elasticity'] for rules in CATEGORIES.values()])
+    raw = scale[:, None] * relative[:, None] ** (SPENDING_ELASTICITY * elasticity)
+    national = spending.to_numpy() * (weight @ resources['persons']) / survey_size
+    return raw * (national / (weight @ raw))
+
+
+def indirect_taxes(spending_matrix: np.ndarray) -> np.ndarray:
+    """(households x 2) matrix of VAT and excise paid."""
+    return spending_matrix @ tax_rates()
+
+
+def indirect_tax_by_decile(resources: dict, spending_matrix: np.ndarray, taxes: np.ndarray) -> pd.DataFrame:
+    """Spending and indirect taxes by decile of equivalised disposable income."""
+    weight = resources['weight']
+    decile = weighted_deciles(resources['disposable'] / resources['scale'], weight)
+
+    def total(values):
+        return np.bincount(decile, weights=weight * values, minlength=10)
+
+    disposable = total(resources['disposable'])
+    return pd.DataFrame({
+        'decile': np.arange(1, 11),
+        'households': np.bincount(decile, weights=weight, minlength=10),
+        'disposable_income': disposable,
+        'spending': total(spending_matrix.sum(axis=1)),
+        'vat': total(taxes[:, 0]),
+        'excise': total(taxes[:, 1]),
+        'indirect_tax_share_of_income': total(taxes.sum(axis=1)) / disposable,
+    })
+
+
+def main():
+    spending, survey_size = load_spending()
+    if spending is None:
+        return
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+
+    resources = household_resources(population_df)
+    spending_matrix = household_spending(resources, spending, survey_size)
+    taxes = indirect_taxes(spending_matrix)
+    deciles = indirect_tax_by_decile(resources, spending_matrix, taxes)
+    deciles.to_sql("indirect_tax_by_decile", conn, if_exists="replace", index=False)
+    target = load_budget_target(conn)
+    conn.close()
+
+    weight = resources['weight']
+    vat, excise = weight @ taxes
+    print(f"Household consumption: {format_number(weight @ spending_matrix.sum(axis=1))} "
+          f"({len(resources['heads'])} households)")
+    print(f"Indirect taxes: {format_number(vat + excise)} (VAT {format_number(vat)}, excise {format_number(excise)})")
+    if target:
+        print(f"  {BUDGET_LINE} (budget 2026): {format_number(target)}; households pay {(vat + excise) / target:.0%}")
+    print("Indirect taxes by equivalised disposable income decile:")
+    for _, row in deciles.iterrows():
+        print(f"  {int(row['decile']):2d}: {format_number(row['vat'] + row['excise'])} "
+              f"({row['indirect_tax_share_of_income']:.1%} of disposable income)")
+    print("Decile results written to the indirect_tax_by_decile table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Distributional analytics: deciles, percentile shares, Gini coefficients, Lorenz curves and
+average/effective tax rates.
+
+IncomeRanking sorts the population once by an income measure (weighted by `weight`) and
+every statistic reuses that order:
+- each person's percentile is the midpoint of their weight along the cumulative weights,
+  and deciles (or any number of groups) follow from it,
+- the Lorenz curve is the cumulative population and income shares along the order,
+  percentile shares (top 1%, bottom 50%, ...) interpolate it, and the Gini coefficient is
+  1 minus twice the area under it (trapezoids),
+- tax tables by decile, age band or gender are grouped sums with np.bincount.
+So a full set of tables costs one O(n log n) sort plus O(n) passes.
+
+Measures: `total_income`, `disposable_income` (total_income - total_tax) and
+`equivalised_disposable_income` (households.py). The sort order of each measure can be
+cached as integer ranks in the `income_ranks` table (one int32 blob per measure, in
+population row order, so reading them back is cheaper than sorting again). A cached rank
+is the position in the sort, so loading inverts the permutation in O(n) and checks in O(n)
+that incomes do not decrease along it; a stale cache is simply sorted again.
+"""
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from calculate_taxes import compute_taxes
+from households import equivalised_income
+from population_store import load_population
+
+MEASURES = ['total_income', 'disposable_income', 'equivalised_disposable_income']
+RANKS_TABLE = "income_ranks"
+AGE_BANDS = [0, 18, 25, 35, 45, 55, 67, 80, 200]
+SHARES = {'bottom_50': (0.0, 0.5), 'top_10': (0.9, 1.0), 'top_1': (0.99, 1.0)}
+
+
+class IncomeRanking:
+    """One weighted sort of an income measure and the statistics that reuse it."""
+
+    def __init__(self, income: np.ndarray, weights: np.ndarray, order: np.ndarray | None = None):
+        self.income = np.asarray(income, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.order = np.argsort(self.income, kind='stable') if order is None else order
+        sorted_weights = self.weights[self.order]
+        self.cum_weight = np.cumsum(sorted_weights)
+        self.cum_income = np.cumsum(sorted_weights * self.income[self.order])
+
+    @classmethod
+    def from_ranks(cls, income: np.ndarray, weights: np.ndarray, ranks: np.ndarray) -> "IncomeRanking | None":
+        """Rebuild from cached ranks in O(n); None if they are not a valid sort of `income`."""
+        ranks = np.asarray(ranks, dtype=np.intp)
+        n = len(ranks)
+        if n != len(income) or n == 0 or ranks.min() < 0 or ranks.max() >= n:
+            return None
+        order = np.empty(n, dtype=np.intp)
+        order[ranks] = np.arange(n)
+        if np.bincount(ranks, minlength=n).max() != 1 or np.any(np.diff(np.asarray(income, dtype=float)[order]) < 0):
+            return None
+        return cls(income, weights, order)
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """Position of every person in the sort."""
+        ranks = np.empty(len(self.order), dtype=np.intp)
+        ranks[self.order] = np.arange(len(self.order))
+        return ranks
+
+    def percentiles(self) -> np.ndarray:
+        """Share of the population (by weight) below the midpoint of each person."""
+        midpoint = (self.cum_weight - self.weights[self.order] / 2) / self.cum_weight[-1]
+        result = np.empty(len(self.order))
+        result[self.order] = midpoint
+        return result
+
+    def groups(self, n: int = 10) -> np.ndarray:
+        """Group 0..n-1 of equal weight (n=10 gives deciles) for every person."""
+        return np.minimum((self.percentiles() * n).astype(np.intp), n - 1)
+
+    def lorenz(self, points: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """(population share, income share), from (0, 0); on `points` equal steps if given."""
+        population = np.r_[0.0, self.cum_weight / self.cum_weight[-1]]
+        income = np.r_[0.0, self.cum_income / self.cum_income[-1]]
+        if points is None:
+            return population, income
+        grid = np.linspace(0, 1, points + 1)
+        return grid, np.interp(grid, population, income)
+
+    def gini(self) -> float:
+        population, income = self.lorenz()
+        return float(1 - np.sum(np.diff(population) * (income[1:] + income[:-1])))
+
+    def share(self, low: float, high: float) -> float:
+        """Share of income held by the population between percentiles `low` and `high` (0-1)."""
+        population, income = self.lorenz()
+        return float(np.interp(high, population, income) - np.interp(low, population, income))
+
+
+def income_measures(taxed_df: pd.DataFrame) -> dict:
+    """Every measure in MEASURES as an array (needs the total_tax column)."""
+    total = taxed_df['total_income'].to_numpy(dtype=float)
+    return {
+        'total_income': total,
+        'disposable_income': total - taxed_df['total_tax'].to_numpy(dtype=float),
+        'equivalised_disposable_income': equivalised_income(taxed_df),
+    }
+
+
+def load_cached_ranks(conn) -> dict:
+    """Cached ranks per measure from RANKS_TABLE (empty if there are none)."""
+    try:
+        rows = conn.execute(f"SELECT measure, ranks FROM {RANKS_TABLE}").fetchall()
+    except sqlite3.Error:
+        return {}
+    return {measure: np.frombuffer(blob, dtype=np.int32) for measure, blob in rows}
+
+
+def store_ranks(conn, rankings: dict) -> None:
+    """Write the ranks of every measure to RANKS_TABLE as one int32 blob (population row order)."""
+    conn.execute(f"DROP TABLE IF EXISTS {RANKS_TABLE}")
+    conn.execute(f"CREATE TABLE {RANKS_TABLE} (measure TEXT PRIMARY KEY, ranks BLOB)")
+    conn.executemany(f"INSERT INTO {RANKS_TABLE} VALUES (?, ?)",
+                     [(measure, ranking.ranks.astype(np.int32).tobytes()) for measure, ranking in rankings.items()])
+    conn.commit()
+
+
+def rank_population(taxed_df: pd.DataFrame, conn=None, measures=MEASURES) -> tuple[dict, list]:
+    """IncomeRanking per measure, reusing valid cached ranks; returns (rankings, measures sorted afresh)."""
+    cached = load_cached_ranks(conn) if conn is not None else {}
+    weights = population_weights(taxed_df)
+    values = income_measures(taxed_df)
+    rankings, sorted_now = {}, []
+    for measure in measures:
+        ranking = None
+        if measure in cached:
+            ranking = IncomeRanking.from_ranks(values[measure], weights, cached[measure])
+        if ranking is None:
+            ranking = IncomeRanking(values[measure], weights)
+            sorted_now.append(measure)
+        rankings[measure] = ranking
+    return rankings, sorted_now
+
+
+def tax_rate_table(taxed_df: pd.DataFrame, groups: np.ndarray, size: int) -> pd.DataFrame:
+    """People, incomes, taxes and tax rates per group.
+
+    effective_tax_rate is total tax over total income of the group; average_tax_rate is the
+    weighted mean of the personal rates of people with income.
+    """
+    weights = population_weights(taxed_df)
+    income = taxed_df['total_income'].to_numpy(dtype=float)
+    tax = taxed_df['total_tax'].to_numpy(dtype=float)
+    has_income = income > 0
+    personal_rate = np.divide(tax, income, out=np.zeros_like(tax), where=has_income)
+
+    def total(values):
+        return np.bincount(groups, weights=weights * values, minlength=size)
+
+    table = pd.DataFrame({
+        'people': total(1.0),
+        'total_income': total(income),
+        'disposable_income': total(income - tax),
+        'total_tax': total(tax),
+    })
+    table['effective_tax_rate'] = table['total_tax'] / table['total_income'].where(table['total_income'] > 0)
+    table['average_tax_rate'] = total(personal_rate) / pd.Series(total(has_income)).where(lambda s: s > 0)
+    return table
+
+
+def decile_table(taxed_df: pd.DataFrame, ranking: IncomeRanking) -> pd.DataFrame:
+    """Tax rates and income shares by decile of the ranking's measure."""
+    deciles = ranking.groups(10)
+    table = tax_rate_table(taxed_df, deciles, 10)
+    table.insert(0, 'decile', np.arange(1, 11))
+    table['income_share'] = np.diff(ranking.lorenz(10)[1])
+    return table
+
+
+def age_gender_table(taxed_df: pd.DataFrame) -> pd.DataFrame:
+    """Tax rates by age band and gender."""
+    bands = np.searchsorted(AGE_BANDS, taxed_df['age'].to_numpy(), side='right') - 1
+    female = (taxed_df['gender'].to_numpy() == 'Female').astype(np.intp)
+    size = (len(AGE_BANDS) - 1) * 2
+    table = tax_rate_table(taxed_df, bands * 2 + female, size)
+    table.insert(0, 'gender', np.tile(['Male', 'Female'], len(AGE_BANDS) - 1))
+    table.insert(0, 'age_band', np.repeat([f"{lo}-{hi - 1}" if hi < 200 else f"{lo}+"
+                                           for lo, hi in zip(AGE_BANDS[:-1], AGE_BANDS[1:])], 2))
+    return table[table['people'] > 0].reset_index(drop=True)
+
+
+def summary(rankings: dict) -> pd.DataFrame:
+    """Gini coefficient and percentile shares per measure."""
+    rows = []
+    for measure, ranking in rankings.items():
+        rows.append({'measure': measure, 'gini': ranking.gini(),
+                     **{name: ranking.share(low, high) for name, (low, high) in SHARES.items()}})
+    return pd.DataFrame(rows)
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    taxed = compute_taxes(population_df)
+
+    start = time.perf_counter()
+    rankings, sorted_now = rank_population(taxed, conn)
+    ranked = time.perf_counter()
+    stats = summary(rankings)
+    deciles = pd.concat([decile_table(taxed, ranking).assign(measure=measure)
+                         for measure, ranking in rankings.items()], ignore_index=True)
+    by_age_gender = age_gender_table(taxed)
+    lorenz = pd.concat([pd.DataFrame(dict(zip(['population_share', 'income_share'], ranking.lorenz(100))))
+                        .assign(measure=measure) for measure, ranking in rankings.items()], ignore_index=True)
+    done = time.perf_counter()
+
+    if sorted_now:
+        store_ranks(conn, rankings)
+    stats.to_sql("distribution_summary", conn, if_exists="replace", index=False)
+    deciles.to_sql("distribution_by_decile", conn, if_exists="replace", index=False)
+    by_age_gender.to_sql("distribution_by_age_gender", conn, if_exists="replace", index=False)
+    lorenz.to_sql("lorenz_curves", conn, if_exists="replace", index=False)
+    conn.close()
+
+    cache = f"sorted {', '.join(sorted_now)}" if sorted_now else "all ranks from cache"
+    print(f"Distribution of {len(taxed)} records: ranks in {ranked - start:.2f}s ({cache}), "
+          f"tables in {done - ranked:.2f}s")
+    for _, row in stats.iterrows():
+        print(f"  {row['measure']}: Gini {row['gini']:.3f}, top 10% {row['top_10']:.1%}, "
+              f"top 1% {row['top_1']:.1%}, bottom 50% {row['bottom_50']:.1%}")
+    print("Effective tax rate by decile of total income:")
+    for _, row in deciles[deciles['measure'] == 'total_income'].iterrows():
+        rate = f"{row['effective_tax_rate']:.1%}" if pd.notna(row['effective_tax_rate']) else "-"
+        print(f"  {int(row['decile']):2d}: {rate} (income share {row['income_share']:.1%}, mean income "
+              f"{format_number(row['total_income'] / row['people'])})")
+    print("Tables written: distribution_summary, distribution_by_decile, distribution_by_age_gender, lorenz_curves.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+School enrollment by level, age and gender from the official student counts.
+
+data/fjoldi_a_skolastigi.csv gives the number of students per school level and gender.
+LEVEL_AGE_PROFILES gives the relative enrollment rate of each level by age (linear between
+the points, zero outside). The enrollment probability of level l at age a for gender g is
+
+    p_l(a, g) = r_l(a) * students_l,g / sum_a' r_l(a') * people(a', g),
+
+so the expected number of students per level and gender matches the counts. If the levels
+at one age add up to more than 1 they are scaled down. The probabilities are kept as a
+cumulative lookup array of shape (genders, ages, levels), and a whole population is
+enrolled with one batched draw: one uniform per person compared with its row.
+
+generate_population.py enrolls each age/gender cell with one batched draw before its
+status draw, stores the level in `school_level` (None when not enrolled) and makes every
+enrolled person who neither works nor is retired a Student. Working students stay Employed
+(the employment rates count them as employed).
+
+data/fjoldi_i_nami.csv is not read: its two rows (upper secondary and post-secondary
+students by gender) are the same counts as those levels in fjoldi_a_skolastigi.csv.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ENROLLMENT_PATH = Path("data/fjoldi_a_skolastigi.csv")
+LEVELS = ['Leikskólastig', 'Grunnskólastig', 'Framhaldsskólastig', 'Viðbótarstig', 'Háskólastig', 'Doktorsstig']
+LEVEL_AGE_PROFILES = {
+    'Leikskólastig': ([0, 1, 2, 5, 6], [0.0, 0.5, 1.0, 1.0, 0.0]),
+    'Grunnskólastig': ([5, 6, 15, 16], [0.0, 1.0, 1.0, 0.0]),
+    'Framhaldsskólastig': ([15, 16, 19, 25, 40, 41], [0.0, 1.0, 0.8, 0.15, 0.05, 0.0]),
+    'Viðbótarstig': ([18, 20, 30, 50, 51], [0.0, 1.0, 0.6, 0.2, 0.0]),
+    'Háskólastig': ([18, 19, 22, 26, 35, 60, 61], [0.0, 0.3, 1.0, 0.8, 0.25, 0.05, 0.0]),
+    'Doktorsstig': ([23, 25, 30, 35, 50, 51], [0.0, 0.3, 1.0, 0.8, 0.2, 0.0]),
+}
+ENROLLMENT_GENDERS = {'Male': 'Karlar', 'Female': 'Konur'}
+
+
+class Enrollment:
+    """Cumulative enrollment probabilities indexed by [gender, age, level]."""
+
+    def __init__(self, probabilities: np.ndarray, genders: list):
+        self.probabilities = probabilities
+        self.cumulative = np.cumsum(probabilities, axis=-1)
+        self.genders = genders
+
+    @classmethod
+    def from_counts(cls, counts: pd.DataFrame, population_df: pd.DataFrame) -> "Enrollment":
+        """Probabilities from students per level (rows) and gender (columns) and people per age."""
+        people = population_df.groupby('age')['population'].sum()
+        max_age = int(people.index.max())
+        people = people.reindex(np.arange(max_age + 1), fill_value=0).to_numpy(dtype=float) / 2  # per gender
+        ages = np.arange(max_age + 1)
+        genders = list(ENROLLMENT_GENDERS)
+        probabilities = np.zeros((len(genders), max_age + 1, len(LEVELS)))
+        for l_idx, level in enumerate(LEVELS):
+            rate = np.interp(ages, *LEVEL_AGE_PROFILES[level], left=0.0, right=0.0)
+            for g_idx, gender in enumerate(genders):
+                students = float(counts.at[level, ENROLLMENT_GENDERS[gender]]) if level in counts.index else 0.0
+                denominator = rate @ people
+                if denominator > 0:
+                    probabilities[g_idx, :, l_idx] = rate * students / denominator
+        total = probabilities.sum(axis=-1, keepdims=True)
+        probabilities = np.where(total > 1, probabilities / np.maximum(total, 1e-12), probabilities)
+        return cls(probabilities, genders)
+
+    def draw(self, ages: np.ndarray, genders: np.ndarray, rng: np.random.Generator,
+             enrolled_only: bool = False) -> np.ndarray:
+        """School level of every person (None when not enrolled), one batched draw.
+
+        With enrolled_only every person with a positive probability gets a level (e.g. people
+        who just became students), drawn in proportion to the level probabilities at their age.
+        """
+        g_idx = (np.asarray(genders) == self.genders[1]).astype(np.intp)
+        a_idx = np.minimum(np.asarray(ages, dtype=np.intp), self.cumulative.shape[1] - 1)
+        rows = self.cumulative[g_idx, a_idx]
+        u = rng.random(len(a_idx))
+        if enrolled_only:
+            u = u * rows[:, -1]
+        drawn = (u[:, None] >= rows).sum(axis=1)
+        return np.array(LEVELS + [None], dtype=object)[drawn]
+
+    def expected_students(self, population_df: pd.DataFrame) -> pd.Series:
+        """Expected students per level for a population table with `age` and `population` columns."""
+        people = population_df.groupby('age')['population'].sum()
+        ages = np.minimum(people.index.to_numpy(dtype=np.intp), self.probabilities.shape[1] - 1)
+        per_gender = people.to_numpy(dtype=float) / len(self.genders)
+        return pd.Series(np.einsum('gal,a->l', self.probabilities[:, ages], per_gender), index=LEVELS)
+
+
+def load_student_counts(path: Path = ENROLLMENT_PATH) -> pd.DataFrame:
+    """Students per school level (rows) and gender (Karlar/Konur columns); None (with a warning) if unreadable."""
+    try:
+        counts = pd.read_csv(path, sep=';', encoding='utf-8-sig')
+        counts = counts.set_index(counts.columns[0])
+        counts.columns = [column.split()[-1] for column in counts.columns]  # "2022 Karlar" -> "Karlar"
+        return counts
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read enrollment from {path}: {exc}.")
+        return None
+
+
+def load_enrollment(population_df: pd.DataFrame, path: Path = ENROLLMENT_PATH) -> Enrollment:
+    """Enrollment lookup from the student counts; None if they cannot be read."""
+    counts = load_student_counts(path)
+    if counts is None:
+        print("Warning: Only inactive children of compulsory school age become Students.")
+        return None
+    return Enrollment.from_counts(counts, population_df)
@@ -0,0 +1,179 @@
+"""
+Analytic expected tax per (age, gender) cell, without materializing individuals.
+
+Within a cell every income component is an independent draw from a known distribution:
+the official mean times bounded noise ('noise' model) or the fitted inverse-CDF table
+('fitted' model), times the 85+ taper. Each component's distribution is split into
+EXPECTED_TAX_NODES equal-probability slices represented by their conditional means,
+and the tax functions from calculate_taxes.py are evaluated on the tensor product of the
+three components. That gives the expected tax and its per-person variance per cell,
+and the expected revenue (with variance, people being independent) per cell and in total.
+
+Cells are split evenly by gender, as in weighted mode. The noise model's top-0.1% capital
+gains boost (a post-processing step on the realised population) is not part of the
+analytic expectation.
+
+Run as a script to write the `expected_tax_by_cell` table and cross-check against the
+`population` table when one exists. The expectation applies one national útsvar rate and
+no credit transfer between spouses, so the population is taxed the same way for the
+cross-check. Its other_income still includes the rule-based benefits (benefits.py), which
+the analytic model has only through the official mean, so the gaps are sampling error plus
+that difference, not sampling error alone.
+"""
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number
+from income_model import INCOME_COMPONENTS, GENDERS, _norm_ppf, build_income_tables
+from generate_population import INCOME_MODEL, load_generator_params, smooth_income
+from calculate_taxes import (
+    MUNICIPAL_TAX_RATE, POLICY, TAX_COLUMNS, compute_taxes, tax_totals,
+    calculate_income_tax_array, calculate_capital_gains_tax_array, calculate_fixed_fees_array,
+)
+from policy import TaxPolicy, merge
+from population_store import load_population
+
+EXPECTED_TAX_NODES = int(os.getenv("EXPECTED_TAX_NODES", "16"))
+NOISE_GRID = np.linspace(0, 1, 4097)  # probability grid for integrating the clipped-normal noise
+
+
+def slice_means(probs: np.ndarray, quantiles: np.ndarray, k: int) -> np.ndarray:
+    """Conditional means of k equal-probability slices of inverse-CDF rows.
+
+    `quantiles` has shape (..., len(probs)); the result has shape (..., k) and preserves the mean.
+    """
+    steps = np.diff(probs) * (quantiles[..., 1:] + quantiles[..., :-1]) / 2
+    integral = np.concatenate([np.zeros(quantiles.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)], axis=-1)
+    edges = np.linspace(0, 1, k + 1)
+    at_edges = np.stack([np.interp(edges, probs, row) for row in integral.reshape(-1, len(probs))])
+    return (np.diff(at_edges, axis=-1) * k).reshape(quantiles.shape[:-1] + (k,))
+
+
+def noise_nodes(sigma: float, clip: float, k: int) -> np.ndarray:
+    """k equal-probability nodes of clip(N(1, sigma), 1 - clip, 1 + clip)."""
+    noise = np.clip(1 + sigma * _norm_ppf(NOISE_GRID), 1 - clip, 1 + clip)
+    return slice_means(NOISE_GRID, noise[None, :], k)[0]
+
+
+def taper_factor(ages: np.ndarray, params: dict) -> np.ndarray:
+    ages = np.asarray(ages, dtype=float)
+    taper = np.maximum(params['taper_floor'], 1 - (ages - params['taper_start']) * params['taper_slope'])
+    return np.where(ages >= params['taper_start'], taper, 1.0)
+
+
+def cell_table(population_df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (age, gender) cell with its expected head count (the age split evenly)."""
+    cells = pd.DataFrame({
+        'age': np.repeat(population_df['age'].to_numpy(dtype=int), len(GENDERS)),
+        'gender': np.tile(list(GENDERS), len(population_df)),
+        'population': np.repeat(population_df['population'].to_numpy(dtype=float) / len(GENDERS), len(GENDERS)),
+    })
+    return cells[cells['population'] > 0].reset_index(drop=True)
+
+
+def component_nodes(cells: pd.DataFrame, income_df: pd.DataFrame, income_model: str, params: dict, k: int) -> np.ndarray:
+    """Income nodes per cell, shape (cells, components, k), including the taper and the under-13 zeros."""
+    ages = cells['age'].to_numpy()
+    if income_model == 'fitted':
+        tables = build_income_tables(income_df)
+        rows = tables.quantiles[:, [tables.genders.index(g) for g in cells['gender']], np.minimum(ages, tables.max_age)]
+        nodes = slice_means(tables.probs, rows, k).transpose(1, 0, 2)
+    else:
+        means = np.zeros((len(cells), len(INCOME_COMPONENTS)))
+        for gender, gender_is in GENDERS.items():
+            rows = income_df[income_df['gender'] == gender_is].set_index('age')
+            mask = (cells['gender'] == gender).to_numpy()
+            lookup = np.minimum(ages[mask], rows.index.max())
+            means[mask] = rows.reindex(lookup)[list(INCOME_COMPONENTS.values())].fillna(0).to_numpy()
+        young = noise_nodes(params['noise_sigma'], params['noise_clip'], k)
+        old = noise_nodes(params['noise_sigma_old'], params['noise_clip'], k)
+        noise = np.where((ages >= 90)[:, None], old, young)
+        nodes = means[:, :, None] * noise[:, None, :]
+    nodes = nodes * taper_factor(ages, params)[:, None, None]
+    nodes[ages < 13] = 0.0  # No income for people under 13
+    return np.round(nodes)
+
+
+def expected_taxes(population_df: pd.DataFrame, income_df_original: pd.DataFrame, income_model: str = INCOME_MODEL,
+                   params: dict | None = None, k: int = EXPECTED_TAX_NODES,
+                   municipal_tax_rate: float = MUNICIPAL_TAX_RATE) -> pd.DataFrame:
+    """Expected per-person tax, its variance and the expected revenue per (age, gender) cell."""
+    params = load_generator_params() if params is None else params
+    income_df = smooth_income(income_df_original)
+    cells = cell_table(population_df)
+    nodes = component_nodes(cells, income_df, income_model, params, k)
+
+    # Tensor product of the three independent components: (cells, k, k, k), all points equally likely
+    wages, capital_gains, other_income = nodes[:, 0], nodes[:, 1], nodes[:, 2]
+    capital_gains_grid = np.broadcast_to(capital_gains[:, None, :, None], (len(cells), k, k, k)).reshape(len(cells), -1)
+    total_income = (wages[:, :, None, None] + capital_gains[:, None, :, None] + other_income[:, None, None, :]).reshape(len(cells), -1)
+    ages = cells['age'].to_numpy()[:, None]
+
+    taxes = {}
+    taxes['income_tax'], taxes['municipal_tax'] = calculate_income_tax_array(total_income, ages, municipal_tax_rate)
+    taxes['capital_gains_tax'] = calculate_capital_gains_tax_array(capital_gains_grid)
+    taxes['fixed_fees'] = np.broadcast_to(calculate_fixed_fees_array(ages), total_income.shape).astype(float)
+    taxes['total_tax'] = taxes['income_tax'] + taxes['capital_gains_tax'] + taxes['fixed_fees']
+
+    result = cells.copy()
+    for column in TAX_COLUMNS:
+        result[f'expected_{column}'] = taxes[column].mean(axis=1)
+    result['total_tax_variance'] = taxes['total_tax'].var(axis=1)
+    result['expected_revenue'] = result['population'] * result['expected_total_tax']
+    result['revenue_variance'] = result['population'] * result['total_tax_variance']
+    return result
+
+
+def analytic_policy(policy: TaxPolicy = POLICY) -> TaxPolicy:
+    """`policy` as the expectation applies it: without the credit transfer between spouses."""
+    return TaxPolicy(merge(policy.spec, {'income_tax': {'credit_transfer': {'enabled': False}}}))
+
+
+def revenue_totals(expected: pd.DataFrame) -> dict:
+    """Population totals of each expected tax column plus the variance of total revenue."""
+    totals = {col: float(expected[f'expected_{col}'] @ expected['population']) for col in TAX_COLUMNS}
+    totals['revenue_variance'] = float(expected['revenue_variance'].sum())
+    return totals
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = pd.read_sql_query("SELECT * FROM population_distribution", conn)
+    income_df_original = pd.read_sql_query("SELECT * FROM gender_and_age_income_distribution", conn)
+
+    start = time.perf_counter()
+    expected = expected_taxes(population_df, income_df_original)
+    elapsed = time.perf_counter() - start
+    expected.to_sql("expected_tax_by_cell", conn, if_exists="replace", index=False)
+
+    totals = revenue_totals(expected)
+    print(f"Analytic expected taxes ({INCOME_MODEL} incomes, {EXPECTED_TAX_NODES} nodes per component) "
+          f"for {len(expected)} cells in {elapsed:.2f}s:")
+    for column in TAX_COLUMNS:
+        print(f"  {column}: {format_number(totals[column])}")
+    print(f"  Standard deviation of total revenue: {format_number(np.sqrt(totals['revenue_variance']))}")
+
+    # Cross-check against the microsimulated population, if there is one
+    try:
+        generated = load_population(conn)
+    except Exception:
+        generated = None
+    conn.close()
+    if generated is not None and not generated.empty:
+        # Tax the population with the expectation's settings: national útsvar rate, no credit transfer
+        simulated = tax_totals(compute_taxes(generated, MUNICIPAL_TAX_RATE, analytic_policy()))
+        print("Microsimulation (population table, national útsvar rate, no credit transfer) vs analytic:")
+        for column in TAX_COLUMNS:
+            gap = simulated[column] / totals[column] - 1 if totals[column] else 0.0
+            print(f"  {column}: {format_number(simulated[column])} ({gap:+.2%})")
+        if 'benefits' in generated.columns:
+            print("  The population's other income includes rule-based benefits, which the analytic model "
+                  "has only through the official mean; the gaps include that difference as well as sampling error.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,57 @@
 import os
+import json
+from functools import partial
+from pathlib import Path
 import pandas as pd
 import sqlite3
 import numpy as np
-import random
-from helpers import get_db_path, format_number
-
-# Connect to the SQLite database
-conn = sqlite3.connect(get_db_path())
-
-# Fetch population distribution data
-population_query = "SELECT * FROM population_distribution"
-population_df = pd.read_sql_query(population_query, conn)
-
-# Fetch income by gender and age data (keep original for diagnostics)
-income_query = "SELECT * FROM gender_and_age_income_distribution"
-income_df_original = pd.read_sql_query(income_query, conn)
-income_df = income_df_original.copy()
-
-# Rename columns from Icelandic to English for consistency
-income_df.rename(columns={'Aldur': 'age', 'Kyn': 'gender'}, inplace=True)
-# Smooth income curves a bit to reduce noise at higher ages
-numeric_cols = ['Heildartekjur', 'Atvinnutekjur', 'Fjármagnstekjur', 'Aðrar_tekjur']
-income_df = income_df.sort_values(['gender', 'age'])
-for gender in income_df['gender'].unique():
-    mask = income_df['gender'] == gender
-    income_df.loc[mask, numeric_cols] = (
-        income_df.loc[mask, numeric_cols]
-        .rolling(window=5, center=True, min_periods=1)
-        .mean()
-    )
-
-# Fetch employment data
-employment_query = "SELECT * FROM employment_data"
-employment_df = pd.read_sql_query(employment_query, conn)
-
-# Close the connection
-conn.close()
+from helpers import get_db_path, format_number, store_population_hash, weighted_group_means
+from occupations import load_occupation_sampler
+from income_model import INCOME_COMPONENTS, build_income_tables, save_income_tables
+from postprocessing import boost_top_capital_gains
+from benefits import apply_benefits
+from households import form_households
+from municipalities import assign_municipalities, load_municipalities
+from property_tax import allocate_dwellings, load_property_table
+from enrollment import load_enrollment
+
+# 'fitted' draws from lognormal/Pareto inverse-CDF tables; 'noise' is the original mean x bounded noise
+INCOME_MODEL = os.getenv("INCOME_MODEL", "fitted")
+SEED = os.getenv("SEED")
+# 'exact' emits one row per person; 'weighted' emits RECORDS_PER_CELL representative rows per age/gender cell
+POPULATION_MODE = os.getenv("POPULATION_MODE", "exact")
+RECORDS_PER_CELL = int(os.getenv("RECORDS_PER_CELL", "50"))
+
+GENDERS = ['Male', 'Female']
+COMPULSORY_SCHOOL_END = 16  # without enrollment data, inactive people below this age are Students
+DISABILITY_MIN_AGE = 18     # the disability scheme in benefits.py starts at 18
+
+# Shape parameters of the generator. tune_generator.py searches these and saves the best set as
+# config/generator_params_v<N>.json; the highest version found is loaded over the defaults.
+DEFAULT_PARAMS = {
+    'noise_sigma': 0.08,           # sd of the multiplicative income noise ('noise' model)
+    'noise_sigma_old': 0.03,       # ... at age 90 and above, anchoring closely to the official means
+    'noise_clip': 0.15,            # noise is clipped to 1 +/- noise_clip
+    'taper_start': 85,             # incomes taper gently from this age
+    'taper_slope': 0.001,          # taper per year after taper_start
+    'taper_floor': 0.98,           # taper never goes below this factor
+    'retirement_start': 59,        # retirement probability is (age - retirement_start) / retirement_span
+    'retirement_span': 8,
+    'income_factor_scale': 100000,  # employment probability scales with min(total_income / scale, 1)
+    'unemployment_rate': 0.035,    # unemployed share of the labour force (employed + unemployed)
+}
+PARAMS_DIR = Path("config")
+GENERATOR_PARAMS_PATH = os.getenv("GENERATOR_PARAMS")
+
+# Post-processing steps per income model, each called as step(population_df, rng).
+# The bounded-noise model has no upper tail, so a capital gains boost is patched in for the
+# top 0.1%; the fitted model already draws capital gains from a Pareto tail. Both then split
+# other_income into income-tested benefits and private income (benefits.py) and form households.
+POST_PROCESSING = {
+    'noise': [partial(boost_top_capital_gains, top_share=0.001, min_age=65, full_age=90), apply_benefits,
+              form_households],
+    'fitted': [apply_benefits, form_households],
+}
 
 # Gender translation map
 gender_translation = {
@@ -43,171 +59,252 @@ gender_translation = {
     'Female': 'Konur'
 }
 
-# Occupation distribution with summed categories
-mapped_occupation_distribution = {
-    'Karlar': {
-        'Managers': 17600,
-        'Professionals': 19800,
-        'Technicians': 17200,
-        'OfficeStaff': 2800,
-        'ServiceCare': 20000,
-        'IndustrialWorkers': 29400,  # Combined value
-        'Laborers': 12300  # Combined value
-    },
-    'Konur': {
-        'Managers': 10100,
-        'Professionals': 31900,
-        'Technicians': 17300,
-        'OfficeStaff': 6400,
-        'ServiceCare': 25300,
-        'IndustrialWorkers': 2700,  # Combined value
-        'Laborers': 6300  # Combined value
+
+def latest_params_path(directory: Path = PARAMS_DIR) -> Path | None:
+    """Highest-versioned config/generator_params_v<N>.json, if any."""
+    versions = []
+    for path in directory.glob("generator_params_v*.json"):
+        suffix = path.stem.rsplit("_v", 1)[-1]
+        if suffix.isdigit():
+            versions.append((int(suffix), path))
+    return max(versions)[1] if versions else None
+
+
+def load_generator_params(path: str | Path | None = GENERATOR_PARAMS_PATH) -> dict:
+    """DEFAULT_PARAMS overlaid with a saved parameter set (GENERATOR_PARAMS or the latest version)."""
+    params = dict(DEFAULT_PARAMS)
+    path = Path(path) if path else latest_params_path()
+    if path is None:
+        return params
+    try:
+        saved = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        print(f"Warning: Could not read generator parameters from {path}: {exc}. Using defaults.")
+        return params
+    params.update({k: v for k, v in saved.get('params', saved).items() if k in DEFAULT_PARAMS})
+    return params
+
+
+def load_inputs(conn) -> dict:
+    """Read the silver tables the generator needs and precompute lookup structures."""
+    # Fetch population distribution data
+    population_df = pd.read_sql_query("SELECT * FROM population_distribution", conn)
+
+    # Fetch income by gender and age data (keep original for diagnostics)
+    income_df_original = pd.read_sql_query("SELECT * FROM gender_and_age_income_distribution", conn)
+    income_df = smooth_income(income_df_original)
+
+    # Fetch employment data and turn the employed counts into rates per age/gender cell
+    employment_df = employment_rates(pd.read_sql_query("SELECT * FROM employment_data", conn), population_df)
+
+    return {
+        'population_df': population_df,
+        'income_df_original': income_df_original,
+        'income_df': income_df,
+        'employment_df': employment_df,
+        # Precompute P(occupation | wage bin, gender) from the occupation income table
+        'occupation_sampler': load_occupation_sampler(conn),
+        # Fit inverse-CDF tables per (component, gender, age) to the smoothed official means
+        'income_tables': build_income_tables(income_df),
+        # Residents per municipality for assigning municipalities (None if unavailable)
+        'municipalities': load_municipalities(conn),
+        # Property tax rates, bases and dwellings per municipality (None if unavailable)
+        'properties': load_property_table(conn),
+        # Enrollment probabilities per school level, age and gender (None if unavailable)
+        'enrollment': load_enrollment(population_df),
     }
-}
 
-# Normalize the occupation weights to probabilities
-def normalize_weights(distribution):
-    total = sum(distribution.values())
-    return {occupation: count / total for occupation, count in distribution.items()}
 
-occupation_probs = {
-    'Karlar': normalize_weights(mapped_occupation_distribution['Karlar']),
-    'Konur': normalize_weights(mapped_occupation_distribution['Konur'])
-}
+def smooth_income(income_df_original: pd.DataFrame) -> pd.DataFrame:
+    # Rename columns from Icelandic to English for consistency
+    income_df = income_df_original.rename(columns={'Aldur': 'age', 'Kyn': 'gender'})
+    # Smooth income curves a bit to reduce noise at higher ages
+    numeric_cols = ['Heildartekjur', 'Atvinnutekjur', 'Fjármagnstekjur', 'Aðrar_tekjur']
+    income_df = income_df.sort_values(['gender', 'age'])
+    for gender in income_df['gender'].unique():
+        mask = income_df['gender'] == gender
+        income_df.loc[mask, numeric_cols] = (
+            income_df.loc[mask, numeric_cols]
+            .rolling(window=5, center=True, min_periods=1)
+            .mean()
+        )
+    return income_df
 
-def assign_income(age, gender):
-    if age < 13:
-        return 0, 0, 0, 0  # No income for people under 13
-    
+
+def official_means(income_df, age, gender):
+    """Return the smoothed official (wages, capital gains, other income) means for a cell."""
     gender_icelandic = gender_translation[gender]
-    
-    try:
-        # Lookup for the specific age and gender
-        income_row = income_df[(income_df['age'] == age) & (income_df['gender'] == gender_icelandic)]
-        if income_row.empty:
-            raise ValueError(f"No income data found for Age: {age}, Gender: {gender_icelandic}")
-    except KeyError as e:
-        raise KeyError(f"Key error when accessing DataFrame: {str(e)}. Available columns: {income_df.columns.tolist()}")
+    rows = income_df[income_df['gender'] == gender_icelandic]
+    # Ages above the table (the 85+ plateau is flat) use the oldest published age
+    income_row = rows[rows['age'] == min(age, rows['age'].max())]
+    if income_row.empty:
+        raise ValueError(f"No income data found for Age: {age}, Gender: {gender_icelandic}")
+    return tuple(income_row[col].values[0] for col in INCOME_COMPONENTS.values())
 
-    # Generate wages, capital gains, and other income with capped noise to reduce spikes
-    noise = lambda s=0.08: np.clip(np.random.normal(1, s), 0.85, 1.15)
 
-    if age >= 90:
-        # At very high ages, anchor closely to official means to avoid tail collapse
-        wages = round(income_row['Atvinnutekjur'].values[0] * noise(0.03))
-        capital_gains = round(income_row['Fjármagnstekjur'].values[0] * noise(0.03))
-        other_income = round(income_row['Aðrar_tekjur'].values[0] * noise(0.03))
+def assign_income(age, gender, n, inputs, rng, income_model=INCOME_MODEL, stratified=False, params=DEFAULT_PARAMS):
+    """Draw (wages, capital_gains, other_income) arrays for n people in one age/gender cell."""
+    if age < 13:
+        zeros = np.zeros(n)
+        return zeros, zeros.copy(), zeros.copy()  # No income for people under 13
+
+    if income_model == 'fitted':
+        tables = inputs['income_tables']
+        wages, capital_gains, other_income = (
+            tables.sample(component, gender, age, n, rng, stratified) for component in INCOME_COMPONENTS
+        )
     else:
-        wages = round(income_row['Atvinnutekjur'].values[0] * noise())
-        capital_gains = round(income_row['Fjármagnstekjur'].values[0] * noise())
-        other_income = round(income_row['Aðrar_tekjur'].values[0] * noise())
-
-    # Gentle taper after 85 to avoid sharp drops; floor at 98% to stay near official plateau
-    taper = 1.0
-    if age >= 85:
-        taper = max(0.98, 1 - (age - 85) * 0.001)
-    wages = round(wages * taper)
-    capital_gains = round(capital_gains * taper)
-    other_income = round(other_income * taper)
-
-    total_income = wages + capital_gains + other_income
-    return wages, capital_gains, other_income, round(total_income)
-
-def assign_status(age, total_income, gender):
+        # Generate wages, capital gains, and other income with capped noise to reduce spikes
+        # At very high ages, anchor closely to official means to avoid tail collapse
+        sigma = params['noise_sigma_old'] if age >= 90 else params['noise_sigma']
+        clip = params['noise_clip']
+        noise = lambda: np.clip(rng.normal(1, sigma, n), 1 - clip, 1 + clip)
+        wage_mean, cg_mean, other_mean = official_means(inputs['income_df'], age, gender)
+        wages = wage_mean * noise()
+        capital_gains = cg_mean * noise()
+        other_income = other_mean * noise()
+
+    taper = income_taper(age, params)
+    return np.round(wages * taper), np.round(capital_gains * taper), np.round(other_income * taper)
+
+
+def income_taper(age, params=DEFAULT_PARAMS):
+    """Income factor by age (scalar or array): a gentle taper after taper_start, floored near the official plateau."""
+    age = np.asarray(age, dtype=float)
+    taper = np.maximum(params['taper_floor'], 1 - (age - params['taper_start']) * params['taper_slope'])
+    return np.where(age >= params['taper_start'], taper, 1.0)
+
+
+def employment_rates(employment_df: pd.DataFrame, population_df: pd.DataFrame) -> pd.DataFrame:
+    """Add `rate` to employment_data: employed people over the age's population per gender (at most 1)."""
+    people = population_df.groupby('age')['population'].sum() / len(GENDERS)
+    cell_population = employment_df['age'].map(people).to_numpy(dtype=float)
+    rates = np.divide(employment_df['employed'].to_numpy(dtype=float), cell_population,
+                      out=np.zeros(len(employment_df)), where=cell_population > 0)
+    return employment_df.assign(rate=np.clip(rates, 0, 1))
+
+
+def employment_rate(employment_df, age, gender):
+    # Employment data provides a probability of being employed by age and gender (male/female in the table)
+    rows = employment_df[employment_df['gender'].str.lower() == gender.lower()]
+    # Ages above the table use the oldest published age
+    employment_row = rows[rows['age'] == min(age, rows['age'].max())]
+    if employment_row.empty:
+        return 0.5  # Default to 50% if no data is found
+    return employment_row['rate'].values[0]
+
+
+def assign_status(age, total_income, gender, employment_df, rng, params=DEFAULT_PARAMS, enrolled=None):
+    """Vectorized status draw for one age/gender cell given each person's total income.
+
+    Employment is drawn first from the official rate, and retirement among the rest. Of the
+    people left, the enrolled (`enrolled`, drawn by enrollment.py; without it everyone below
+    COMPULSORY_SCHOOL_END) are Students. The others are Unemployed, in number
+    unemployment_rate / (1 - unemployment_rate) times the cell's employed, or Disabled;
+    nobody below DISABILITY_MIN_AGE is Disabled.
+    """
+    n = len(total_income)
     if age < 13:
-        return 'Student'
-    
+        return np.full(n, 'Student', dtype=object)
+
+    status = np.full(n, 'Disabled', dtype=object)
+
+    # Adjust employment probability based on income; the register counts working pensioners as employed
+    income_factor = np.minimum(total_income / params['income_factor_scale'], 1)  # Normalize and cap the income factor
+    employment_probability = employment_rate(employment_df, age, gender) * income_factor
+    employed = rng.random(n) < employment_probability
+
     # Retired status starts low at age 60 and increases significantly at 65, most people retire by 67
-    if age >= 60:
-        retirement_probability = min((age - 59) / 8, 1)  # Probability increases with age
-        if random.random() < retirement_probability:
-            return 'Retired'
-    
-    # Employment data provides a probability of being employed by age and gender
-    employment_row = employment_df[(employment_df['age'] == age) & (employment_df['gender'] == gender)]
-    if employment_row.empty:
-        employment_probability = 0.5  # Default to 50% if no data is found
-    else:
-        employment_probability = employment_row['employed'].values[0] / 100
-
-    # Adjust employment probability based on income
-    income_factor = min(total_income / 100000, 1)  # Normalize and cap the income factor
-    employment_probability *= income_factor
-
-    if random.random() < employment_probability:
-        return 'Employed'
-    
-    # If not employed, decide between student and disabled based on age
-    student_probability = max(0.05, 1 - (age - 13) / (60 - 13))  # Gradually decrease student probability with age
-    if random.random() < student_probability:
-        return 'Student'
-    
-    return 'Disabled'
-
-def assign_occupation(gender):
-    # Select occupation based on gender and weighted probabilities
-    gender_icelandic = gender_translation[gender]
-    occupations = list(occupation_probs[gender_icelandic].keys())
-    probabilities = list(occupation_probs[gender_icelandic].values())
-    
-    selected_occupation = random.choices(occupations, probabilities)[0]
-    
-    return selected_occupation  # Return the selected occupation directly
-
-
-def adjust_income_for_status(wages, capital_gains, other_income, status, age):
-    """Return incomes unchanged; official averages already include non-employment."""
-    return wages, capital_gains, other_income
-
-# Populate the database with individuals
-population = []
-
-for _, row in population_df.iterrows():
-    age, count = int(row['age']), int(row['population'])  # Ensure age is int
-    for _ in range(count):
-        gender = random.choice(['Male', 'Female'])
-        wages, capital_gains, other_income, total_income = assign_income(age, gender)
-        status = assign_status(age, total_income, gender)
-        wages, capital_gains, other_income = adjust_income_for_status(
-            wages, capital_gains, other_income, status, age
-        )
-        total_income = round(wages + capital_gains + other_income)
-        occupation = assign_occupation(gender) if status == 'Employed' else status
-        population.append({
-            'age': age,
-            'gender': gender,
-            'occupation': occupation,
-            'wages': wages,
-            'capital_gains': capital_gains,
-            'other_income': other_income,
-            'total_income': total_income,
-            'status': status
-        })
-
-# Identify the top 0.1% of the population based on total income
-population_df = pd.DataFrame(population)
-top_01_percent_threshold = population_df['total_income'].quantile(0.999)
-top_01_percent = population_df[population_df['total_income'] >= top_01_percent_threshold]
-
-def increase_capital_gains_exponentially(row):
-    # Dampened capital gains boost; apply to older high-income only
-    if row['age'] < 65:
-        return row
-    base_factor = 3
-    age_scale = min((row['age'] - 65) / 25, 1)  # ramp from 65 to 90
-    row['capital_gains'] *= np.exp(min(row['capital_gains'], 2_000_000) / 1e6) * base_factor * age_scale
-    row['capital_gains'] = round(row['capital_gains'])
-    row['total_income'] = round(row['wages'] + row['capital_gains'] + row['other_income'])
-    return row
-
-top_01_percent = top_01_percent.apply(increase_capital_gains_exponentially, axis=1)
-
-# Update the population list with the adjusted top 0.1%
-population_df.update(top_01_percent)
-population = population_df.to_dict(orient='records')
+    retired = np.zeros(n, dtype=bool)
+    if age > params['retirement_start']:
+        # Probability increases with age
+        retirement_probability = min((age - params['retirement_start']) / params['retirement_span'], 1)
+        retired = ~employed & (rng.random(n) < retirement_probability)
+
+    # Students are decided before anyone else who does not work
+    enrolled = np.full(n, age < COMPULSORY_SCHOOL_END) if enrolled is None else np.asarray(enrolled, dtype=bool)
+    student = ~employed & ~retired & enrolled
+    inactive = ~employed & ~retired & ~student
+    # The unemployed are part of the labour force, so they scale with the employed in the cell
+    rate = params['unemployment_rate']
+    unemployed_probability = rate / (1 - rate) * employed.sum() / max(inactive.sum(), 1)
+    unemployed = inactive & ((age < DISABILITY_MIN_AGE) | (rng.random(n) < unemployed_probability))
+
+    status[retired] = 'Retired'
+    status[employed] = 'Employed'
+    status[student] = 'Student'
+    status[unemployed] = 'Unemployed'
+    return status
+
+
+def cell_sizes(count, rng, mode, records_per_cell):
+    """Yield (gender, records, weight) for one age: people drawn one by one, or a weighted sample."""
+    if mode == 'weighted':
+        # Split the age evenly by gender and represent each half with a fixed number of records
+        for gender in GENDERS:
+            expected = count / 2
+            records = min(records_per_cell, int(np.ceil(expected)))
+            if records > 0:
+                yield gender, records, expected / records
+        return
+    n_male = rng.binomial(count, 0.5)
+    for gender, n in zip(GENDERS, (n_male, count - n_male)):
+        if n > 0:
+            yield gender, n, 1.0
+
+
+def generate(inputs, rng, income_model=INCOME_MODEL, mode=POPULATION_MODE, records_per_cell=RECORDS_PER_CELL,
+             params=None) -> pd.DataFrame:
+    """Generate the population one age/gender cell at a time."""
+    params = DEFAULT_PARAMS if params is None else params
+    enrollment = inputs.get('enrollment')
+    cells = []
+    for _, row in inputs['population_df'].iterrows():
+        age, count = int(row['age']), int(row['population'])  # Ensure age is int
+        for gender, n, weight in cell_sizes(count, rng, mode, records_per_cell):
+            wages, capital_gains, other_income = assign_income(
+                age, gender, n, inputs, rng, income_model, stratified=(mode == 'weighted'), params=params
+            )
+            total_income = wages + capital_gains + other_income
+            # Enroll the cell by school level first; enrolled people who do not work become Students
+            school_level = None if enrollment is None else enrollment.draw(np.full(n, age), np.full(n, gender), rng)
+            status = assign_status(age, total_income, gender, inputs['employment_df'], rng, params,
+                                   enrolled=None if school_level is None else pd.notna(school_level))
+            cells.append(pd.DataFrame({
+                'age': age,
+                'gender': gender,
+                'occupation': status,  # employed people get a wage-conditioned occupation below
+                'wages': wages,
+                'capital_gains': capital_gains,
+                'other_income': other_income,
+                'total_income': total_income,
+                'status': status,
+                'weight': weight,
+                **({} if school_level is None else {'school_level': school_level}),
+            }))
+    population_df = pd.concat(cells, ignore_index=True)
+
+    # Assign occupations to all employed people at once, conditioned on their wage bin
+    employed = (population_df['status'] == 'Employed').to_numpy()
+    population_df.loc[employed, 'occupation'] = inputs['occupation_sampler'].sample(
+        population_df.loc[employed, 'wages'].to_numpy(),
+        population_df.loc[employed, 'gender'].to_numpy(),
+        rng,
+    )
+
+    for step in POST_PROCESSING[income_model]:
+        step(population_df, rng)
+    if inputs.get('municipalities') is not None:
+        # After form_households, so that households move together
+        assign_municipalities(population_df, rng, inputs['municipalities'])
+        if inputs.get('properties') is not None:
+            allocate_dwellings(population_df, rng, inputs['properties'])
+    return population_df
+
 
 # --- Fit diagnostics: compare generated vs official by age/gender ---
-def evaluate_fit(pop_df, ref_df):
+def fit_errors(pop_df, ref_df):
+    """Merge generated and official means by age/gender; returns (merged frame, MAE per component)."""
     ref = ref_df.copy()
     ref = ref.rename(columns={'Aldur': 'age', 'Kyn': 'gender'})
     ref['gender'] = ref['gender'].replace({'Karlar': 'Male', 'Konur': 'Female'})
@@ -219,13 +316,18 @@ def evaluate_fit(pop_df, ref_df):
     })
     ref_means = ref.groupby(['gender', 'age'])[['ref_total', 'ref_wages', 'ref_cg', 'ref_other']].mean().reset_index()
 
-    gen_means = pop_df.groupby(['gender', 'age'])[['total_income', 'wages', 'capital_gains', 'other_income']].mean().reset_index()
+    gen_means = weighted_group_means(pop_df, ['gender', 'age'], ['total_income', 'wages', 'capital_gains', 'other_income'])
     merged = ref_means.merge(gen_means, on=['gender', 'age'], how='outer').fillna(0)
     merged['err_total'] = merged['total_income'] - merged['ref_total']
     merged['err_wages'] = merged['wages'] - merged['ref_wages']
     merged['err_cg'] = merged['capital_gains'] - merged['ref_cg']
     merged['err_other'] = merged['other_income'] - merged['ref_other']
     mae = {k: merged[k].abs().mean() for k in ['err_total', 'err_wages', 'err_cg', 'err_other']}
+    return merged, mae
+
+
+def evaluate_fit(pop_df, ref_df):
+    merged, mae = fit_errors(pop_df, ref_df)
     print("Fit check (gen - official means by age/gender):")
     print("  MAE total:", format_number(mae['err_total']), "wages:", format_number(mae['err_wages']),
           "cap gains:", format_number(mae['err_cg']), "other:", format_number(mae['err_other']))
@@ -236,52 +338,79 @@ def evaluate_fit(pop_df, ref_df):
         print(f"  Worst total-income ages ({gender}):",
               [(int(r.age), int(r.err_total)) for _, r in worst.iterrows()])
 
-# After generating, run a fit check
-evaluate_fit(population_df, income_df_original)
-
-# Create SQLite database and table for population
-conn = sqlite3.connect(get_db_path())
-c = conn.cursor()
-
-# Drop the table if it exists
-c.execute('DROP TABLE IF EXISTS population')
-
-# Create the population table
-create_population_table_query = '''
-    CREATE TABLE population (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        age INTEGER,
-        gender TEXT,
-        occupation TEXT,
-        wages REAL,
-        capital_gains REAL,
-        other_income REAL,
-        total_income REAL,
-        status TEXT
-    )
-'''
 
-c.execute(create_population_table_query)
+# Stored columns of the population table, in table order (after the `id` key)
+POPULATION_COLUMNS = ['age', 'gender', 'occupation', 'wages', 'capital_gains', 'other_income', 'total_income', 'status',
+                      'weight', 'benefits', 'private_other_income', 'benefit_take_up', 'household_id', 'household_role',
+                      'municipality', 'property_value', 'school_level']
+
+
+def write_population(conn, population_df):
+    c = conn.cursor()
+
+    # Drop the table if it exists
+    c.execute('DROP TABLE IF EXISTS population')
+
+    # Create the population table
+    create_population_table_query = '''
+        CREATE TABLE population (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            age INTEGER,
+            gender TEXT,
+            occupation TEXT,
+            wages REAL,
+            capital_gains REAL,
+            other_income REAL,
+            total_income REAL,
+            status TEXT,
+            weight REAL,
+            benefits REAL,
+            private_other_income REAL,
+            benefit_take_up REAL,
+            household_id INTEGER,
+            household_role TEXT,
+            municipality INTEGER,
+            property_value REAL,
+            school_level TEXT
+        )
+    '''
+    c.execute(create_population_table_query)
 
-# Insert the population data into the table using parameterized queries
-for person in population:
-    insert_population_query = '''
-        INSERT INTO population (age, gender, occupation, wages, capital_gains, other_income, total_income, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    # Insert the population data into the table using parameterized queries
+    present = [col for col in POPULATION_COLUMNS if col in population_df.columns]
+    insert_population_query = f'''
+        INSERT INTO population ({', '.join(present)})
+        VALUES ({', '.join('?' * len(present))})
     '''
-    c.execute(insert_population_query, (
-        person['age'],
-        person['gender'],
-        person['occupation'],
-        person['wages'],
-        person['capital_gains'],
-        person['other_income'],
-        person['total_income'],
-        person['status']
-    ))
-
-# Commit and close connection
-conn.commit()
-conn.close()
-
-print("Generated population data with adjusted capital gains for the top 0.1% has been inserted into the database.")
+    c.executemany(insert_population_query, population_df[present].itertuples(index=False, name=None))
+    conn.commit()
+    store_population_hash(conn, population_df[present])
+
+
+def generate_and_write(conn) -> pd.DataFrame:
+    """Generate the population from the silver tables in `conn`, check the fit and write it; returns it."""
+    inputs = load_inputs(conn)
+    # Keep the fitted lookup tables next to the population for downstream consumers
+    save_income_tables(inputs['income_tables'], conn)
+
+    rng = np.random.default_rng(int(SEED) if SEED else None)
+    population_df = generate(inputs, rng, params=load_generator_params())
+
+    # After generating, run a fit check
+    evaluate_fit(population_df, inputs['income_df_original'])
+
+    write_population(conn, population_df)
+    return population_df
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = generate_and_write(conn)
+    conn.close()
+
+    print(f"Generated {len(population_df)} population records ({POPULATION_MODE} mode, "
+          f"{format_number(population_df['weight'].sum())} people) and inserted them into the database.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import hashlib
 import os
 import sqlite3
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 
 def get_db_path(default: str = "income_data.db") -> str:
     """Return the database path, honoring DB_PATH env if set."""
@@ -24,3 +28,74 @@ def format_number(number) -> str:
 def ensure_dir(path: Path) -> None:
     """Create a directory if it does not exist."""
     path.mkdir(parents=True, exist_ok=True)
+
+
+def population_weights(df: pd.DataFrame) -> np.ndarray:
+    """Return person weights, treating a missing `weight` column as one row per person."""
+    if "weight" in df.columns:
+        return df["weight"].to_numpy(dtype=float)
+    return np.ones(len(df))
+
+
+def weighted_group_means(df: pd.DataFrame, keys: list, columns: list) -> pd.DataFrame:
+    """Weighted means of `columns` per group of `keys`, honoring the `weight` column."""
+    w = population_weights(df)
+    weighted = df[columns].mul(w, axis=0)
+    weighted[keys] = df[keys]
+    sums = weighted.groupby(keys)[columns].sum()
+    totals = pd.Series(w, index=df.index).groupby([df[k] for k in keys]).sum()
+    return sums.div(totals, axis=0).reset_index()
+
+
+def weighted_quantile(values, weights, quantiles) -> np.ndarray:
+    """Quantiles of `values` where each value counts `weights` times (inverse of weighted ECDF)."""
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    cum = np.cumsum(weights)
+    if len(cum) == 0 or cum[-1] <= 0:
+        return np.full(len(np.atleast_1d(quantiles)), np.nan)
+    idx = np.searchsorted(cum, np.asarray(quantiles, dtype=float) * cum[-1], side="left")
+    return values[np.clip(idx, 0, len(values) - 1)]
+
+
+def weighted_deciles(values, weights) -> np.ndarray:
+    """Decile (0-9) of each value, with deciles holding equal total weight."""
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    order = np.argsort(values, kind="stable")
+    position = (np.cumsum(weights[order]) - weights[order] / 2) / weights.sum()
+    deciles = np.zeros(len(values), dtype=np.intp)
+    deciles[order] = np.minimum((position * 10).astype(np.intp), 9)
+    return deciles
+
+
+POPULATION_META_TABLE = "population_meta"
+
+
+def population_hash(df: pd.DataFrame) -> str:
+    """Content hash of a population frame (column names, order and values)."""
+    digest = hashlib.sha256(",".join(df.columns).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def store_population_hash(conn: sqlite3.Connection, df: pd.DataFrame) -> str:
+    """Record the content hash and record count of the population just written; returns the hash."""
+    digest = population_hash(df)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {POPULATION_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(f"INSERT OR REPLACE INTO {POPULATION_META_TABLE} VALUES (?, ?)",
+                     [("content_hash", digest), ("records", str(len(df)))])
+    conn.commit()
+    return digest
+
+
+def load_population_hash(conn: sqlite3.Connection) -> str | None:
+    """The recorded population hash, or None if there is none or the record count no longer matches."""
+    try:
+        meta = dict(conn.execute(f"SELECT key, value FROM {POPULATION_META_TABLE}").fetchall())
+        records = conn.execute("SELECT COUNT(*) FROM population").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    return meta.get("content_hash") if meta.get("records") == str(records) else None
@@ -0,0 +1,130 @@
+"""
+Household formation: couples by sort-based age matching, children attached to mothers.
+
+- Adults (18+) enter a couple with probability PARTNERED_SHARE(age). Partnered men and women
+  are brought to the same count, sorted on age plus a little noise and paired rank by rank,
+  so matching is O(n log n) and assortative by age. Men partner at the rates of women
+  PARTNER_AGE_GAP years younger, which makes them older on average.
+- Children (under 18) draw a mother's age (MOTHER_AGE_GAP +/- MOTHER_AGE_SD years older) and
+  np.searchsorted over the women sorted by age gives the block of women of that age, from
+  which one is picked at random, so children spread evenly over mothers of similar age.
+
+Every person gets a `household_id` and a `household_role` ('adult' or 'child'); a household
+has one or two adults. calculate_taxes.compute_taxes uses the adults of each household to
+transfer unused personal tax credit between spouses.
+
+Households are formed only when every record carries the same weight (exact mode). A
+weighted record stands for `weight` people, and records of different ages have different
+weights. Pairing them would make one spouse stand for more people than the other, so
+weighted totals would no longer match the exact population they represent. In weighted
+mode every record is therefore its own household, and there is no credit transfer.
+"""
+import numpy as np
+import pandas as pd
+
+from helpers import population_weights
+
+ADULT_AGE = 18
+PARTNER_AGE_GAP = 2  # men are on average this much older than their partners
+MATCH_NOISE = 3.0  # sd (years) of the noise added to ages before sorting
+MOTHER_AGE_GAP = 31
+MOTHER_AGES = (18, 60)
+MOTHER_AGE_SD = 5.0
+# OECD-modified equivalence scale
+EQUIVALENCE_ADULT = 0.5  # each adult after the first
+EQUIVALENCE_CHILD = 0.3
+
+# Share of people living with a partner, by age (linear in between)
+PARTNERED_AGES = [18, 25, 35, 65, 80, 95]
+PARTNERED_SHARE = [0.0, 0.35, 0.7, 0.72, 0.55, 0.2]
+
+
+def records_can_pair(population_df: pd.DataFrame) -> bool:
+    """Whether records may share a household: only if all of them carry the same weight."""
+    weights = population_weights(population_df)
+    return len(weights) == 0 or bool(np.all(weights == weights[0]))
+
+
+def form_households(population_df: pd.DataFrame, rng: np.random.Generator) -> None:
+    """Post-processing step: add `household_id` and `household_role` columns (in place)."""
+    n = len(population_df)
+    age = population_df['age'].to_numpy()
+    female = population_df['gender'].to_numpy() == 'Female'
+    adult = age >= ADULT_AGE
+
+    # Everyone starts as their own household
+    household = np.arange(n)
+    if not records_can_pair(population_df):
+        population_df['household_id'] = household
+        population_df['household_role'] = np.where(adult, 'adult', 'child')
+        return
+
+    # Couples: partnered men and women, trimmed to the same count, paired by sorted age.
+    # Men partner at the rates of women PARTNER_AGE_GAP years younger, which sets the age gap.
+    partner_age = np.where(female, age, age - PARTNER_AGE_GAP)
+    partnered = adult & (rng.random(n) < np.interp(partner_age, PARTNERED_AGES, PARTNERED_SHARE))
+    men = np.flatnonzero(partnered & ~female)
+    women = np.flatnonzero(partnered & female)
+    pairs = min(len(men), len(women))
+    men = rng.choice(men, pairs, replace=False)
+    women = rng.choice(women, pairs, replace=False)
+    men = men[np.argsort(age[men] + rng.normal(0, MATCH_NOISE, pairs), kind='stable')]
+    women = women[np.argsort(age[women] + rng.normal(0, MATCH_NOISE, pairs), kind='stable')]
+    household[men] = household[women]
+
+    # Children: draw a mother's age, then a random woman of that age among the sorted candidates
+    mothers = np.flatnonzero(female & (age >= MOTHER_AGES[0]) & (age <= MOTHER_AGES[1]))
+    children = np.flatnonzero(~adult)
+    if len(mothers) and len(children):
+        mothers = mothers[np.argsort(age[mothers], kind='stable')]
+        sorted_ages = age[mothers]
+        target = np.round(age[children] + rng.normal(MOTHER_AGE_GAP, MOTHER_AGE_SD, len(children)))
+        target = np.clip(np.maximum(target, age[children] + MOTHER_AGES[0]), MOTHER_AGES[0], MOTHER_AGES[1])
+        first = np.searchsorted(sorted_ages, target, side='left')
+        last = np.searchsorted(sorted_ages, target, side='right')
+        # An age without candidates falls back to the nearest woman
+        position = first + np.floor(rng.random(len(children)) * np.maximum(last - first, 1)).astype(np.intp)
+        household[children] = household[mothers[np.clip(position, 0, len(mothers) - 1)]]
+
+    population_df['household_id'] = household
+    population_df['household_role'] = np.where(adult, 'adult', 'child')
+
+
+def household_sizes(population_df: pd.DataFrame) -> pd.Series:
+    """Number of records per household (adults and children)."""
+    return population_df.groupby('household_id').size()
+
+
+def household_index(population_df: pd.DataFrame) -> np.ndarray:
+    """Household of every record; each record is its own household without `household_id`."""
+    if 'household_id' in population_df.columns and population_df['household_id'].notna().all():
+        return population_df['household_id'].to_numpy(dtype=np.intp)
+    return np.arange(len(population_df))
+
+
+def household_heads(population_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Row of every household's head (oldest adult, else oldest member) and each household's total income."""
+    household = household_index(population_df)
+    age = population_df['age'].to_numpy()
+    adult = age >= ADULT_AGE
+    order = np.lexsort((-age, ~adult, household))
+    first = np.flatnonzero(np.r_[True, np.diff(household[order]) != 0])
+    heads = order[first]
+    income = np.bincount(household, weights=population_df['total_income'].to_numpy(dtype=float))
+    return heads, income[household[heads]]
+
+
+def equivalence_scales(population_df: pd.DataFrame) -> np.ndarray:
+    """OECD-modified equivalence scale of every household, indexed by household id."""
+    household = household_index(population_df)
+    adult = population_df['age'].to_numpy() >= ADULT_AGE
+    adults = np.bincount(household, weights=adult)
+    children = np.bincount(household, weights=~adult)
+    return np.maximum(1 + EQUIVALENCE_ADULT * np.maximum(adults - 1, 0) + EQUIVALENCE_CHILD * children, 1)
+
+
+def equivalised_income(taxed_df: pd.DataFrame) -> np.ndarray:
+    """Equivalised disposable income (total_income - total_tax) of each person's household."""
+    household = household_index(taxed_df)
+    disposable = np.bincount(household, weights=(taxed_df['total_income'] - taxed_df['total_tax']).to_numpy())
+    return (disposable / equivalence_scales(taxed_df))[household]
@@ -0,0 +1,187 @@
+"""
+Net fiscal incidence: taxes paid minus the budget spending each person receives.
+
+State expenditure by policy area (málefnasvið, fjárlög 2026 table 5-4) is mapped onto people
+by age and status through one allocation table of shape (ages x statuses):
+- education (20 upper secondary, 21 university): cost per student is the line divided by
+  the simulated (weighted) students at those levels, so the line is allocated exactly.
+  With a `school_level` column (enrollment.py) each (age, status) cell gets the cost times
+  its share of students at those levels; without one every Student in the levels' age
+  band receives it,
+- health (23 hospitals, 24 primary care, 25 nursing and rehabilitation, 26 medicines):
+  spread over the whole population with a relative cost profile by age,
+- 27 disability: people with status Disabled; 28 the elderly: people aged 67+;
+  29 family affairs (child benefit, parental leave): children under 18.
+Lines 27 and 28 also pay the cash benefits already in the population's `benefits` column,
+so only the part of the line above the simulated cash benefits is allocated in kind (the
+budget does not split the lines into cash and services; a warning is printed when the
+simulated cash benefits absorb a whole line).
+
+Each line becomes a per-capita array over (age, status), the arrays are summed once, and
+every person's benefit in kind is one gather: table[age, status]. Net contribution is
+state taxes (total_tax of calculate_taxes.py less the municipal útsvar, which funds
+municipal services outside these lines) minus cash benefits minus benefits in kind,
+aggregated by age and by decile of equivalised household disposable income with
+np.bincount. The other policy areas (public goods such as justice or transport) are not
+allocated. Run as a script to write `fiscal_incidence_by_age` and `fiscal_incidence_by_decile`.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights, weighted_deciles
+from calculate_taxes import compute_taxes
+from benefits import BENEFIT_POLICY, eligible_scheme
+from labor_market import STATUSES, status_codes
+from households import equivalised_income
+from population_store import load_population
+
+MAX_AGE = 110
+
+# Policy area code -> allocation rule. 'levels' are rows of the enrollment table and 'ages'
+# the age band of their students; 'profile' is (ages, relative cost per person).
+HEALTH_PROFILE = ([0, 1, 5, 15, 25, 45, 65, 75, 85, 100], [2.0, 0.6, 0.4, 0.5, 0.7, 1.0, 2.5, 4.0, 6.0, 6.0])
+EXPENDITURE_LINES = {
+    20: {'name': 'Upper secondary education', 'rule': 'students', 'levels': ['Framhaldsskólastig', 'Viðbótarstig'],
+         'ages': (16, 29)},
+    21: {'name': 'University education', 'rule': 'students', 'levels': ['Háskólastig', 'Doktorsstig'], 'ages': (20, 39)},
+    23: {'name': 'Hospital services', 'rule': 'profile', 'profile': HEALTH_PROFILE},
+    24: {'name': 'Health care outside hospitals', 'rule': 'profile', 'profile': HEALTH_PROFILE},
+    25: {'name': 'Nursing and rehabilitation', 'rule': 'profile',
+         'profile': ([0, 60, 70, 80, 90, 100], [0.05, 0.1, 0.5, 3.0, 10.0, 12.0])},
+    26: {'name': 'Medicines and medical supplies', 'rule': 'profile',
+         'profile': ([0, 20, 40, 60, 80, 100], [0.3, 0.5, 0.8, 1.5, 2.5, 2.5])},
+    27: {'name': 'Disability', 'rule': 'status', 'status': 'Disabled', 'cash_scheme': 'disability'},
+    28: {'name': 'The elderly', 'rule': 'ages', 'ages': (67, MAX_AGE), 'cash_scheme': 'old_age_pension'},
+    29: {'name': 'Family affairs', 'rule': 'ages', 'ages': (0, 17)},
+}
+
+
+def load_expenditure(conn) -> pd.Series:
+    """Spending per policy area code in the 2026 budget proposal (ISK) from the `fjarlog_2026_expenditure`
+    silver table; empty if unavailable."""
+    try:
+        table = pd.read_sql_query("SELECT area, frumvarp_2026 FROM fjarlog_2026_expenditure", conn)
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read fjarlog_2026_expenditure: {exc}; nothing is allocated.")
+        return pd.Series(dtype=float)
+    return pd.Series(table['frumvarp_2026'].to_numpy(dtype=float) * 1e6,  # m.kr.
+                     index=table['area'].astype(int).to_numpy())
+
+
+def cell_weights(population_df: pd.DataFrame, mask: np.ndarray | None = None) -> np.ndarray:
+    """Weighted number of people (optionally only those in `mask`) per (age, status) cell."""
+    ages = np.minimum(population_df['age'].to_numpy(dtype=np.intp), MAX_AGE)
+    cells = ages * len(STATUSES) + status_codes(population_df['status'].to_numpy())
+    weights = population_weights(population_df)
+    if mask is not None:
+        weights = weights * mask
+    return np.bincount(cells, weights=weights,
+                       minlength=(MAX_AGE + 1) * len(STATUSES)).reshape(MAX_AGE + 1, len(STATUSES))
+
+
+def cash_benefits(population_df: pd.DataFrame) -> dict:
+    """Weighted cash benefits per scheme of benefits.py (zeros without a `benefits` column)."""
+    if 'benefits' not in population_df.columns:
+        return {}
+    scheme = eligible_scheme(population_df)
+    paid = population_df['benefits'].to_numpy() * population_weights(population_df)
+    return {name: float(paid[scheme == idx].sum()) for idx, name in enumerate(BENEFIT_POLICY)}
+
+
+def allocation_tables(population_df: pd.DataFrame, expenditure: pd.Series, lines: dict = EXPENDITURE_LINES) -> dict:
+    """Per-capita benefit in kind of each line as an (ages x statuses) array."""
+    people = cell_weights(population_df)
+    ages = np.arange(MAX_AGE + 1)[:, None]
+    cash = cash_benefits(population_df)
+    tables = {}
+    for code, rules in lines.items():
+        amount = float(expenditure.get(code, 0.0))
+        if 'cash_scheme' in rules:
+            paid = cash.get(rules['cash_scheme'], 0.0)
+            if amount > 0 and paid >= amount:
+                print(f"Warning: Simulated {rules['cash_scheme']} ({format_number(paid)}) absorbs line {code} "
+                      f"{rules['name']} ({format_number(amount)}); nothing is allocated in kind.")
+            amount = max(0.0, amount - paid)
+        if rules['rule'] == 'students' and 'school_level' in population_df.columns:
+            # Share of each cell enrolled at the line's levels
+            enrolled = cell_weights(population_df, population_df['school_level'].isin(rules['levels']).to_numpy())
+            shape = np.divide(enrolled, people, out=np.zeros(people.shape), where=people > 0)
+        elif rules['rule'] == 'students':
+            low, high = rules['ages']
+            in_band = (ages >= low) & (ages <= high) & (np.arange(len(STATUSES)) == STATUSES.index('Student'))
+            shape = np.broadcast_to(in_band, people.shape)
+        elif rules['rule'] == 'profile':
+            shape = np.broadcast_to(np.interp(ages, *rules['profile']), people.shape)
+        elif rules['rule'] == 'status':
+            shape = np.broadcast_to(np.arange(len(STATUSES)) == STATUSES.index(rules['status']), people.shape)
+        else:
+            low, high = rules['ages']
+            shape = np.broadcast_to((ages >= low) & (ages <= high), people.shape)
+        total = (shape * people).sum()
+        tables[code] = shape * (amount / total) if total > 0 else np.zeros(people.shape)
+    return tables
+
+
+def net_contributions(population_df: pd.DataFrame, tables: dict) -> pd.DataFrame:
+    """State taxes, cash benefits, benefits in kind and net contribution per person."""
+    taxed = compute_taxes(population_df)
+    taxes = (taxed['total_tax'] - taxed['municipal_tax']).to_numpy()  # útsvar funds municipalities, not these lines
+    combined = sum(tables.values()) if tables else np.zeros((MAX_AGE + 1, len(STATUSES)))
+    ages = np.minimum(taxed['age'].to_numpy(dtype=np.intp), MAX_AGE)
+    in_kind = combined[ages, status_codes(taxed['status'].to_numpy())]
+    cash = taxed['benefits'].to_numpy() if 'benefits' in taxed.columns else np.zeros(len(taxed))
+    return pd.DataFrame({
+        'age': taxed['age'].to_numpy(),
+        'weight': population_weights(taxed),
+        'equivalised_income': equivalised_income(taxed),
+        'taxes': taxes,
+        'cash_benefits': cash,
+        'in_kind': in_kind,
+        'net_contribution': taxes - cash - in_kind,
+    })
+
+
+def aggregate(incidence: pd.DataFrame, groups: np.ndarray, size: int) -> pd.DataFrame:
+    """Weighted people and totals of every incidence column per group."""
+    weights = incidence['weight'].to_numpy()
+    columns = ['taxes', 'cash_benefits', 'in_kind', 'net_contribution']
+    result = {'people': np.bincount(groups, weights=weights, minlength=size)}
+    for column in columns:
+        result[column] = np.bincount(groups, weights=incidence[column].to_numpy() * weights, minlength=size)
+    return pd.DataFrame(result)
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    expenditure = load_expenditure(conn)
+    tables = allocation_tables(population_df, expenditure)
+    incidence = net_contributions(population_df, tables)
+
+    ages = np.minimum(incidence['age'].to_numpy(dtype=np.intp), MAX_AGE)
+    by_age = aggregate(incidence, ages, MAX_AGE + 1)
+    by_age.insert(0, 'age', np.arange(MAX_AGE + 1))
+    by_age = by_age[by_age['people'] > 0]
+    deciles = weighted_deciles(incidence['equivalised_income'], incidence['weight'])
+    by_decile = aggregate(incidence, deciles, 10)
+    by_decile.insert(0, 'decile', np.arange(1, 11))
+    by_age.to_sql("fiscal_incidence_by_age", conn, if_exists="replace", index=False)
+    by_decile.to_sql("fiscal_incidence_by_decile", conn, if_exists="replace", index=False)
+    conn.close()
+
+    people = cell_weights(population_df)
+    print("Benefits in kind allocated per policy area (budget 2026):")
+    for code, table in tables.items():
+        print(f"  {code} {EXPENDITURE_LINES[code]['name']}: {format_number((table * people).sum())} "
+              f"of {format_number(expenditure.get(code, 0.0))}")
+    print("Net contribution by equivalised disposable income decile:")
+    for _, row in by_decile.iterrows():
+        print(f"  {int(row['decile']):2d}: taxes {format_number(row['taxes'])}, benefits "
+              f"{format_number(row['cash_benefits'] + row['in_kind'])}, net {format_number(row['net_contribution'])}")
+    print("Results written to the fiscal_incidence_by_age and fiscal_incidence_by_decile tables.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Fitted income distributions per (age, gender, component) cell.
+
+Each income component is modelled as a lognormal body spliced to a Pareto tail.
+The official tables only publish cell means, so the shape (log-sd of the body,
+Pareto index of the tail) comes from per-component assumptions that widen at the
+ages where part-time work and retirement transitions are common, and the scale is
+fitted so that the integral of every cell's table equals its official mean. With heavy
+tails a sample of a few thousand draws can still miss that mean by a wide margin, so
+sample() rescales the draws of a cell of at least RESCALE_MIN_DRAWS people to the table
+mean. Smaller samples (weighted cells, single movers) keep their draws as they are, so
+they still spread over the distribution; the shape within a cell remains an assumption.
+
+The fitted distributions are stored as inverse-CDF lookup tables on a fixed
+probability grid, so drawing n incomes for a cell is one uniform draw plus np.interp.
+"""
+import numpy as np
+import pandas as pd
+
+# Generated column -> official income table column
+INCOME_COMPONENTS = {
+    'wages': 'Atvinnutekjur',
+    'capital_gains': 'Fjármagnstekjur',
+    'other_income': 'Aðrar_tekjur',
+}
+GENDERS = {'Male': 'Karlar', 'Female': 'Konur'}
+
+# Log-sd of the lognormal body at prime working age, and extra spread at the margins
+BODY_SIGMA = {'wages': 0.55, 'capital_gains': 1.3, 'other_income': 0.7}
+BODY_SIGMA_EDGE = {'wages': 0.35, 'capital_gains': 0.0, 'other_income': 0.25}
+# Pareto tail index (must be > 1 for a finite mean); lower means heavier tail
+TAIL_ALPHA = {'wages': 3.0, 'capital_gains': 1.5, 'other_income': 4.0}
+TAIL_START = 0.95  # quantile where the Pareto tail takes over from the lognormal body
+RESCALE_MIN_DRAWS = 1000  # samples at least this large are rescaled to the table mean
+
+# Probability grid: uniform through the body, geometrically denser towards the top of the tail
+PROB_GRID = np.unique(np.concatenate([
+    np.linspace(0.0, TAIL_START, 193),
+    1 - (1 - TAIL_START) * np.geomspace(1.0, 1e-5, 64),
+]))
+
+
+def _norm_ppf(p: np.ndarray) -> np.ndarray:
+    """Inverse standard normal CDF (Acklam's rational approximation, |error| < 1.2e-9)."""
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = np.clip(np.asarray(p, dtype=float), 1e-12, 1 - 1e-12)
+    out = np.empty_like(p)
+    low, high = p < 0.02425, p > 1 - 0.02425
+    mid = ~(low | high)
+
+    q = np.sqrt(-2 * np.log(p[low]))
+    out[low] = (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+               ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    q = np.sqrt(-2 * np.log(1 - p[high]))
+    out[high] = -(((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+                ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    q = p[mid] - 0.5
+    r = q * q
+    out[mid] = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+               (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    return out
+
+
+def body_sigma(component: str, ages: np.ndarray) -> np.ndarray:
+    """Log-sd of the body by age: widest for the young and around retirement."""
+    ages = np.asarray(ages, dtype=float)
+    young = np.clip((25 - ages) / 9, 0, 1)
+    retiring = np.clip(1 - np.abs(ages - 67) / 8, 0, 1)
+    return BODY_SIGMA[component] + BODY_SIGMA_EDGE[component] * np.maximum(young, retiring)
+
+
+def unit_quantiles(sigma: np.ndarray, alpha: float, probs: np.ndarray = PROB_GRID) -> np.ndarray:
+    """Inverse CDF of the spliced lognormal/Pareto shape, rescaled to unit mean.
+
+    `sigma` has one entry per cell; the result has shape (len(sigma), len(probs)).
+    The mean is taken as the trapezoid integral over the grid, i.e. the mean that
+    np.interp sampling from the table actually produces.
+    """
+    sigma = np.asarray(sigma, dtype=float)[:, None]
+    z = _norm_ppf(np.minimum(probs, TAIL_START))[None, :]
+    q = np.exp(sigma * z)
+    tail = probs > TAIL_START
+    q[:, tail] = q[:, tail] * ((1 - TAIL_START) / (1 - probs[tail])) ** (1 / alpha)
+    q[:, probs == 0] = 0.0
+    mean = np.trapezoid(q, probs, axis=1)[:, None]
+    return q / mean
+
+
+class IncomeTables:
+    """Inverse-CDF tables indexed by [component, gender, age, probability]."""
+
+    def __init__(self, quantiles: np.ndarray, probs: np.ndarray = PROB_GRID):
+        self.quantiles = quantiles
+        self.probs = probs
+        self.components = list(INCOME_COMPONENTS)
+        self.genders = list(GENDERS)
+        self.max_age = quantiles.shape[2] - 1
+
+    def sample(self, component: str, gender: str, age: int, n: int, rng: np.random.Generator,
+               stratified: bool = False) -> np.ndarray:
+        """Draw n incomes for one cell by interpolating the table at uniform draws.
+
+        With stratified=True each draw comes from its own 1/n slice of the probability range
+        (in random order), which keeps small weighted samples close to the cell distribution.
+        """
+        row = self.quantiles[self.components.index(component), self.genders.index(gender), min(age, self.max_age)]
+        if not row.any():
+            return np.zeros(n)
+        u = (rng.permutation(n) + rng.random(n)) / n if stratified else rng.random(n)
+        draws = np.interp(u, self.probs, row)
+        # Heavy tails make the mean of a few thousand draws wander far from the table mean;
+        # rescale a large cell so its sample mean is exactly the fitted mean
+        total = draws.sum()
+        if n < RESCALE_MIN_DRAWS or total <= 0:
+            return draws
+        return draws * (np.trapezoid(row, self.probs) * n / total)
+
+    def cell_mean(self, component: str, gender: str, age: int) -> float:
+        row = self.quantiles[self.components.index(component), self.genders.index(gender), min(age, self.max_age)]
+        return float(np.trapezoid(row, self.probs))
+
+
+def build_income_tables(income_df: pd.DataFrame) -> IncomeTables:
+    """Fit every (component, gender, age) cell to the official means in income_df.
+
+    income_df uses English keys: columns 'age', 'gender' (Karlar/Konur) plus the official income columns.
+    """
+    max_age = int(income_df['age'].max())
+    ages = np.arange(max_age + 1)
+    quantiles = np.zeros((len(INCOME_COMPONENTS), len(GENDERS), max_age + 1, len(PROB_GRID)))
+    for c_idx, (component, source_col) in enumerate(INCOME_COMPONENTS.items()):
+        shapes = unit_quantiles(body_sigma(component, ages), TAIL_ALPHA[component])
+        for g_idx, gender_is in enumerate(GENDERS.values()):
+            means = (
+                income_df[income_df['gender'] == gender_is]
+                .set_index('age')[source_col]
+                .reindex(ages)
+                .fillna(0)
+                .clip(lower=0)
+                .to_numpy()
+            )
+            quantiles[c_idx, g_idx] = shapes * means[:, None]
+    return IncomeTables(quantiles)
+
+
+def save_income_tables(tables: IncomeTables, conn, table_name: str = "income_quantile_tables") -> None:
+    """Write the lookup tables to SQLite in long format (one row per cell and grid point)."""
+    comp, gender, age, p_idx = np.nonzero(tables.quantiles)
+    df = pd.DataFrame({
+        'component': np.array(tables.components)[comp],
+        'gender': np.array(tables.genders)[gender],
+        'age': age,
+        'probability': tables.probs[p_idx],
+        'income': tables.quantiles[comp, gender, age, p_idx],
+    })
+    df.to_sql(table_name, conn, if_exists="replace", index=False)
+
+
+def load_income_tables(conn, table_name: str = "income_quantile_tables") -> IncomeTables | None:
+    """Rebuild IncomeTables from the long-format table written by save_income_tables."""
+    try:
+        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+    except Exception:
+        return None
+    if df.empty:
+        return None
+    components, genders = list(INCOME_COMPONENTS), list(GENDERS)
+    quantiles = np.zeros((len(components), len(genders), int(df['age'].max()) + 1, len(PROB_GRID)))
+    p_idx = np.searchsorted(PROB_GRID, df['probability'].to_numpy())
+    quantiles[
+        df['component'].map(components.index).to_numpy(),
+        df['gender'].map(genders.index).to_numpy(),
+        df['age'].to_numpy(),
+        p_idx,
+    ] = df['income'].to_numpy()
+    return IncomeTables(quantiles)
@@ -0,0 +1,221 @@
+"""
+Markov model of labor status (Student / Employed / Retired / Disabled / Unemployed) by age and gender.
+
+Transition matrices are estimated from the cross-sectional status shares of a population:
+moving from age a to a + 1, each status keeps as many of its members as the next age's share
+allows and the outflow of shrinking statuses is spread over the growing ones in proportion to
+their gains. That is the transition matrix with the fewest moves that turns the status mix at
+age a into the mix at age a + 1, so it reproduces the cross-section exactly and makes
+retirement (whose share only grows with age) close to absorbing.
+
+Matrices are annual; monthly steps use the twelfth root of each matrix (matrix_root, by
+eigendecomposition), or the first-order root I + (P - I) / 12 for a matrix that has no
+stochastic twelfth root. A step is one batched categorical draw for the whole population:
+the cumulative row of every person's (cell, status) is gathered and compared with one
+uniform per person.
+
+apply_transitions moves a population one step and gives the people whose status changed
+the incomes of a random person of their age, gender and new status (IncomeDonors), so
+incomes follow the status; projection.py runs it every projected year.
+"""
+import numpy as np
+import pandas as pd
+
+from helpers import population_weights
+from income_model import INCOME_COMPONENTS
+from generate_population import GENDERS, INCOME_MODEL, assign_income
+from benefits import BENEFIT_COLUMNS, apply_benefits
+
+STATUSES = ['Student', 'Employed', 'Retired', 'Disabled', 'Unemployed']
+STEPS_PER_YEAR = {'year': 1, 'month': 12}
+
+
+def cell_codes(ages: np.ndarray, genders: np.ndarray) -> np.ndarray:
+    """Code (age, gender) cells as age * 2 + is_female."""
+    return np.asarray(ages, dtype=np.intp) * 2 + (np.asarray(genders) == GENDERS[1])
+
+
+def status_codes(status: np.ndarray) -> np.ndarray:
+    return pd.Categorical(status, categories=STATUSES).codes.astype(np.intp)
+
+
+def minimal_flow_matrix(current: np.ndarray, following: np.ndarray) -> np.ndarray:
+    """Transition matrix with the fewest moves that maps share vector `current` onto `following`."""
+    n = len(current)
+    matrix = np.eye(n)
+    if current.sum() <= 0 or following.sum() <= 0:
+        return matrix
+    current, following = current / current.sum(), following / following.sum()
+    stay = np.minimum(current, following)
+    outflow = current - stay
+    inflow = following - stay
+    if inflow.sum() <= 0:
+        return matrix
+    for i in range(n):
+        if current[i] > 0:
+            matrix[i] = inflow / inflow.sum() * outflow[i] / current[i]
+            matrix[i, i] = stay[i] / current[i]
+    return matrix
+
+
+def matrix_root(matrices: np.ndarray, k: int) -> np.ndarray:
+    """k-th roots of a stack of stochastic matrices, V diag(lambda^(1/k)) V^-1.
+
+    A matrix whose root is not a real stochastic matrix that gives the matrix back when raised
+    to the k-th power (negative or complex eigenvalues, a defective matrix) gets the first-order
+    root I + (P - I) / k instead.
+    """
+    identity = np.eye(matrices.shape[-1])
+    first_order = identity + (matrices - identity) / k
+    values, vectors = np.linalg.eig(matrices)
+    roots = (vectors * values.astype(complex)[..., None, :] ** (1 / k)) @ np.linalg.pinv(vectors)
+    real = roots.real
+    valid = (
+        (np.abs(roots.imag).max(axis=(-2, -1)) < 1e-9)
+        & (real.min(axis=(-2, -1)) > -1e-9)
+        & np.isclose(np.linalg.matrix_power(real, k), matrices, atol=1e-8).all(axis=(-2, -1))
+    )
+    real = np.maximum(real, 0)
+    real = real / real.sum(axis=-1, keepdims=True)
+    return np.where(valid[..., None, None], real, first_order)
+
+
+class LaborMarket:
+    """Annual transition matrices indexed by [cell, from status, to status]."""
+
+    def __init__(self, annual: np.ndarray):
+        self.annual = annual
+        self._cumulative = {}
+
+    @classmethod
+    def estimate(cls, population_df: pd.DataFrame, max_age: int | None = None) -> "LaborMarket":
+        """Estimate matrices from the weighted status shares per (age, gender) of a population."""
+        ages = population_df['age'].to_numpy(dtype=np.intp)
+        max_age = int(ages.max()) if max_age is None else max_age
+        n_cells = (max_age + 1) * 2
+        cells = cell_codes(ages, population_df['gender'].to_numpy())
+        inside = cells < n_cells
+        status = status_codes(population_df['status'].to_numpy())
+        shares = np.bincount(
+            cells[inside] * len(STATUSES) + status[inside],
+            weights=population_weights(population_df)[inside],
+            minlength=n_cells * len(STATUSES),
+        ).reshape(max_age + 1, 2, len(STATUSES))
+
+        annual = np.tile(np.eye(len(STATUSES)), (n_cells, 1, 1))
+        for age in range(max_age):
+            for g in range(2):
+                annual[age * 2 + g] = minimal_flow_matrix(shares[age, g], shares[age + 1, g])
+        return cls(annual)
+
+    def matrices(self, step: str = 'year') -> np.ndarray:
+        """Transition matrices for one step: annual, or the twelfth root for a month."""
+        per_year = STEPS_PER_YEAR[step]
+        if per_year == 1:
+            return self.annual
+        return matrix_root(self.annual, per_year)
+
+    def cumulative(self, step: str = 'year') -> np.ndarray:
+        if step not in self._cumulative:
+            self._cumulative[step] = np.cumsum(self.matrices(step), axis=-1)
+        return self._cumulative[step]
+
+    def step(self, ages: np.ndarray, genders: np.ndarray, status: np.ndarray, rng: np.random.Generator,
+             step: str = 'year') -> np.ndarray:
+        """Next status of every person: one batched categorical draw.
+
+        `ages` are the ages the step starts from; a person aged a moves with the a -> a + 1 matrix.
+        """
+        cumulative = self.cumulative(step)
+        cells = np.minimum(cell_codes(ages, genders), len(cumulative) - 1)
+        rows = cumulative[cells, status_codes(status)]
+        drawn = (rng.random(len(cells))[:, None] > rows[:, :-1]).sum(axis=1)
+        return np.array(STATUSES, dtype=object)[drawn]
+
+
+class IncomeDonors:
+    """Incomes of a population grouped by (age, gender, status) cell, drawn from by weight."""
+
+    def __init__(self, population_df: pd.DataFrame):
+        codes = self.codes(population_df['age'].to_numpy(), population_df['gender'].to_numpy(),
+                           population_df['status'].to_numpy())
+        order = np.argsort(codes, kind='stable')
+        self.codes_sorted = codes[order]
+        self.cumulative = np.cumsum(population_weights(population_df)[order])
+        self.incomes = population_df[list(INCOME_COMPONENTS)].to_numpy(dtype=float)[order]
+
+    @staticmethod
+    def codes(ages: np.ndarray, genders: np.ndarray, status: np.ndarray) -> np.ndarray:
+        return cell_codes(ages, genders) * len(STATUSES) + status_codes(status)
+
+    def draw(self, ages: np.ndarray, genders: np.ndarray, status: np.ndarray,
+             rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+        """Incomes (people x components) of one weighted random donor per person, and whether one was found.
+
+        People whose cell has no donor get zeros and False.
+        """
+        codes = self.codes(ages, genders, status)
+        start = np.searchsorted(self.codes_sorted, codes, side='left')
+        stop = np.searchsorted(self.codes_sorted, codes, side='right')
+        found = stop > start
+        low = np.where(start > 0, self.cumulative[np.maximum(start - 1, 0)], 0.0)
+        high = self.cumulative[np.maximum(stop - 1, 0)]
+        donor = np.searchsorted(self.cumulative, low + rng.random(len(codes)) * (high - low), side='right')
+        donor = np.clip(donor, start, np.maximum(stop - 1, start))
+        incomes = np.where(found[:, None], self.incomes[np.minimum(donor, len(self.incomes) - 1)], 0.0)
+        return incomes, found
+
+
+def apply_transitions(population_df: pd.DataFrame, market: LaborMarket, rng: np.random.Generator,
+                      inputs: dict, step: str = 'year', donors: IncomeDonors | None = None) -> np.ndarray:
+    """Move the population one step in place; occupations, incomes, benefits and school levels are redrawn for movers only.
+
+    Movers take the incomes of a random person with their age, gender and new status in `donors`
+    (by default the population before the step). Where nobody has that status, incomes are drawn
+    for the age/gender cell as in the generator. Returns the boolean mask of people whose status changed.
+    """
+    donors = IncomeDonors(population_df) if donors is None else donors
+    new_status = market.step(population_df['age'].to_numpy(), population_df['gender'].to_numpy(),
+                             population_df['status'].to_numpy(), rng, step)
+    changed = new_status != population_df['status'].to_numpy()
+    if not changed.any():
+        return changed
+    population_df.loc[changed, 'status'] = new_status[changed]
+
+    movers = population_df.loc[changed, ['age', 'gender', 'status']]
+    incomes, found = donors.draw(movers['age'].to_numpy(), movers['gender'].to_numpy(), movers['status'].to_numpy(), rng)
+    population_df.loc[changed, list(INCOME_COMPONENTS)] = incomes
+    for (age, gender), group in movers[~found].groupby(['age', 'gender']):
+        wages, capital_gains, other_income = assign_income(int(age), gender, len(group), inputs, rng, INCOME_MODEL)
+        population_df.loc[group.index, list(INCOME_COMPONENTS)] = np.column_stack(
+            [wages, capital_gains, other_income]
+        )
+    population_df.loc[changed, 'total_income'] = population_df.loc[
+        changed, ['wages', 'capital_gains', 'other_income']
+    ].sum(axis=1)
+
+    if 'benefits' in population_df.columns:
+        # Eligibility and other_income changed; split other_income again for the movers
+        moved = population_df.loc[changed].copy()
+        apply_benefits(moved)
+        population_df.loc[changed, BENEFIT_COLUMNS] = moved[BENEFIT_COLUMNS].to_numpy()
+
+    if 'school_level' in population_df.columns and inputs.get('enrollment') is not None:
+        # Leavers drop their school level; new students draw one for their age
+        population_df.loc[changed, 'school_level'] = None
+        joined = changed & (population_df['status'].to_numpy() == 'Student')
+        if joined.any():
+            population_df.loc[joined, 'school_level'] = inputs['enrollment'].draw(
+                population_df.loc[joined, 'age'].to_numpy(), population_df.loc[joined, 'gender'].to_numpy(), rng,
+                enrolled_only=True,
+            )
+
+    population_df.loc[changed, 'occupation'] = population_df.loc[changed, 'status']
+    employed = changed & (population_df['status'].to_numpy() == 'Employed')
+    if employed.any():
+        population_df.loc[employed, 'occupation'] = inputs['occupation_sampler'].sample(
+            population_df.loc[employed, 'wages'].to_numpy(),
+            population_df.loc[employed, 'gender'].to_numpy(),
+            rng,
+        )
+    return changed
@@ -0,0 +1,164 @@
+"""
+Marginal effective tax rates (METR) for the whole population.
+
+A person's METR is the share of an extra DELTA krónur that does not reach their household:
+
+    METR = (change in own tax + change in partner's tax - change in benefits) / DELTA
+
+Every tax function is evaluated once on stacked arrays of shape (scenarios, people): the
+baseline, DELTA more wages and DELTA more capital gains. So the whole population costs a
+handful of array passes, with state tax by exact bracket lookup (policy.TaxPolicy.state_tax)
+instead of a per-person loop over the brackets. The components are
+- income tax: state and municipal tax on total_income (each person's útsvar rate) less the
+  personal credit, or the children's tax under 16,
+- capital gains tax above the free limit (capital gains are also part of total_income, as
+  in compute_taxes),
+- credit transfer: an adult's unused personal credit goes to their partner
+  (calculate_taxes.transfer_unused_credit), so earning more can raise the partner's tax,
+- benefit withdrawal: income-tested benefits (benefits.benefit_amount with each person's
+  take-up) fall as wages and capital gains rise.
+Fixed fees do not depend on income. Run as a script to write `metr_by_age` and
+`metr_by_income`.
+"""
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, population_weights
+from calculate_taxes import (
+    POLICY, calculate_capital_gains_tax_array, calculate_income_tax_array, gross_income_tax_array,
+    municipal_rates,
+)
+from policy import TaxPolicy
+from benefits import BENEFIT_POLICY, _rule_arrays, benefit_amount, eligible_scheme, split_other_income
+from distribution import AGE_BANDS
+from households import records_can_pair
+from population_store import load_population
+
+DELTA = 10_000  # extra annual income (ISK)
+SCENARIOS = ['base', 'wages', 'capital_gains']
+COMPONENTS = ['income_tax', 'capital_gains_tax', 'credit_transfer', 'benefit_withdrawal']
+INCOME_BANDS = [0, 1_000_000, 2_500_000, 5_000_000, 7_500_000, 10_000_000, 15_000_000, 25_000_000, np.inf]
+
+
+def partner_index(population_df: pd.DataFrame, eligible: np.ndarray) -> np.ndarray:
+    """Row of the other credit-sharing adult in the household, or -1 (households have at most two)."""
+    household = population_df['household_id'].to_numpy(dtype=np.intp)
+    rows = np.arange(len(population_df))
+    members = np.bincount(household[eligible], minlength=household.max() + 1)
+    row_sum = np.bincount(household[eligible], weights=rows[eligible], minlength=household.max() + 1)
+    partner = row_sum[household].astype(np.intp) - rows
+    return np.where(eligible & (members[household] == 2), partner, -1)
+
+
+def marginal_rates(population_df: pd.DataFrame, delta: float = DELTA, policy: dict = BENEFIT_POLICY,
+                   tax_policy: TaxPolicy = POLICY) -> pd.DataFrame:
+    """Per-person METR on wages and on capital gains, with the wage METR split into COMPONENTS."""
+    n = len(population_df)
+    wages = population_df['wages'].to_numpy(dtype=float) + np.r_[0, delta, 0][:, None]
+    capital_gains = population_df['capital_gains'].to_numpy(dtype=float) + np.r_[0, 0, delta][:, None]
+    age = population_df['age'].to_numpy()
+    rate = np.asarray(municipal_rates(population_df))
+
+    # Benefits on the stacked incomes (private other income and take-up stay fixed)
+    if 'private_other_income' in population_df.columns:
+        private = population_df['private_other_income'].to_numpy(dtype=float)
+        take_up = population_df['benefit_take_up'].to_numpy(dtype=float)
+    else:
+        private, _, take_up = split_other_income(population_df, policy)
+    rules = _rule_arrays(eligible_scheme(population_df, policy), policy)
+    benefits = take_up * benefit_amount(private, wages, capital_gains, rules)
+    total_income = wages + capital_gains + private + benefits
+
+    income_tax, _ = calculate_income_tax_array(total_income, age, rate, tax_policy)
+    credit_transfer = np.zeros((len(SCENARIOS), n))
+    if tax_policy.credit_transfer and 'household_id' in population_df.columns \
+            and population_df['household_id'].notna().all() and records_can_pair(population_df):
+        # The partner's credit received is fixed at its baseline; own unused credit moves with income
+        eligible = (population_df['household_role'] == 'adult').to_numpy() & (age >= tax_policy.credit_transfer_min_age)
+        partner = partner_index(population_df, eligible)
+        has_partner = partner >= 0
+        credit = tax_policy.personal_credit
+        gross, _ = gross_income_tax_array(total_income, rate, tax_policy)
+        unused = np.where(eligible, np.maximum(0, credit - gross), 0.0)
+        received = np.where(has_partner, unused[0, np.maximum(partner, 0)], 0.0)
+        income_tax = np.where(eligible, np.maximum(0, gross - credit - received), income_tax)
+        partner_room = np.where(has_partner, gross[0, np.maximum(partner, 0)] - credit, 0.0)
+        partner_tax = np.maximum(0, partner_room - unused)
+        credit_transfer = np.where(has_partner, partner_tax, 0.0)
+    capital_gains_tax = calculate_capital_gains_tax_array(capital_gains, tax_policy)
+
+    changes = {
+        'income_tax': income_tax - income_tax[0],
+        'capital_gains_tax': capital_gains_tax - capital_gains_tax[0],
+        'credit_transfer': credit_transfer - credit_transfer[0],
+        'benefit_withdrawal': -(benefits - benefits[0]),
+    }
+    result = pd.DataFrame({f'{name}_rate': change[1] / delta for name, change in changes.items()})
+    result.insert(0, 'metr', sum(changes.values())[1] / delta)
+    result['metr_capital_gains'] = sum(changes.values())[2] / delta
+    result.insert(0, 'age', age)
+    result['total_income'] = total_income[0]
+    result['weight'] = population_weights(population_df)
+    return result
+
+
+def metr_table(metr: pd.DataFrame, groups: np.ndarray, size: int) -> pd.DataFrame:
+    """Weighted people and mean METR (and components) per group."""
+    weights = metr['weight'].to_numpy()
+    people = np.bincount(groups, weights=weights, minlength=size)
+    columns = ['metr', 'metr_capital_gains'] + [f'{name}_rate' for name in COMPONENTS]
+    table = {'people': people}
+    for column in columns:
+        table[column] = np.bincount(groups, weights=weights * metr[column].to_numpy(), minlength=size) / np.where(
+            people > 0, people, np.nan)
+    table['share_above_50'] = np.bincount(groups, weights=weights * (metr['metr'].to_numpy() > 0.5),
+                                          minlength=size) / np.where(people > 0, people, np.nan)
+    return pd.DataFrame(table)
+
+
+def metr_by_age(metr: pd.DataFrame) -> pd.DataFrame:
+    bands = np.searchsorted(AGE_BANDS, metr['age'].to_numpy(), side='right') - 1
+    table = metr_table(metr, bands, len(AGE_BANDS) - 1)
+    table.insert(0, 'age_band', [f"{lo}-{hi - 1}" if hi < AGE_BANDS[-1] else f"{lo}+"
+                                 for lo, hi in zip(AGE_BANDS[:-1], AGE_BANDS[1:])])
+    return table
+
+
+def metr_by_income(metr: pd.DataFrame) -> pd.DataFrame:
+    bands = np.maximum(np.searchsorted(INCOME_BANDS, metr['total_income'].to_numpy(), side='right') - 1, 0)
+    table = metr_table(metr, bands, len(INCOME_BANDS) - 1)
+    table.insert(0, 'income_band', [f"{lo:,.0f}-{hi:,.0f}" if np.isfinite(hi) else f"{lo:,.0f}+"
+                                    for lo, hi in zip(INCOME_BANDS[:-1], INCOME_BANDS[1:])])
+    return table
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+
+    start = time.perf_counter()
+    metr = marginal_rates(population_df)
+    elapsed = time.perf_counter() - start
+    by_age = metr_by_age(metr)
+    by_income = metr_by_income(metr)
+    by_age.to_sql("metr_by_age", conn, if_exists="replace", index=False)
+    by_income.to_sql("metr_by_income", conn, if_exists="replace", index=False)
+    conn.close()
+
+    weights = metr['weight'].to_numpy()
+    print(f"METR of {len(metr)} records (+{DELTA:,} ISK) in {elapsed:.2f}s: mean on wages "
+          f"{np.average(metr['metr'], weights=weights):.1%}, on capital gains "
+          f"{np.average(metr['metr_capital_gains'], weights=weights):.1%}")
+    print("Mean METR on wages by income band (income tax / credit transfer / benefit withdrawal):")
+    for _, row in by_income.iterrows():
+        print(f"  {row['income_band']:>22}: {row['metr']:.1%} ({row['income_tax_rate']:.1%} / "
+              f"{row['credit_transfer_rate']:.1%} / {row['benefit_withdrawal_rate']:.1%}), "
+              f"{row['share_above_50']:.0%} above 50%")
+    print("Results written to the metr_by_age and metr_by_income tables.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Municipality assignment and municipal income tax (útsvar) per municipality.
+
+- Every household is placed in a municipality drawn from the municipal population shares
+  (residents per municipality in the `property_tax_amount` silver table, Tafla 13). One
+  np.searchsorted over the cumulative shares draws all households at once, and members of a
+  household share the municipality. The code (svnr, e.g. 0 Reykjavíkurborg) is stored in
+  the `municipality` column.
+- calculate_taxes.compute_taxes then applies each person's own rate from
+  MUNICIPAL_RATE_LOOKUP, a dense array indexed by municipality number and read from
+  utsvar_sveitarfelaga.xls, instead of the national average.
+- Revenue per municipality is a weighted np.bincount over municipality positions and is
+  compared with the total revenue (Tekjur, thousand ISK) of each municipality in the
+  `arsreikningar_sveitarfelaga` accounts pivot; útsvar is the largest part of Tekjur.
+
+Households never cross municipalities, so the population can be sharded by municipality
+and taxed on a process pool (MUNICIPALITY_WORKERS, default one per CPU) with the spousal
+credit transfer intact. The population is published once in shared memory, in shard
+order (shared_population.py), and each worker taxes contiguous slices of it, so no shard
+is pickled to the workers. Run as a script to write the `municipal_tax_by_municipality` table.
+"""
+import os
+import sqlite3
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from calculate_taxes import MUNICIPAL_RATE_LOOKUP, MUNICIPAL_TAX_RATE, compute_taxes
+from households import household_index
+from population_store import load_population
+from shared_population import SharedPopulation
+
+MUNICIPALITY_WORKERS = int(os.getenv("MUNICIPALITY_WORKERS", str(os.cpu_count() or 1)))
+PROPERTY_TAX_FIRST_ROW = 5  # data rows of Tafla 13 start after the header block
+# Columns of Tafla 13: rates, assessed tax and tax base (both thousand ISK) per property class
+PROPERTY_TAX_COLUMNS = ['municipality', 'name', 'residents', 'rate_a', 'rate_b', 'rate_c',
+                        'tax_a', 'tax_b', 'tax_c', 'tax_total', 'tax_per_resident', 'base_a', 'base_b', 'base_c']
+ACCOUNTS_REVENUE_LINE = "Tekjur"
+
+_worker_state = {}
+
+
+def load_property_tax_table(conn) -> pd.DataFrame:
+    """One numeric row per municipality of the `property_tax_amount` silver table (Tafla 13).
+
+    Returns None (with a warning) when the table is missing.
+    """
+    try:
+        table = pd.read_sql_query("SELECT * FROM property_tax_amount", conn)
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read property_tax_amount: {exc}.")
+        return None
+    rows = table.iloc[PROPERTY_TAX_FIRST_ROW:, :len(PROPERTY_TAX_COLUMNS)]
+    rows.columns = PROPERTY_TAX_COLUMNS
+    numeric = [col for col in PROPERTY_TAX_COLUMNS if col != 'name']
+    rows = rows.assign(**{col: pd.to_numeric(rows[col], errors='coerce') for col in numeric})
+    rows = rows.dropna(subset=['municipality', 'residents'])  # drops blank lines and the total row
+    rows = rows[rows['residents'] > 0].astype({'municipality': int}).sort_values('municipality')
+    return rows.fillna({col: 0.0 for col in numeric}).reset_index(drop=True)
+
+
+def load_municipalities(conn) -> pd.DataFrame:
+    """Municipality number, name, residents, population share and útsvar rate (None if unavailable)."""
+    table = load_property_tax_table(conn)
+    if table is None:
+        print("Warning: Municipalities are not assigned.")
+        return None
+    rows = table[['municipality', 'name', 'residents']].copy()
+    rows['share'] = rows['residents'] / rows['residents'].sum()
+    rows['rate'] = MUNICIPAL_RATE_LOOKUP[np.clip(rows['municipality'].to_numpy(), 0, len(MUNICIPAL_RATE_LOOKUP) - 1)]
+    return rows.reset_index(drop=True)
+
+
+def assign_municipalities(population_df: pd.DataFrame, rng: np.random.Generator, municipalities: pd.DataFrame) -> None:
+    """Add a `municipality` column (in place), drawn per household from the population shares."""
+    household = household_index(population_df)
+    cumulative = np.cumsum(municipalities['share'].to_numpy())
+    drawn = np.searchsorted(cumulative, rng.random(household.max() + 1) * cumulative[-1], side='right')
+    codes = municipalities['municipality'].to_numpy()
+    population_df['municipality'] = codes[np.minimum(drawn, len(codes) - 1)][household]
+
+
+def municipality_positions(population_df: pd.DataFrame, municipalities: pd.DataFrame) -> np.ndarray:
+    """Row of `municipalities` for every person (codes are sorted, so one searchsorted)."""
+    codes = municipalities['municipality'].to_numpy()
+    positions = np.searchsorted(codes, population_df['municipality'].to_numpy())
+    return np.minimum(positions, len(codes) - 1)
+
+
+def revenue_by_municipality(taxed_df: pd.DataFrame, municipalities: pd.DataFrame) -> dict:
+    """Weighted residents, útsvar and income tax per municipality via np.bincount."""
+    positions = municipality_positions(taxed_df, municipalities)
+    weights = population_weights(taxed_df)
+    size = len(municipalities)
+    return {
+        'simulated_residents': np.bincount(positions, weights=weights, minlength=size),
+        'municipal_tax': np.bincount(positions, weights=taxed_df['municipal_tax'].to_numpy() * weights, minlength=size),
+        'income_tax': np.bincount(positions, weights=taxed_df['income_tax'].to_numpy() * weights, minlength=size),
+        'total_income': np.bincount(positions, weights=taxed_df['total_income'].to_numpy() * weights, minlength=size),
+    }
+
+
+def _init_worker(spec: dict) -> None:
+    """Attach to the population the parent published in shard order."""
+    _worker_state['shared'] = SharedPopulation.attach(spec)
+    _worker_state['population'] = _worker_state['shared'].frame()
+
+
+def _shard_revenue(task) -> dict:
+    start, stop, municipalities = task
+    return revenue_by_municipality(compute_taxes(_worker_state['population'].iloc[start:stop]), municipalities)
+
+
+def shard_by_municipality(population_df: pd.DataFrame, municipalities: pd.DataFrame, shards: int) -> list:
+    """Row positions of up to `shards` groups of whole municipalities with similar record counts."""
+    positions = municipality_positions(population_df, municipalities)
+    counts = np.bincount(positions, minlength=len(municipalities))
+    # Largest municipalities first, each to the currently smallest shard
+    load = np.zeros(max(1, shards))
+    shard_of = np.zeros(len(municipalities), dtype=np.intp)
+    for position in np.argsort(-counts, kind='stable'):
+        shard_of[position] = np.argmin(load)
+        load[shard_of[position]] += counts[position]
+    record_shard = shard_of[positions]
+    return [np.flatnonzero(record_shard == s) for s in range(len(load)) if load[s] > 0]
+
+
+def municipal_revenue(population_df: pd.DataFrame, municipalities: pd.DataFrame,
+                      workers: int = MUNICIPALITY_WORKERS) -> pd.DataFrame:
+    """Tax the population shard by shard (on a process pool when workers > 1) and aggregate per municipality."""
+    shards = shard_by_municipality(population_df, municipalities, workers)
+    if workers > 1 and len(shards) > 1:
+        bounds = np.cumsum([0] + [len(rows) for rows in shards])
+        tasks = [(start, stop, municipalities) for start, stop in zip(bounds[:-1], bounds[1:])]
+        with SharedPopulation.publish(population_df.take(np.concatenate(shards))) as shared, \
+                Pool(processes=min(workers, len(tasks)), initializer=_init_worker, initargs=(shared.spec,)) as pool:
+            parts = pool.map(_shard_revenue, tasks)
+    else:
+        parts = [revenue_by_municipality(compute_taxes(population_df.take(rows)), municipalities) for rows in shards]
+    totals = {key: sum(part[key] for part in parts) for key in parts[0]}
+    return municipalities[['municipality', 'name', 'residents', 'rate']].assign(**totals)
+
+
+def load_accounts_revenue(conn) -> pd.Series:
+    """Total revenue (Tekjur) per municipality number in ISK from the `arsreikningar_sveitarfelaga` pivot."""
+    try:
+        pivot = pd.read_sql_query("SELECT * FROM arsreikningar_sveitarfelaga", conn)
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read arsreikningar_sveitarfelaga: {exc}. Skipping the accounts comparison.")
+        return pd.Series(dtype=float)
+    header = pivot[pivot.iloc[:, 0] == "Yfirlit"]
+    revenue = pivot[pivot.iloc[:, 1] == ACCOUNTS_REVENUE_LINE]
+    if header.empty or revenue.empty:
+        print("Warning: No Tekjur line in arsreikningar_sveitarfelaga. Skipping the accounts comparison.")
+        return pd.Series(dtype=float)
+    labels = header.iloc[0].astype(str).str.extract(r'^(\d{4})\s')[0]
+    values = pd.to_numeric(revenue.iloc[0], errors='coerce') * 1000  # thousand ISK
+    found = labels.notna() & values.notna()
+    return pd.Series(values[found].to_numpy(), index=labels[found].astype(int).to_numpy(), name='accounts_revenue')
+
+
+def compare_with_accounts(results: pd.DataFrame, accounts_revenue: pd.Series) -> pd.DataFrame:
+    """Add the accounts' total revenue and the simulated útsvar share of it."""
+    results = results.copy()
+    results['accounts_revenue'] = results['municipality'].map(accounts_revenue)
+    results['municipal_tax_share'] = results['municipal_tax'] / results['accounts_revenue']
+    return results
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    municipalities = load_municipalities(conn)
+    if municipalities is None:
+        conn.close()
+        return
+    if 'municipality' not in population_df.columns or population_df['municipality'].isna().any():
+        print("Population has no municipalities; assigning them now.")
+        seed = os.getenv("SEED")
+        assign_municipalities(population_df, np.random.default_rng(int(seed) if seed else None), municipalities)
+
+    start = time.perf_counter()
+    results = municipal_revenue(population_df, municipalities)
+    elapsed = time.perf_counter() - start
+    results = compare_with_accounts(results, load_accounts_revenue(conn))
+    results.to_sql("municipal_tax_by_municipality", conn, if_exists="replace", index=False)
+    conn.close()
+
+    print(f"Municipal tax for {len(population_df)} records in {len(results)} municipalities "
+          f"({elapsed:.2f}s, {MUNICIPALITY_WORKERS} workers):")
+    print(f"  Total útsvar: {format_number(results['municipal_tax'].sum())} "
+          f"(national average rate {MUNICIPAL_TAX_RATE:.2%})")
+    for _, row in results.nlargest(10, 'simulated_residents').iterrows():
+        share = f"{row['municipal_tax_share']:.1%} of Tekjur" if pd.notna(row['municipal_tax_share']) else "no accounts"
+        print(f"  {row['name']}: {format_number(row['simulated_residents'])} residents, rate {row['rate']:.2%}, "
+              f"útsvar {format_number(row['municipal_tax'])} ({share})")
+    print("Per-municipality results written to the municipal_tax_by_municipality table.")
+
+
+if __name__ == "__main__":
+    main()
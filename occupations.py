@@ -0,0 +1,95 @@
+"""
+Wage-conditioned occupation sampling.
+
+The bronze `occupation_income_distribution` table gives, for each occupation,
+the share of its workers falling in each monthly wage bin (P(wage bin | occupation)).
+Combined with a per-gender occupation prior this yields P(occupation | wage bin, gender),
+which we store as a cumulative matrix (gender x wage bin x occupation) so that all
+employed people can be assigned in one vectorized pass.
+"""
+import numpy as np
+import pandas as pd
+
+# Occupation headcounts by gender (summed categories), used as the prior P(occupation | gender)
+OCCUPATION_PRIOR = {
+    'Karlar': {
+        'Managers': 17600,
+        'Professionals': 19800,
+        'Technicians': 17200,
+        'OfficeStaff': 2800,
+        'ServiceCare': 20000,
+        'IndustrialWorkers': 29400,  # Combined value
+        'Laborers': 12300  # Combined value
+    },
+    'Konur': {
+        'Managers': 10100,
+        'Professionals': 31900,
+        'Technicians': 17300,
+        'OfficeStaff': 6400,
+        'ServiceCare': 25300,
+        'IndustrialWorkers': 2700,  # Combined value
+        'Laborers': 6300  # Combined value
+    }
+}
+OCCUPATIONS = list(OCCUPATION_PRIOR['Karlar'].keys())
+GENDERS = {'Male': 'Karlar', 'Female': 'Konur'}
+
+
+class OccupationSampler:
+    """Precomputed P(occupation | wage bin, gender) lookup for vectorized sampling."""
+
+    def __init__(self, bin_edges: np.ndarray, cdf: np.ndarray, occupations: list[str]):
+        self.bin_edges = bin_edges  # lower edge of each monthly wage bin (ISK)
+        self.cdf = cdf  # shape (len(GENDERS), n_bins, n_occupations)
+        self.occupations = np.asarray(occupations, dtype=object)
+
+    @classmethod
+    def from_table(cls, table: pd.DataFrame | None, prior: dict = OCCUPATION_PRIOR) -> "OccupationSampler":
+        """Build the sampler from the occupation_income_distribution table.
+
+        Falls back to the gender-only prior (a single wage bin) if the table is missing.
+        """
+        prior_matrix = np.array(
+            [[prior[GENDERS[g]][occ] for occ in OCCUPATIONS] for g in GENDERS], dtype=float
+        )
+        prior_matrix /= prior_matrix.sum(axis=1, keepdims=True)
+
+        if table is None or table.empty or not set(OCCUPATIONS).issubset(table.columns):
+            print("Warning: occupation_income_distribution missing; sampling occupations from gender prior only.")
+            cdf = np.cumsum(prior_matrix, axis=1)[:, None, :]
+            return cls(np.array([0.0]), cdf, OCCUPATIONS)
+
+        table = table.sort_values('min_income')
+        bin_edges = table['min_income'].to_numpy(dtype=float)
+        wage_given_occ = table[OCCUPATIONS].to_numpy(dtype=float)  # (n_bins, n_occ)
+
+        # Bayes: P(occ | bin, gender) is proportional to P(bin | occ) * P(occ | gender)
+        joint = wage_given_occ[None, :, :] * prior_matrix[:, None, :]
+        row_totals = joint.sum(axis=2, keepdims=True)
+        # Bins with no observations for any occupation fall back to the prior
+        probs = np.where(row_totals > 0, joint / np.where(row_totals > 0, row_totals, 1), prior_matrix[:, None, :])
+        cdf = np.cumsum(probs, axis=2)
+        cdf[:, :, -1] = 1.0  # guard against rounding so every draw lands in a bin
+        return cls(bin_edges, cdf, OCCUPATIONS)
+
+    def sample(self, annual_wages: np.ndarray, genders: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Draw one occupation per person given annual wages and gender ('Male'/'Female')."""
+        annual_wages = np.asarray(annual_wages, dtype=float)
+        if annual_wages.size == 0:
+            return np.empty(0, dtype=object)
+        monthly = annual_wages / 12
+        bins = np.clip(np.searchsorted(self.bin_edges, monthly, side='right') - 1, 0, len(self.bin_edges) - 1)
+        gender_idx = (np.asarray(genders) == 'Female').astype(np.intp)
+        rows = self.cdf[gender_idx, bins]  # (n, n_occ)
+        u = rng.random(len(monthly))
+        picks = (u[:, None] > rows).sum(axis=1)
+        return self.occupations[picks]
+
+
+def load_occupation_sampler(conn) -> OccupationSampler:
+    """Read occupation_income_distribution from the database and build the sampler."""
+    try:
+        table = pd.read_sql_query("SELECT * FROM occupation_income_distribution", conn)
+    except Exception:
+        table = None
+    return OccupationSampler.from_table(table)
@@ -7,6 +7,12 @@ LANDING_DIR = Path("data/landing")
 BRONZE_DIR = Path("data/bronze")
 PROPERTY_VALUE_FILE = Path("data/property_value_estimates.csv")
 PROPERTY_TAX_FILE = Path("data/property_tax_amount.xlsx")
+# Summary rows in the employment table that overlap the five-year groups
+EMPLOYMENT_AGGREGATE_GROUPS = {
+    "Total", "Alls",
+    "16 to 74 years", "16 to 24 years", "25 to 54 years", "55 to 74 years",
+    "16-74 ára", "16-24 ára", "25-54 ára", "55-74 ára",
+}
 
 
 def excel_to_csv(source: Path, dest: Path, sheet_name=0) -> None:
@@ -92,6 +98,9 @@ def employment_json_to_csv() -> None:
     records = []
     for item in data["data"]:
         month, gender, age_group, _, _ = item["key"]
+        # Skip the both-genders total ("0") and the overlapping aggregate age groups
+        if gender not in ("1", "2") or age_group in EMPLOYMENT_AGGREGATE_GROUPS:
+            continue
         employed = int(item["values"][0])
         gender = "male" if gender == "1" else "female"
         records.append({"month": month, "gender": gender, "age_group": age_group, "employed": employed})
@@ -102,9 +111,9 @@ def employment_json_to_csv() -> None:
         for _, row in df_gender.iterrows():
             age_group = row["age_group"]
             employment = float(row["employed"])
-            if age_group == "Yngri en 15 ára":
+            if age_group in ("Yngri en 15 ára", "Younger than 15 years"):
                 age_distribution = {13: 0.5, 14: 0.5}
-            elif age_group == "70 ára og eldri":
+            elif age_group in ("70 ára og eldri", "70 years and older"):
                 age_distribution = {70: 0.4, 71: 0.3, 72: 0.2, 73: 0.1, 74: 0.05, 75: 0.025, 76: 0.01, 77: 0.005, 78: 0.0025, 79: 0.001, 80: 0}
             else:
                 nums = [int(s) for s in age_group.replace("ára", "").replace("ára", "").split() if s.isdigit()]
@@ -175,9 +184,32 @@ def clean_occupation_income_distribution() -> None:
     print(f"Bronze: occupation_income_distribution -> {dest}")
 
 
+def budget_sheets_to_csv() -> None:
+    """Tidy the 2026 budget proposal: revenue lines (sheet 4-1) and spending per policy area (sheet 5-4), m.kr."""
+    src = LANDING_DIR / "fjarlog_2026.xlsx"
+    if not src.exists():
+        print("Skip budget sheets (fjarlog_2026.xlsx missing).")
+        return
+    revenue = pd.read_excel(src, sheet_name="4-1", header=None)
+    revenue = pd.DataFrame({"line": revenue[0].astype(str).str.strip(),
+                            "frumvarp_2026": pd.to_numeric(revenue[3], errors="coerce")})
+    revenue = revenue[revenue["frumvarp_2026"].notna() & (revenue["line"] != "nan")]
+    spending = pd.read_excel(src, sheet_name="5-4", header=None)
+    labels = spending[0].astype(str).str.strip()
+    parts = labels.str.extract(r"^(\d{2})\s+(.*)$")
+    found = parts[0].notna()
+    spending = pd.DataFrame({"area": parts.loc[found, 0].astype(int), "name": parts.loc[found, 1],
+                             "frumvarp_2026": pd.to_numeric(spending.loc[found, 2], errors="coerce")})
+    for name, df in (("fjarlog_2026_revenue", revenue), ("fjarlog_2026_expenditure", spending)):
+        dest = BRONZE_DIR / f"{name}.csv"
+        df.to_csv(dest, index=False)
+        print(f"Bronze: {name} -> {dest}")
+
+
 def main() -> None:
     BRONZE_DIR.mkdir(parents=True, exist_ok=True)
     excel_to_csv(LANDING_DIR / "fjarlog_2026.xlsx", BRONZE_DIR / "fjarlog_2026.csv")
+    budget_sheets_to_csv()
     excel_to_csv(LANDING_DIR / "arsreikningar_sveitarfelaga.xlsx", BRONZE_DIR / "arsreikningar_sveitarfelaga.csv")
     if (LANDING_DIR / "utsvar_sveitarfelaga.xls").exists():
         excel_to_csv(LANDING_DIR / "utsvar_sveitarfelaga.xls", BRONZE_DIR / "utsvar_sveitarfelaga.csv")
@@ -1,57 +1,85 @@
 import os
 import sqlite3
-import subprocess
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+# Allow running as a script without installing as a package
+sys.path.append(os.getcwd())
+from helpers import format_number, population_hash, population_weights, weighted_quantile
+from generate_population import POPULATION_COLUMNS, generate_and_write
+from population_store import GOLD_FORMAT, GOLD_PARTITION, POPULATION_STORE, write_column_store, write_population_file
+
 SILVER_DB = Path("data/silver.db")
 GOLD_DIR = Path("data/gold")
 
 
-def run_generate_population(db_path: Path = SILVER_DB) -> None:
-    env = {**os.environ, "DB_PATH": str(db_path)}
-    subprocess.run([sys.executable, "generate_population.py"], check=True, env=env)
-
-
-def export_population(db_path: Path = SILVER_DB, dest: Path = GOLD_DIR / "population.csv") -> None:
-    dest.parent.mkdir(parents=True, exist_ok=True)
+def run_generate_population(db_path: Path = SILVER_DB) -> pd.DataFrame:
+    """Generate the population in this process into `db_path`; returns the generated frame."""
     conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM population", conn)
-    df.to_csv(dest, index=False)
+    population_df = generate_and_write(conn)
     conn.close()
-    print(f"Gold: exported population -> {dest}")
+    print(f"Gold: generated {len(population_df)} population records "
+          f"({format_number(population_weights(population_df).sum())} people) into {db_path}")
+    return population_df
+
+
+def export_population(population_df: pd.DataFrame, dest: Path = GOLD_DIR / "population", fmt: str = GOLD_FORMAT,
+                      partition: bool = GOLD_PARTITION) -> Path:
+    """Write the generated population (the columns of the `population` table, with its `id`) as a
+    columnar file, see population_store.py; GOLD_FORMAT=csv gives the old CSV export."""
+    present = [col for col in POPULATION_COLUMNS if col in population_df.columns]
+    gold = population_df[present].reset_index(drop=True)
+    gold.insert(0, "id", np.arange(1, len(gold) + 1))
+    path = write_population_file(gold, dest, fmt, partition)
+    print(f"Gold: exported population -> {path}")
+    return path
+
+
+def export_column_store(population_df: pd.DataFrame, directory: Path = POPULATION_STORE) -> Path:
+    """Write the memory-mapped column store that downstream stages load instead of the SQLite table;
+    it carries the content hash write_population recorded, so they can tell it is current."""
+    present = [col for col in POPULATION_COLUMNS if col in population_df.columns]
+    gold = population_df[present].reset_index(drop=True)
+    content_hash = population_hash(gold)
+    gold.insert(0, "id", np.arange(1, len(gold) + 1))
+    path = write_column_store(gold, directory, content_hash)
+    print(f"Gold: wrote population column store -> {path}")
+    return path
 
 
-def build_occupation_income_stats(db_path: Path = SILVER_DB) -> None:
+def build_occupation_income_stats(db_path: Path = SILVER_DB, pop: pd.DataFrame | None = None) -> None:
     """Create a gold table with occupation probabilities and income ranges by age/gender."""
     conn = sqlite3.connect(db_path)
-    pop = pd.read_sql_query("SELECT age, gender, occupation, total_income FROM population", conn)
+    pop = pd.read_sql_query("SELECT * FROM population", conn) if pop is None else pop.copy()
     if pop.empty:
         print("Gold: population is empty; skipping occupation income stats.")
         conn.close()
         return
+    pop["weight"] = population_weights(pop)
 
-    totals = pop.groupby(["age", "gender"]).size().rename("group_count")
+    totals = pop.groupby(["age", "gender"])["weight"].sum().rename("group_count")
     stats_rows = []
     for (age, gender), group in pop.groupby(["age", "gender"]):
         group_total = totals.loc[(age, gender)]
         for occupation, sub in group.groupby("occupation"):
-            count = len(sub)
+            count = sub["weight"].sum()
             prob = count / group_total if group_total else 0
-            quantiles = sub["total_income"].quantile([0, 0.25, 0.5, 0.75, 1]).to_dict()
+            quantiles = weighted_quantile(sub["total_income"], sub["weight"], [0, 0.25, 0.5, 0.75, 1])
             stats_rows.append(
                 {
                     "age": age,
                     "gender": gender,
                     "occupation": occupation,
-                    "count": int(count),
+                    "count": int(round(count)),
+                    "records": int(len(sub)),
                     "probability": float(prob),
-                    "income_min": float(quantiles.get(0.0, 0)),
-                    "income_p25": float(quantiles.get(0.25, 0)),
-                    "income_p50": float(quantiles.get(0.5, 0)),
-                    "income_p75": float(quantiles.get(0.75, 0)),
-                    "income_max": float(quantiles.get(1.0, 0)),
+                    "income_min": float(quantiles[0]),
+                    "income_p25": float(quantiles[1]),
+                    "income_p50": float(quantiles[2]),
+                    "income_p75": float(quantiles[3]),
+                    "income_max": float(quantiles[4]),
                 }
             )
 
@@ -62,9 +90,10 @@ def build_occupation_income_stats(db_path: Path = SILVER_DB) -> None:
 
 
 def main() -> None:
-    run_generate_population(SILVER_DB)
-    export_population(SILVER_DB)
-    build_occupation_income_stats(SILVER_DB)
+    population_df = run_generate_population(SILVER_DB)
+    export_population(population_df)
+    export_column_store(population_df)
+    build_occupation_income_stats(SILVER_DB, population_df)
 
 
 if __name__ == "__main__":
@@ -11,8 +11,20 @@ def run_calculate_taxes(db_path: Path = SILVER_DB) -> None:
     subprocess.run([sys.executable, "calculate_taxes.py"], check=True, env=env)
 
 
+def run_consumption(db_path: Path = SILVER_DB) -> None:
+    env = {**os.environ, "DB_PATH": str(db_path)}
+    subprocess.run([sys.executable, "consumption.py"], check=True, env=env)
+
+
+def run_incidence(db_path: Path = SILVER_DB) -> None:
+    env = {**os.environ, "DB_PATH": str(db_path)}
+    subprocess.run([sys.executable, "incidence.py"], check=True, env=env)
+
+
 def main() -> None:
     run_calculate_taxes(SILVER_DB)
+    run_consumption(SILVER_DB)
+    run_incidence(SILVER_DB)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+Tax policy specifications: brackets, personal credit, children's tax, capital gains, fees and
+their age conditions for one tax year or reform, read from TOML files in policies/.
+
+A file may name a `base` file and override only some values: tables are merged key by key,
+lists (brackets, fees) are replaced whole. load_policy compiles a file into a TaxPolicy once:
+bracket thresholds, rates and the tax below each threshold become arrays, so evaluating a
+whole population is a bracket lookup (np.searchsorted) plus a few array operations. Compiled
+policies are cached by path and modification time, so another tax year or reform proposal
+is a new file, not a code edit.
+
+TAX_POLICY selects the policy calculate_taxes.py uses: a path to a .toml file or the name of
+one in policies/ (default DEFAULT_POLICY).
+"""
+import copy
+import os
+import tomllib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+POLICY_DIR = Path("policies")
+DEFAULT_POLICY = "2024"
+TAX_POLICY = os.getenv("TAX_POLICY", DEFAULT_POLICY)
+
+
+class TaxPolicy:
+    """Compiled tax rules with vectorized evaluation (all amounts per person and period)."""
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.name = str(spec.get('name', spec.get('year', '')))
+        self.year = spec.get('year')
+        income_tax = spec['income_tax']
+        self.personal_credit = float(income_tax['personal_credit'])
+        # Each bracket ends at its `upper` threshold (the last one has none); a bracket starts
+        # where the previous one ends
+        self.brackets = [(float(b.get('upper', np.inf)), float(b['rate'])) for b in income_tax['brackets']]
+        uppers = np.array([upper for upper, _ in self.brackets])
+        self.rates = np.array([rate for _, rate in self.brackets])
+        self.thresholds = np.r_[0.0, uppers[:-1]]
+        if np.any(np.diff(self.thresholds) <= 0):
+            raise ValueError(f"Bracket thresholds of policy {self.name!r} must increase: {uppers[:-1]}")
+        self.tax_below = np.r_[0.0, np.cumsum(np.diff(self.thresholds) * self.rates[:-1])]
+        transfer = income_tax.get('credit_transfer', {})
+        self.credit_transfer = bool(transfer.get('enabled', False))
+        self.credit_transfer_min_age = transfer.get('min_age', 0)
+        child = spec['child_tax']
+        self.child_max_age = child['max_age']
+        self.child_rate = float(child['rate'])
+        self.child_allowance = float(child['allowance'])
+        capital_gains = spec['capital_gains']
+        self.capital_gains_rate = float(capital_gains['rate'])
+        self.capital_gains_allowance = float(capital_gains['allowance'])
+        self.municipal_fallback_rate = spec.get('municipal', {}).get('fallback_rate')
+        self.fees = spec.get('fees', [])
+
+    def scaled(self, factor: float) -> "TaxPolicy":
+        """The same rules with every amount (thresholds, credit, allowances, fees) times `factor`,
+        e.g. 1/12 for one month or a price index for a later year."""
+        spec = copy.deepcopy(self.spec)
+        spec['income_tax']['personal_credit'] *= factor
+        for bracket in spec['income_tax']['brackets']:
+            if 'upper' in bracket:
+                bracket['upper'] *= factor
+        spec['child_tax']['allowance'] *= factor
+        spec['capital_gains']['allowance'] *= factor
+        for fee in spec.get('fees', []):
+            fee['amount'] *= factor
+        return TaxPolicy(spec)
+
+    def state_tax(self, total_income) -> np.ndarray:
+        """State tax by exact bracket lookup: tax below the person's bracket plus the rate on the rest."""
+        total_income = np.asarray(total_income, dtype=float)
+        bracket = np.maximum(np.searchsorted(self.thresholds, total_income, side='right') - 1, 0)
+        tax = self.tax_below[bracket] + (total_income - self.thresholds[bracket]) * self.rates[bracket]
+        return np.where(total_income > 0, tax, 0.0)
+
+    def gross_tax(self, total_income, municipal_tax_rate) -> tuple[np.ndarray, np.ndarray]:
+        """State plus municipal tax before the personal credit: (gross_tax, municipal_tax)."""
+        total_income = np.asarray(total_income, dtype=float)
+        municipal_tax = total_income * municipal_tax_rate
+        return self.state_tax(total_income) + municipal_tax, municipal_tax
+
+    def child_tax(self, total_income) -> np.ndarray:
+        return np.maximum(0, np.asarray(total_income, dtype=float) - self.child_allowance) * self.child_rate
+
+    def income_tax(self, total_income, age, municipal_tax_rate) -> tuple[np.ndarray, np.ndarray]:
+        """(net_tax, net_municipal_tax) after the personal credit; the children's tax replaces both
+        components up to child_max_age. The credit is shared between the components pro rata."""
+        gross_tax, municipal_tax = self.gross_tax(total_income, municipal_tax_rate)
+        net_tax = np.maximum(0, gross_tax - self.personal_credit)
+        share = np.divide(net_tax, gross_tax, out=np.zeros_like(gross_tax), where=gross_tax > 0)
+        child = np.asarray(age) <= self.child_max_age
+        return (np.where(child, self.child_tax(total_income), net_tax),
+                np.where(child, 0.0, municipal_tax * share))
+
+    def capital_gains_tax(self, capital_gains) -> np.ndarray:
+        return np.maximum(0, np.asarray(capital_gains, dtype=float) - self.capital_gains_allowance) * self.capital_gains_rate
+
+    def fixed_fees(self, age) -> np.ndarray:
+        """Sum of the flat fees each person pays given the fees' age conditions."""
+        age = np.asarray(age)
+        total = np.zeros(age.shape)
+        for fee in self.fees:
+            applies = age >= fee.get('min_age', 0)
+            if 'max_age' in fee:
+                applies &= age <= fee['max_age']
+            total += np.where(applies, fee['amount'], 0.0)
+        return total
+
+
+def policy_path(name: str | Path = TAX_POLICY, directory: Path = POLICY_DIR) -> Path:
+    """A .toml path as given, or the file of that name in `directory`."""
+    path = Path(name)
+    return path if path.suffix == '.toml' else directory / f"{name}.toml"
+
+
+def read_spec(path: Path) -> dict:
+    """The TOML spec at `path` with its `base` chain merged in (tables merge, other values replace)."""
+    with open(path, 'rb') as file:
+        spec = tomllib.load(file)
+    base = spec.pop('base', None)
+    if base is None:
+        return spec
+    return merge(read_spec(path.parent / base), spec)
+
+
+def merge(base: dict, override: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@lru_cache(maxsize=None)
+def _compile(path: Path, modified: int) -> TaxPolicy:
+    return TaxPolicy(read_spec(path))
+
+
+def load_policy(name: str | Path = TAX_POLICY) -> TaxPolicy:
+    """Compiled policy for a name in policies/ or a .toml path (cached until the file changes)."""
+    path = policy_path(name).resolve()
+    return _compile(path, path.stat().st_mtime_ns)
@@ -0,0 +1,229 @@
+"""
+Columnar population files for the gold layer.
+
+write_population_file writes the generated population straight from its arrays:
+- `parquet` (default): zstd-compressed Parquet via pyarrow, types kept,
+- `npz`: compressed NumPy archive, one array per column; text columns are stored as
+  category codes (int16, -1 for missing) plus their category labels. Used automatically
+  when pyarrow is not installed,
+- `csv`: opt-in only, for tools that need plain text.
+With partition=True the file becomes a directory with one file per age band
+(AGE_BAND_WIDTH years, e.g. `age_band=020-029.parquet`), so age-restricted readers open
+only the bands they need.
+
+read_population_file loads only the requested columns: Parquet and npz both store each
+column separately, so unread columns are never decompressed.
+
+The gold stage also writes a column store (POPULATION_STORE): one uncompressed .npy file
+per column plus metadata.json with the record count, the population's content hash and
+the labels of text columns (stored as int16 codes). ColumnStore opens the files with
+np.load(mmap_mode='r'), so numeric columns are read-only, zero-copy views of the page
+cache that any number of processes share. load_population is the loader for downstream
+stages: it uses the store when its content hash matches the one write_population
+recorded for the `population` table (helpers.load_population_hash) and falls back to
+SQLite otherwise. Run as a script to rebuild the store from the current `population` table
+(e.g. after calibrate.py or another stage rewrote it).
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, load_population_hash, store_population_hash
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+GOLD_FORMAT = os.getenv("GOLD_FORMAT", "parquet")
+POPULATION_STORE = Path(os.getenv("POPULATION_STORE", "data/gold/population_columns"))
+METADATA_FILE = "metadata.json"
+GOLD_PARTITION = os.getenv("GOLD_PARTITION", "0") == "1"
+AGE_BAND_WIDTH = 10
+SUFFIXES = {'parquet': '.parquet', 'npz': '.npz', 'csv': '.csv'}
+CODES_SUFFIX = "__codes"
+LABELS_SUFFIX = "__labels"
+
+
+def resolve_format(fmt: str = GOLD_FORMAT) -> str:
+    """`fmt`, falling back to npz (with a warning) when Parquet is asked for without pyarrow."""
+    if fmt not in SUFFIXES:
+        raise ValueError(f"Unknown population file format {fmt!r}; use one of {', '.join(SUFFIXES)}.")
+    if fmt == 'parquet' and pq is None:
+        print("Warning: pyarrow is not installed; writing the population as compressed npz instead.")
+        return 'npz'
+    return fmt
+
+
+def is_text(values: pd.Series) -> bool:
+    return values.dtype == object or isinstance(values.dtype, pd.StringDtype)
+
+
+def decode_text(codes: np.ndarray, labels) -> np.ndarray:
+    """Text values from category codes and labels; code -1 (missing) becomes None."""
+    return np.array([str(label) for label in labels] + [None], dtype=object)[codes]
+
+
+def _write_part(df: pd.DataFrame, path: Path, fmt: str) -> None:
+    if fmt == 'parquet':
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression='zstd')
+    elif fmt == 'npz':
+        arrays = {}
+        for column in df.columns:
+            values = df[column]
+            if is_text(values):
+                categorical = pd.Categorical(values)
+                arrays[column + CODES_SUFFIX] = categorical.codes.astype(np.int16)
+                arrays[column + LABELS_SUFFIX] = np.asarray(categorical.categories, dtype=str)
+            else:
+                arrays[column] = values.to_numpy()
+        np.savez_compressed(path, **arrays)
+    else:
+        df.to_csv(path, index=False)
+
+
+def _read_part(path: Path, columns: list | None) -> pd.DataFrame:
+    if path.suffix == '.parquet':
+        if pq is None:
+            raise ImportError(f"pyarrow is needed to read {path}")
+        return pq.read_table(path, columns=columns).to_pandas()
+    if path.suffix == '.npz':
+        with np.load(path, allow_pickle=False) as archive:
+            stored = [name[:-len(CODES_SUFFIX)] if name.endswith(CODES_SUFFIX) else name
+                      for name in archive.files if not name.endswith(LABELS_SUFFIX)]
+            data = {}
+            for column in columns or stored:
+                if column + CODES_SUFFIX in archive.files:
+                    data[column] = decode_text(archive[column + CODES_SUFFIX], archive[column + LABELS_SUFFIX])
+                else:
+                    data[column] = archive[column]
+        return pd.DataFrame(data)
+    return pd.read_csv(path, usecols=columns)
+
+
+def age_bands(ages: np.ndarray) -> np.ndarray:
+    """Lower bound of each person's AGE_BAND_WIDTH-year band."""
+    return np.asarray(ages, dtype=np.intp) // AGE_BAND_WIDTH * AGE_BAND_WIDTH
+
+
+def write_population_file(population_df: pd.DataFrame, dest: Path, fmt: str = GOLD_FORMAT,
+                          partition: bool = GOLD_PARTITION) -> Path:
+    """Write the population as `dest` + format suffix (or a directory of age bands); returns the path."""
+    fmt = resolve_format(fmt)
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if not partition:
+        path = dest.with_suffix(SUFFIXES[fmt])
+        _write_part(population_df, path, fmt)
+        return path
+    dest.mkdir(parents=True, exist_ok=True)
+    for stale in dest.glob("age_band=*"):
+        stale.unlink()
+    bands = age_bands(population_df['age'].to_numpy())
+    for low in np.unique(bands):
+        name = f"age_band={low:03d}-{low + AGE_BAND_WIDTH - 1:03d}{SUFFIXES[fmt]}"
+        _write_part(population_df[bands == low], dest / name, fmt)
+    return dest
+
+
+def read_population_file(path: Path, columns: list | None = None, min_age: int | None = None,
+                         max_age: int | None = None) -> pd.DataFrame:
+    """Population columns from a file written by write_population_file.
+
+    For a partitioned directory only the age bands overlapping [min_age, max_age] are read;
+    rows are not filtered within a band.
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return _read_part(path, columns)
+    parts = []
+    for part in sorted(path.glob("age_band=*")):
+        low, high = (int(age) for age in part.stem.split("=")[1].split("-"))
+        if (min_age is not None and high < min_age) or (max_age is not None and low > max_age):
+            continue
+        parts.append(_read_part(part, columns))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+
+
+def write_column_store(population_df: pd.DataFrame, directory: Path = POPULATION_STORE,
+                       content_hash: str | None = None) -> Path:
+    """One .npy file per column plus metadata.json; `content_hash` ties the store to the SQLite population."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    metadata_path = directory / METADATA_FILE
+    metadata_path.unlink(missing_ok=True)  # readers ignore a store without metadata while it is rewritten
+    for stale in directory.glob("*.npy"):
+        stale.unlink()
+    columns = {}
+    for column in population_df.columns:
+        values = population_df[column]
+        if is_text(values):
+            categorical = pd.Categorical(values)
+            np.save(directory / f"{column}.npy", categorical.codes.astype(np.int16))
+            columns[column] = {'labels': [str(label) for label in categorical.categories]}
+        else:
+            array = np.ascontiguousarray(values.to_numpy())
+            np.save(directory / f"{column}.npy", array)
+            columns[column] = {'dtype': str(array.dtype)}
+    metadata = {'records': len(population_df), 'content_hash': content_hash, 'columns': columns}
+    metadata_path.write_text(json.dumps(metadata, ensure_ascii=False, indent=1), encoding="utf-8")
+    return directory
+
+
+class ColumnStore:
+    """Read-only view of a column store written by write_column_store."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.metadata = json.loads((self.directory / METADATA_FILE).read_text(encoding="utf-8"))
+        self.records = self.metadata['records']
+        self.content_hash = self.metadata.get('content_hash')
+        self.columns = list(self.metadata['columns'])
+
+    def array(self, column: str) -> np.ndarray:
+        """Numeric columns as read-only memory maps; text columns decoded from their codes."""
+        # A plain ndarray view of the map, so arithmetic results are ordinary arrays
+        values = np.asarray(np.load(self.directory / f"{column}.npy", mmap_mode='r'))
+        labels = self.metadata['columns'][column].get('labels')
+        if labels is None:
+            return values
+        return decode_text(values, labels)
+
+    def frame(self, columns: list | None = None) -> pd.DataFrame:
+        """DataFrame over the columns without copying the numeric memory maps."""
+        return pd.DataFrame({column: self.array(column) for column in columns or self.columns}, copy=False)
+
+
+def open_column_store(directory: Path = POPULATION_STORE) -> ColumnStore | None:
+    try:
+        return ColumnStore(directory)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_population(conn, columns: list | None = None, directory: Path = POPULATION_STORE) -> pd.DataFrame:
+    """The population table (or some of its columns), from the column store when it holds the same population."""
+    store = open_column_store(directory)
+    if store is not None and store.content_hash is not None and store.content_hash == load_population_hash(conn):
+        return store.frame(columns)
+    return pd.read_sql_query(f"SELECT {', '.join(columns) if columns else '*'} FROM population", conn)
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = pd.read_sql_query("SELECT * FROM population", conn)
+    content_hash = load_population_hash(conn)
+    if content_hash is None:
+        content_hash = store_population_hash(conn, population_df.drop(columns='id'))
+    conn.close()
+    path = write_column_store(population_df, POPULATION_STORE, content_hash)
+    print(f"Wrote {len(population_df.columns)} columns of {len(population_df)} records to {path}")
+
+
+if __name__ == "__main__":
+    main()
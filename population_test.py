@@ -3,6 +3,7 @@ import sqlite3
 import matplotlib.pyplot as plt
 from pathlib import Path
 from helpers import get_db_path, format_number
+from population_store import load_population
 
 # Connect to the SQLite database
 conn = sqlite3.connect(get_db_path())
@@ -12,8 +13,7 @@ original_income_query = "SELECT * FROM gender_and_age_income_distribution"
 original_income_df = pd.read_sql_query(original_income_query, conn)
 
 # Fetch the generated population data
-generated_population_query = "SELECT * FROM population"
-generated_population_df = pd.read_sql_query(generated_population_query, conn)
+generated_population_df = load_population(conn)
 
 # Fetch tax data from the population_with_taxes table
 tax_query = """
@@ -0,0 +1,70 @@
+"""
+Post-processing steps applied to a freshly generated population.
+
+Every step has the signature step(population_df, rng) and edits the DataFrame in place,
+so the generator can run an arbitrary list of them (see POST_PROCESSING in generate_population.py).
+Thresholds are keyword arguments; bind them with functools.partial to configure a step.
+"""
+import numpy as np
+import pandas as pd
+
+TOP_K_CHUNK_SIZE = 1_000_000
+
+
+def top_k_indices(values: np.ndarray, k: int, chunk_size: int = TOP_K_CHUNK_SIZE) -> np.ndarray:
+    """Positions of the k largest values, scanning in chunks so memory stays O(k + chunk_size)."""
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    best = np.empty(0, dtype=np.intp)
+    for start in range(0, n, chunk_size):
+        candidates = np.concatenate([best, np.arange(start, min(start + chunk_size, n))])
+        if len(candidates) > k:
+            keep = np.argpartition(values[candidates], len(candidates) - k)[-k:]
+            candidates = candidates[keep]
+        best = candidates
+    return best
+
+
+def top_share_indices(population_df: pd.DataFrame, column: str, top_share: float) -> np.ndarray:
+    """Rows holding the top `top_share` of people by `column`, honoring the `weight` column."""
+    values = population_df[column].to_numpy()
+    weights = population_df['weight'].to_numpy() if 'weight' in population_df.columns else None
+    if weights is None or weights.size == 0 or np.all(weights == weights[0]):
+        return top_k_indices(values, int(np.ceil(len(values) * top_share)))
+    # Weighted records: walk down from the top until the cumulative weight covers the share
+    order = np.argsort(-values, kind='stable')
+    covered = np.searchsorted(np.cumsum(weights[order]), top_share * weights.sum()) + 1
+    return order[:covered]
+
+
+def boost_top_capital_gains(
+    population_df: pd.DataFrame,
+    rng: np.random.Generator | None = None,
+    top_share: float = 0.001,
+    min_age: int = 65,
+    full_age: int = 90,
+    base_factor: float = 3,
+    gains_cap: float = 2_000_000,
+    gains_scale: float = 1e6,
+) -> None:
+    """Exponential capital gains boost for the top `top_share` of total income, older people only.
+
+    The boost is exp(min(capital_gains, gains_cap) / gains_scale) * base_factor, scaled by age
+    from min_age to full_age. Only the selected rows are read back and rewritten.
+    """
+    top = top_share_indices(population_df, 'total_income', top_share)
+    age = population_df['age'].to_numpy()[top]
+    top = top[age >= min_age]
+    if len(top) == 0:
+        return
+
+    columns = [population_df.columns.get_loc(c) for c in ('wages', 'capital_gains', 'other_income', 'total_income')]
+    wages, capital_gains, other_income, _ = population_df.iloc[top, columns].to_numpy(dtype=float).T
+    age_scale = np.minimum((population_df['age'].to_numpy()[top] - min_age) / (full_age - min_age), 1)
+    capital_gains = np.round(
+        capital_gains * np.exp(np.minimum(capital_gains, gains_cap) / gains_scale) * base_factor * age_scale
+    )
+    population_df.iloc[top, columns[1]] = capital_gains
+    population_df.iloc[top, columns[3]] = np.round(wages + capital_gains + other_income)
@@ -0,0 +1,274 @@
+"""
+Multi-year projection: ages the generated population forward and taxes every year.
+
+The population is held as a handful of arrays (age, gender, income ranks, status, weight).
+Each projected year is a set of array operations:
+- aging: everyone gets one year older,
+- mortality: weights shrink by a Gompertz death probability per age and gender,
+- births: newborn records are added in proportion to women aged 15-49,
+- migration: NET_MIGRATION people are spread over ages 20-39 by scaling weights,
+- incomes: every person keeps their rank within their cell, and incomes are re-read at the
+  new age from the same income model as the generator (INCOME_MODEL: the fitted tables, or
+  the official mean times the clipped-normal noise quantile), with the generator's taper
+  after taper_start, and indexed with the consumer price index,
+- status: one Markov step (labor_market.apply_transitions with a LaborMarket estimated from
+  the base population) at the start of the year; people whose status changes take the
+  incomes of a random person with their new status and get the ranks of those incomes.
+
+Taxes use calculate_taxes.py with all fixed amounts (brackets, credits, limits, fees) indexed
+by the same price index, i.e. tax_t(y) = index_t * tax_base(y / index_t). INDEX_BRACKETS=0
+freezes them instead (fiscal drag). Only one year's arrays are kept; per-year aggregates are
+written to the `projection_results` table.
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number
+from income_model import INCOME_COMPONENTS, _norm_ppf
+from generate_population import (
+    GENDERS, INCOME_MODEL, POPULATION_MODE, RECORDS_PER_CELL, SEED,
+    generate, income_taper, load_generator_params, load_inputs, official_means,
+)
+from labor_market import LaborMarket, apply_transitions
+from calculate_taxes import compute_taxes, tax_totals
+
+BASE_YEAR = 2025  # year of the population and income tables
+PROJECTION_START = int(os.getenv("PROJECTION_START", "2026"))
+PROJECTION_END = int(os.getenv("PROJECTION_END", "2040"))
+NET_MIGRATION = float(os.getenv("NET_MIGRATION", "2000"))  # net immigrants per year
+INDEX_BRACKETS = os.getenv("INDEX_BRACKETS", "1") == "1"
+MIGRANT_AGES = (20, 39)
+FERTILE_AGES = (15, 49)
+MAX_AGE = 110
+
+# Gompertz mortality q(x) = a * exp(b * x), plus infant mortality in the first year
+MORTALITY_A = {'Male': 2.6e-5, 'Female': 1.6e-5}
+MORTALITY_B = 0.1
+INFANT_MORTALITY = 0.002
+
+CPI_PATH = Path("data/consumer_price_index.csv")
+FALLBACK_INFLATION = 0.025
+
+
+def load_annual_inflation(path: Path = CPI_PATH, fallback: float = FALLBACK_INFLATION) -> float:
+    """Average annual growth of the (unweighted) mean CPI category index between the first and last month."""
+    try:
+        cpi = pd.read_csv(path, sep=';', encoding='utf-8-sig')
+        month = cpi.columns[0]
+        level = cpi.drop(columns=[month]).mean(axis=1).to_numpy()
+        years, months = zip(*(m.split('M') for m in cpi[month]))
+        span = (int(years[-1]) - int(years[0])) + (int(months[-1]) - int(months[0])) / 12
+        return float((level[-1] / level[0]) ** (1 / span) - 1)
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read consumer price index from {path}: {exc}. Using fallback {fallback:.3f}.")
+        return fallback
+
+
+def death_probability(age: np.ndarray, is_female: np.ndarray) -> np.ndarray:
+    """Probability of dying within the year at the given age."""
+    a = np.where(is_female, MORTALITY_A['Female'], MORTALITY_A['Male'])
+    q = np.minimum(a * np.exp(MORTALITY_B * age), 1.0)
+    q = np.where(age == 0, INFANT_MORTALITY, q)
+    return np.where(age >= MAX_AGE, 1.0, q)
+
+
+class ProjectedPopulation:
+    """Array state of the population; incomes are derived from per-person ranks each year."""
+
+    def __init__(self, population_df: pd.DataFrame, inputs: dict, rng: np.random.Generator,
+                 income_model: str = INCOME_MODEL, params: dict | None = None):
+        self.inputs = inputs
+        self.tables = inputs['income_tables']
+        self.income_model = income_model
+        self.params = load_generator_params() if params is None else params
+        self._rows = {}
+        self.age = population_df['age'].to_numpy(dtype=np.int64)
+        self.is_female = population_df['gender'].to_numpy() == 'Female'
+        self.status = population_df['status'].to_numpy(dtype=object)
+        self.weight = population_df['weight'].to_numpy(dtype=float)
+        # Rank of each person within their cell, per component, kept for life. People with income
+        # get the rank their base-year income has in the cell; the rest (children) a random one.
+        self.ranks = rng.random((len(INCOME_COMPONENTS), len(self.age)))
+        incomes = population_df[list(INCOME_COMPONENTS)].to_numpy(dtype=float).T
+        for group, age, gender in self._cells():
+            self._set_ranks(group, age, gender, incomes[:, group], 1.0)
+        # Newborn templates: age-0 records of the base year
+        newborn = self.age == 0
+        self.newborn = {'is_female': self.is_female[newborn], 'share': self.weight[newborn] / self.weight[newborn].sum()}
+        # Births per woman aged 15-49 in the base year
+        fertile = self.is_female & (self.age >= FERTILE_AGES[0]) & (self.age <= FERTILE_AGES[1])
+        self.fertility = self.weight[newborn].sum() / self.weight[fertile].sum()
+
+    def _cells(self, positions: np.ndarray | None = None):
+        """Yield (row positions, age, gender) for every age/gender cell present (among `positions`)."""
+        positions = np.arange(len(self.age)) if positions is None else positions
+        cells = self.age[positions] * 2 + self.is_female[positions]
+        order = np.argsort(cells, kind='stable')
+        bounds = np.flatnonzero(np.diff(cells[order])) + 1
+        for group in np.split(positions[order], bounds):
+            if len(group):
+                yield group, int(self.age[group[0]]), GENDERS[bool(self.is_female[group[0]])]
+
+    def _table_row(self, c_idx: int, age: int, gender: str) -> np.ndarray:
+        """Income quantiles of one cell on the tables' probability grid, before the taper."""
+        if self.income_model == 'fitted':
+            return self.tables.quantiles[c_idx, self.tables.genders.index(gender), min(age, self.tables.max_age)]
+        key = (c_idx, age, gender)
+        if key not in self._rows:
+            # Official mean x the quantiles of the generator's clipped-normal noise
+            sigma = self.params['noise_sigma_old'] if age >= 90 else self.params['noise_sigma']
+            clip = self.params['noise_clip']
+            noise = np.clip(1 + sigma * _norm_ppf(self.tables.probs), 1 - clip, 1 + clip)
+            self._rows[key] = official_means(self.inputs['income_df'], age, gender)[c_idx] * noise
+        return self._rows[key]
+
+    def _set_ranks(self, group: np.ndarray, age: int, gender: str, incomes: np.ndarray, price_index: float) -> None:
+        """Ranks of one cell's incomes (components x people, in the year's prices) within the cell."""
+        if age < 13:
+            return
+        deflated = incomes / (price_index * income_taper(age, self.params))
+        for c_idx in range(len(INCOME_COMPONENTS)):
+            row = self._table_row(c_idx, age, gender)
+            if row.any():
+                self.ranks[c_idx, group] = np.interp(deflated[c_idx], row, self.tables.probs)
+
+    def incomes(self, price_index: float) -> np.ndarray:
+        """Incomes (components x people) at the current ages, in the year's prices."""
+        out = np.zeros_like(self.ranks)
+        for group, age, gender in self._cells():
+            if age < 13:
+                continue  # No income for people under 13
+            taper = income_taper(age, self.params)
+            for c_idx in range(len(INCOME_COMPONENTS)):
+                row = self._table_row(c_idx, age, gender)
+                out[c_idx, group] = np.interp(self.ranks[c_idx, group], self.tables.probs, row) * taper
+        return np.round(out * price_index)
+
+    def advance(self, rng: np.random.Generator, net_migration: float) -> dict:
+        """Age the population one year; returns the flows of the year."""
+        deaths = self.weight * death_probability(self.age, self.is_female)
+        self.weight = self.weight - deaths
+        self.age = self.age + 1
+
+        alive = self.age <= MAX_AGE
+        self._keep(alive)
+
+        # Births in proportion to women of fertile age, relative to the base year rate
+        fertile = self.is_female & (self.age >= FERTILE_AGES[0]) & (self.age <= FERTILE_AGES[1])
+        births = self.fertility * self.weight[fertile].sum()
+        n = len(self.newborn['share'])
+        self.age = np.concatenate([self.age, np.zeros(n, dtype=np.int64)])
+        self.is_female = np.concatenate([self.is_female, self.newborn['is_female']])
+        self.status = np.concatenate([self.status, np.full(n, 'Student', dtype=object)])
+        self.weight = np.concatenate([self.weight, births * self.newborn['share']])
+        self.ranks = np.concatenate([self.ranks, rng.random((len(INCOME_COMPONENTS), n))], axis=1)
+
+        # Net migration scales the weights of the migrant ages
+        band = (self.age >= MIGRANT_AGES[0]) & (self.age <= MIGRANT_AGES[1])
+        self.weight[band] *= 1 + net_migration / self.weight[band].sum()
+        return {'deaths': float(deaths.sum()), 'births': float(births), 'net_migration': net_migration}
+
+    def _keep(self, mask: np.ndarray) -> None:
+        self.age, self.is_female, self.status, self.weight = (
+            self.age[mask], self.is_female[mask], self.status[mask], self.weight[mask]
+        )
+        self.ranks = self.ranks[:, mask]
+
+    def update_status(self, population_df: pd.DataFrame, changed: np.ndarray, price_index: float) -> None:
+        """Take the statuses of a frame moved by apply_transitions; movers get the ranks of their new incomes."""
+        self.status = population_df['status'].to_numpy(dtype=object)
+        incomes = population_df[list(INCOME_COMPONENTS)].to_numpy(dtype=float).T
+        for group, age, gender in self._cells(np.flatnonzero(changed)):
+            self._set_ranks(group, age, gender, incomes[:, group], price_index)
+
+    def frame(self, incomes: np.ndarray) -> pd.DataFrame:
+        wages, capital_gains, other_income = incomes
+        return pd.DataFrame({
+            'age': self.age,
+            'gender': np.where(self.is_female, 'Female', 'Male'),
+            'wages': wages,
+            'capital_gains': capital_gains,
+            'other_income': other_income,
+            'total_income': wages + capital_gains + other_income,
+            'status': self.status,
+            'weight': self.weight,
+        })
+
+
+def year_taxes(population_df: pd.DataFrame, price_index: float, index_brackets: bool = INDEX_BRACKETS) -> dict:
+    """National tax totals for one projected year in that year's prices."""
+    if not index_brackets:
+        return tax_totals(compute_taxes(population_df))
+    # Indexing every fixed amount by I is the same as taxing y / I under base rules and scaling by I
+    deflated = population_df.copy()
+    for column in ('wages', 'capital_gains', 'other_income', 'total_income'):
+        deflated[column] = deflated[column] / price_index
+    return {k: v * price_index for k, v in tax_totals(compute_taxes(deflated)).items()}
+
+
+def project(inputs: dict, rng: np.random.Generator, start: int = PROJECTION_START, end: int = PROJECTION_END,
+            net_migration: float = NET_MIGRATION, inflation: float | None = None, conn=None) -> pd.DataFrame:
+    """Run the projection; per-year aggregates go to `projection_results` (if conn) and are returned."""
+    params = load_generator_params()
+    inflation = load_annual_inflation() if inflation is None else inflation
+    base = generate(inputs, rng, INCOME_MODEL, POPULATION_MODE, RECORDS_PER_CELL, params)
+    state = ProjectedPopulation(base, inputs, rng, INCOME_MODEL, params)
+    market = LaborMarket.estimate(base)
+
+    if conn is not None:
+        conn.execute("DROP TABLE IF EXISTS projection_results")
+    rows = []
+    price_index = 1.0
+    for year in range(BASE_YEAR + 1, end + 1):
+        # Status step from last year's ages, before aging
+        population_df = state.frame(state.incomes(price_index))
+        changed = apply_transitions(population_df, market, rng, inputs)
+        state.update_status(population_df, changed, price_index)
+        flows = state.advance(rng, net_migration)
+        price_index = (1 + inflation) ** (year - BASE_YEAR)
+        incomes = state.incomes(price_index)
+        if year < start:
+            continue
+        population_df = state.frame(incomes)
+        weights = population_df['weight'].to_numpy()
+        row = {
+            'year': year,
+            'price_index': price_index,
+            'population': weights.sum(),
+            **flows,
+            'employed': weights[population_df['status'].to_numpy() == 'Employed'].sum(),
+            'retired': weights[population_df['status'].to_numpy() == 'Retired'].sum(),
+            'aged_67_plus': weights[population_df['age'].to_numpy() >= 67].sum(),
+            'total_income': population_df['total_income'].to_numpy() @ weights,
+            **year_taxes(population_df, price_index),
+        }
+        rows.append(row)
+        if conn is not None:
+            pd.DataFrame([row]).to_sql("projection_results", conn, if_exists="append", index=False)
+    return pd.DataFrame(rows)
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    inputs = load_inputs(conn)
+    rng = np.random.default_rng(int(SEED) if SEED else None)
+    inflation = load_annual_inflation()
+    print(f"Projecting {PROJECTION_START}-{PROJECTION_END} from {BASE_YEAR} ({POPULATION_MODE} mode, {INCOME_MODEL} incomes, "
+          f"inflation {inflation:.2%}/yr, net migration {format_number(NET_MIGRATION)}/yr, "
+          f"brackets {'indexed' if INDEX_BRACKETS else 'frozen'})")
+    results = project(inputs, rng, inflation=inflation, conn=conn)
+    conn.commit()
+    conn.close()
+
+    for _, row in results.iterrows():
+        print(f"  {int(row['year'])}: population {format_number(row['population'])}, "
+              f"employed {format_number(row['employed'])}, total tax {format_number(row['total_tax'])}")
+    print("Per-year results written to the projection_results table.")
+
+
+if __name__ == "__main__":
+    main()
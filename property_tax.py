@@ -0,0 +1,213 @@
+"""
+Property tax (fasteignaskattur) microsimulation: dwellings allocated to households.
+
+Municipal property tax is levied on the assessed value (fasteignamat) at three rates per
+municipality: A on dwellings, B on public buildings and C on commercial and other property.
+Tafla 13 (`property_tax_amount`) gives the rates and the tax base of every class per
+municipality; `property_value_estimates` gives the national number of properties and the
+total fasteignamat of the latest year, to which all bases are scaled.
+
+allocate_dwellings hands out the class A properties of each municipality to its households:
+- DWELLING_SHARE of all registered properties are dwellings, spread over municipalities by
+  residents; the households most likely to own (older head, higher income, plus noise) get
+  one each until the municipality's dwellings are used up. The count is weighted, and the
+  one record that straddles it owns only the part of its weight that is left, so the owned
+  weight equals the municipality's dwellings (or its households, if there are fewer),
+- values rise with household income (VALUE_INCOME_ELASTICITY) with lognormal spread and
+  are scaled so the owned dwellings add up to the municipality's class A base.
+The value sits in `property_value` on the household head (oldest adult); everyone else has 0.
+Dwellings left over when a municipality has more dwellings than households stay with
+owners outside the population, as do classes B and C, and are taxed in aggregate.
+
+property_taxes is then one vectorized pass: value x the rate_a lookup array indexed by
+municipality number. Rate reforms (reform_rates) and the breakdown by household income
+decile run at the speed of the income tax. Run as a script to write `property_tax_by_municipality`.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights, weighted_deciles
+from calculate_taxes import municipal_rate_lookup
+from households import household_heads
+from municipalities import load_property_tax_table, municipality_positions
+from population_store import load_population
+
+DWELLING_SHARE = 0.7  # about 160 thousand of the 232 thousand registered properties are dwellings
+OWNERSHIP_AGE_SLOPE = 0.05  # ownership score per year of the head's age (up to OWNERSHIP_MAX_AGE)
+OWNERSHIP_MAX_AGE = 70
+OWNERSHIP_NOISE = 1.0
+VALUE_INCOME_ELASTICITY = 0.5
+VALUE_SIGMA = 0.4
+RATE_COLUMNS = ['rate_a', 'rate_b', 'rate_c']
+BASE_COLUMNS = ['base_a', 'base_b', 'base_c']
+
+
+def load_property_values(conn) -> dict:
+    """Latest year, number of properties and total fasteignamat (ISK) from `property_value_estimates`."""
+    try:
+        values = pd.read_sql_query("SELECT * FROM property_value_estimates", conn)
+        latest = values.sort_values('Ár').iloc[-1]
+        return {'year': int(latest['Ár']), 'properties': float(latest['Fjöldi_fasteigna']),
+                'fasteignamat': float(latest['Fasteignamat']) * 1e6}  # m.kr.
+    except Exception as exc:  # pragma: no cover - informational only
+        print(f"Warning: Could not read property_value_estimates: {exc}. Using the Tafla 13 bases as they are.")
+        return None
+
+
+def load_property_table(conn) -> pd.DataFrame:
+    """Per-municipality rates, bases (ISK, scaled to the latest fasteignamat) and dwelling counts.
+
+    Returns None (with a warning) when Tafla 13 is unavailable.
+    """
+    table = load_property_tax_table(conn)
+    if table is None:
+        print("Warning: Dwellings are not allocated.")
+        return None
+    table = table.copy()
+    for column in BASE_COLUMNS + ['tax_a', 'tax_b', 'tax_c', 'tax_total']:
+        table[column] = table[column] * 1000  # thousand ISK
+    values = load_property_values(conn)
+    if values is not None:
+        scale = values['fasteignamat'] / table[BASE_COLUMNS].to_numpy().sum()
+        table[BASE_COLUMNS] = table[BASE_COLUMNS] * scale
+        properties = values['properties']
+    else:
+        properties = table['residents'].sum() * 0.6
+    table['dwellings'] = properties * DWELLING_SHARE * table['residents'] / table['residents'].sum()
+    return table
+
+
+def rate_lookups(table: pd.DataFrame) -> dict:
+    """Dense rate arrays indexed by municipality number, one per property class."""
+    codes = table['municipality'].to_numpy()
+    return {column: municipal_rate_lookup(pd.Series(table[column].to_numpy(), index=codes), table[column].mean())
+            for column in RATE_COLUMNS}
+
+
+def allocate_dwellings(population_df: pd.DataFrame, rng: np.random.Generator, table: pd.DataFrame) -> None:
+    """Add `property_value` (in place): class A value owned by each household head, 0 for everyone else."""
+    heads, income = household_heads(population_df)
+    weights = population_weights(population_df)[heads]
+    age = np.minimum(population_df['age'].to_numpy()[heads], OWNERSHIP_MAX_AGE)
+    positions = municipality_positions(population_df.iloc[heads], table)
+    size = len(table)
+
+    # Within each municipality the highest ownership scores own, until the dwellings run out
+    score = OWNERSHIP_AGE_SLOPE * age + np.log1p(np.maximum(income, 0)) + rng.normal(0, OWNERSHIP_NOISE, len(heads))
+    order = np.lexsort((-score, positions))
+    before = np.cumsum(weights[order]) - weights[order]
+    start = np.searchsorted(positions[order], np.arange(size))
+    before -= before[np.minimum(start, len(order) - 1)][positions[order]]
+    # Share of each head's weight that owns: 1 below the count, a fraction for the record that straddles it
+    owner = np.zeros(len(heads))
+    left = table['dwellings'].to_numpy()[positions[order]] - before
+    owner[order] = np.clip(left, 0, weights[order]) / weights[order]
+
+    # Values rise with income (a straddling record's in proportion to its owned share);
+    # scale each municipality to its owned share of the class A base
+    raw = np.maximum(income, 1) ** VALUE_INCOME_ELASTICITY * rng.lognormal(0, VALUE_SIGMA, len(heads)) * owner
+    owned = np.bincount(positions, weights=weights * owner, minlength=size)
+    raw_total = np.bincount(positions, weights=weights * raw, minlength=size)
+    target = table['base_a'].to_numpy() * np.minimum(1, owned / table['dwellings'].to_numpy())
+    scale = np.divide(target, raw_total, out=np.zeros(size), where=raw_total > 0)
+
+    value = np.zeros(len(population_df))
+    value[heads] = np.round(raw * scale[positions])
+    population_df['property_value'] = value
+
+
+def reform_rates(table: pd.DataFrame, **rates) -> pd.DataFrame:
+    """Copy of the table with rates replaced, e.g. reform_rates(table, rate_a=0.002) or a per-municipality array."""
+    table = table.copy()
+    for column, rate in rates.items():
+        table[column] = np.broadcast_to(rate, len(table))
+    return table
+
+
+def property_taxes(population_df: pd.DataFrame, table: pd.DataFrame) -> np.ndarray:
+    """Class A property tax per person (on the household head), in one vectorized pass."""
+    rate_a = rate_lookups(table)['rate_a']
+    codes = np.clip(population_df['municipality'].to_numpy(dtype=np.intp), 0, len(rate_a) - 1)
+    return population_df['property_value'].to_numpy() * rate_a[codes]
+
+
+def property_tax_by_municipality(population_df: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """Household and non-household property tax per municipality with the assessed 2024 total."""
+    weights = population_weights(population_df)
+    positions = municipality_positions(population_df, table)
+    size = len(table)
+    household_base = np.bincount(positions, weights=population_df['property_value'].to_numpy() * weights, minlength=size)
+    household_tax = np.bincount(positions, weights=property_taxes(population_df, table) * weights, minlength=size)
+    base_a = table['base_a'].to_numpy()
+    # Owned values add up to base_a * owned / dwellings (allocate_dwellings), which gives the owned weight back
+    owned = np.divide(household_base * table['dwellings'].to_numpy(), base_a, out=np.zeros(size), where=base_a > 0)
+    other_base_a = np.maximum(base_a - household_base, 0)
+    other_tax = (other_base_a * table['rate_a'].to_numpy() + table['base_b'].to_numpy() * table['rate_b'].to_numpy()
+                 + table['base_c'].to_numpy() * table['rate_c'].to_numpy())
+    return table[['municipality', 'name', 'residents'] + RATE_COLUMNS].assign(
+        owned_dwellings=owned,
+        household_base=household_base,
+        household_tax=household_tax,
+        other_tax=other_tax,
+        property_tax=household_tax + other_tax,
+        assessed_2024=table['tax_total'].to_numpy(),
+    )
+
+
+def property_tax_by_decile(population_df: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """Household property tax by decile of household income (weighted households)."""
+    heads, income = household_heads(population_df)
+    weights = population_weights(population_df)[heads]
+    tax = property_taxes(population_df, table)[heads]
+    decile = weighted_deciles(income, weights)
+    households = np.bincount(decile, weights=weights, minlength=10)
+    owners = np.bincount(decile, weights=weights * (tax > 0), minlength=10)
+    total = np.bincount(decile, weights=weights * tax, minlength=10)
+    mean_income = np.bincount(decile, weights=weights * income, minlength=10) / households
+    return pd.DataFrame({
+        'decile': np.arange(1, 11),
+        'households': households,
+        'owner_share': owners / households,
+        'property_tax': total,
+        'tax_share_of_income': total / (mean_income * households),
+    })
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+    table = load_property_table(conn)
+    if table is None:
+        conn.close()
+        return
+    if 'property_value' not in population_df.columns or population_df['property_value'].isna().any():
+        print("Population has no dwellings; run generate_population.py (with municipalities) first.")
+        conn.close()
+        return
+
+    results = property_tax_by_municipality(population_df, table)
+    results.to_sql("property_tax_by_municipality", conn, if_exists="replace", index=False)
+    conn.close()
+
+    print(f"Dwellings owned by households: {format_number(results['owned_dwellings'].sum())} "
+          f"of {format_number(table['dwellings'].sum())}, "
+          f"value {format_number(results['household_base'].sum())}")
+    print(f"Property tax: {format_number(results['property_tax'].sum())} "
+          f"(households {format_number(results['household_tax'].sum())}, "
+          f"assessed 2024: {format_number(results['assessed_2024'].sum())})")
+
+    # Example reform: a uniform class A rate of 0.2%
+    reformed = property_tax_by_municipality(population_df, reform_rates(table, rate_a=0.002))
+    print(f"Uniform 0.2% class A rate: {format_number(reformed['property_tax'].sum())}")
+
+    print("Household property tax by income decile:")
+    for _, row in property_tax_by_decile(population_df, table).iterrows():
+        print(f"  {int(row['decile']):2d}: owners {row['owner_share']:.0%}, tax {format_number(row['property_tax'])} "
+              f"({row['tax_share_of_income']:.2%} of income)")
+    print("Per-municipality results written to the property_tax_by_municipality table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Monte Carlo replicates of population generation plus tax calculation.
+
+Runs REPLICATES independently seeded population draws on a process pool
+(REPLICATE_WORKERS processes, default one per CPU). Each worker reduces its population to
+aggregates (national totals for every tax column, total tax per age) and only those travel
+back; the parent appends them to `replicate_results` as they arrive, so no more than one
+population per worker is ever in memory. `replicate_summary` then holds the mean, standard
+error and percentile interval of every line across replicates.
+
+Seeds come from np.random.SeedSequence(SEED).spawn(REPLICATES), so a run is reproducible
+and replicates are statistically independent. POPULATION_MODE, RECORDS_PER_CELL and
+INCOME_MODEL are honoured as in generate_population.py.
+"""
+import os
+import sqlite3
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from generate_population import INCOME_MODEL, POPULATION_MODE, RECORDS_PER_CELL, generate, load_generator_params, load_inputs
+from calculate_taxes import TAX_COLUMNS, compute_taxes, tax_totals
+
+REPLICATES = int(os.getenv("REPLICATES", "20"))
+REPLICATE_WORKERS = int(os.getenv("REPLICATE_WORKERS", str(os.cpu_count() or 1)))
+SEED = int(os.getenv("SEED", "0"))
+INTERVAL = (2.5, 97.5)  # percentile interval reported per line
+
+_worker_state = {}
+
+
+def _init_worker(db_path: str) -> None:
+    """Load the silver inputs once per worker process."""
+    conn = sqlite3.connect(db_path)
+    _worker_state['inputs'] = load_inputs(conn)
+    conn.close()
+    _worker_state['params'] = load_generator_params()
+
+
+def run_replicate(task) -> pd.DataFrame:
+    """Generate and tax one population; return its aggregates in long format."""
+    replicate, seed_sequence = task
+    rng = np.random.default_rng(seed_sequence)
+    population_df = generate(_worker_state['inputs'], rng, INCOME_MODEL, POPULATION_MODE, RECORDS_PER_CELL,
+                             _worker_state['params'])
+    taxed = compute_taxes(population_df)
+
+    totals = tax_totals(taxed)
+    rows = [(replicate, column, -1, totals[column]) for column in TAX_COLUMNS]
+    ages = taxed['age'].to_numpy()
+    by_age = np.bincount(ages, weights=taxed['total_tax'].to_numpy() * population_weights(taxed))
+    rows += [(replicate, 'total_tax', age, value) for age, value in enumerate(by_age) if (ages == age).any()]
+    return pd.DataFrame(rows, columns=['replicate', 'line', 'age', 'value'])
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean, standard error and percentile interval per (line, age) across replicates."""
+    grouped = results.groupby(['line', 'age'])['value']
+    summary = grouped.agg(['mean', 'std', 'count']).reset_index()
+    summary['std_error'] = summary['std'].fillna(0) / np.sqrt(summary['count'])
+    summary['p_low'] = grouped.quantile(INTERVAL[0] / 100).to_numpy()
+    summary['p_high'] = grouped.quantile(INTERVAL[1] / 100).to_numpy()
+    return summary.rename(columns={'count': 'replicates'})[
+        ['line', 'age', 'replicates', 'mean', 'std', 'std_error', 'p_low', 'p_high']
+    ]
+
+
+def run_replicates(db_path: str, replicates: int = REPLICATES, workers: int = REPLICATE_WORKERS,
+                   seed: int = SEED) -> pd.DataFrame:
+    """Run the replicates and stream their aggregates into replicate_results; returns the summary."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE IF EXISTS replicate_results")
+    conn.execute("CREATE TABLE replicate_results (replicate INTEGER, line TEXT, age INTEGER, value REAL)")
+    tasks = list(enumerate(np.random.SeedSequence(seed).spawn(replicates)))
+
+    with Pool(processes=max(1, min(workers, replicates)), initializer=_init_worker, initargs=(db_path,)) as pool:
+        for done, result in enumerate(pool.imap_unordered(run_replicate, tasks), start=1):
+            conn.executemany("INSERT INTO replicate_results VALUES (?, ?, ?, ?)",
+                             result.itertuples(index=False, name=None))
+            conn.commit()
+            print(f"  replicate {done}/{replicates} done")
+
+    summary = summarize(pd.read_sql_query("SELECT * FROM replicate_results", conn))
+    summary.to_sql("replicate_summary", conn, if_exists="replace", index=False)
+    conn.close()
+    return summary
+
+
+def main():
+    print(f"Running {REPLICATES} replicates ({POPULATION_MODE} mode, {INCOME_MODEL} incomes) "
+          f"on {min(REPLICATE_WORKERS, REPLICATES)} workers...")
+    summary = run_replicates(get_db_path())
+
+    print(f"Tax totals across replicates (mean, standard error, {INTERVAL[0]:g}-{INTERVAL[1]:g}% interval):")
+    for _, row in summary[summary['age'] == -1].set_index('line').reindex(TAX_COLUMNS).reset_index().iterrows():
+        print(f"  {row['line']}: {format_number(row['mean'])} (se {format_number(row['std_error'])}, "
+              f"{format_number(row['p_low'])} - {format_number(row['p_high'])})")
+    print("Per-age totals are in the replicate_summary table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,8 @@ import pandas as pd
 
 # Allow running as a script without installing as a package
 sys.path.append(os.getcwd())
-from helpers import get_db_path, format_number
+from helpers import get_db_path, format_number, weighted_group_means
+from population_store import load_population
 
 OUT_TXT = Path("reports/population_diagnostics.txt")
 OUT_CSV = Path("reports/population_diagnostics.csv")
@@ -23,10 +24,7 @@ OUT_CSV = Path("reports/population_diagnostics.csv")
 def main():
     db_path = get_db_path()
     conn = sqlite3.connect(db_path)
-    pop = pd.read_sql_query(
-        "select age, gender, total_income, wages, capital_gains, other_income from population",
-        conn,
-    )
+    pop = load_population(conn, ["gender", "age", "weight", "total_income", "wages", "capital_gains", "other_income"])
     ref = pd.read_sql_query(
         "select Aldur as age, Kyn as gender, Heildartekjur as ref_total, "
         "Atvinnutekjur as ref_wages, Fjármagnstekjur as ref_cg, Aðrar_tekjur as ref_other "
@@ -37,7 +35,7 @@ def main():
 
     ref["gender"] = ref["gender"].replace({"Karlar": "Male", "Konur": "Female"})
 
-    pop_means = pop.groupby(["gender", "age"]).mean().reset_index()
+    pop_means = weighted_group_means(pop, ["gender", "age"], ["total_income", "wages", "capital_gains", "other_income"])
     ref_means = ref.groupby(["gender", "age"]).mean().reset_index()
 
     merged = ref_means.merge(pop_means, on=["gender", "age"], how="outer").fillna(0)
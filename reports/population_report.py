@@ -10,7 +10,10 @@ import sqlite3
 
 # Allow running as a script without installing as a package
 sys.path.append(os.getcwd())
-from helpers import get_db_path, format_number
+from helpers import get_db_path, format_number, population_weights, weighted_group_means
+from calculate_taxes import compute_taxes, tax_totals
+from distribution import decile_table, rank_population
+from population_store import load_population
 
 BUDGET_FILES = [
     Path("data/landing/fjarlog_2026.xlsx"),
@@ -25,10 +28,6 @@ PROPERTY_VALUE_FALLBACK = Path("data/property_value_estimates.csv")
 PROPERTY_TAX_TABLE = Path("data/bronze/property_tax_amount.csv")
 PROPERTY_TAX_TABLE_FALLBACK = Path("data/bronze/property_tax_amount.xlsx")
 PROPERTY_TAX_TABLE_FALLBACK_ROOT = Path("data/property_tax_amount.xlsx")
-MUNICIPAL_TAX_FILE_CANDIDATES = [
-    Path("data/landing/utsvar_sveitarfelaga.xls"),
-    Path("data/utsvar_sveitarfelaga.xls"),
-]
 
 REPORT_PATH = Path("reports/population_report.html")
 
@@ -200,73 +199,15 @@ def load_property_value_estimate(path: Path) -> dict | None:
         return None
 
 
-# Tax constants (mirrors calculate_taxes.py)
-PERSONAL_TAX_CREDIT = 779112  # Annual personal tax credit in ISK
-TAX_BRACKETS = [
-    (446136 * 12, 0.3148),     # Up to 5,353,632 ISK at 31.48%
-    (1252501 * 12, 0.3798),    # 5,353,633 - 15,030,012 ISK at 37.98%
-    (float('inf'), 0.4628),    # Above 15,030,012 ISK at 46.28%
-]
-CHILD_TAX_RATE = 0.06  # Under 16
-CAPITAL_GAINS_TAX_RATE = 0.22
-FREE_CAPITAL_GAINS_LIMIT = 300000
-RADIO_FEE = 20900
-ELDERLY_FUND_FEE = 13749
-DEFAULT_MUNICIPAL_TAX_RATE = 0.1494
-
-
 def load_table(conn, name):
     try:
+        if name == "population":
+            return load_population(conn)
         return pd.read_sql_query(f"SELECT * FROM {name}", conn)
     except Exception:
         return None
 
 
-def load_municipal_tax_rate():
-    for path in MUNICIPAL_TAX_FILE_CANDIDATES:
-        if path.exists():
-            try:
-                df = pd.read_excel(path, sheet_name="Öll", header=None)
-                row = df[df[0] == "Meðal útvarsprósenta"]
-                if row.empty:
-                    row = df[df[0].astype(str).str.contains("Meðal útvarsprósenta", na=False)]
-                if not row.empty:
-                    return float(row.iloc[0, 2])
-            except Exception:
-                continue
-    return DEFAULT_MUNICIPAL_TAX_RATE
-
-
-def calculate_income_tax(total_income, age, municipal_tax_rate):
-    if age < 16:
-        taxable_income = max(0, total_income - 180000)
-        return taxable_income * CHILD_TAX_RATE, 0.0
-
-    state_tax = 0.0
-    remaining = total_income
-    for limit, rate in TAX_BRACKETS:
-        portion = min(remaining, limit)
-        state_tax += portion * rate
-        remaining -= portion
-        if remaining <= 0:
-            break
-
-    municipal_tax = total_income * municipal_tax_rate
-    gross_tax = state_tax + municipal_tax
-    net_tax = max(0, gross_tax - PERSONAL_TAX_CREDIT)
-
-    net_muni = municipal_tax * (net_tax / gross_tax) if gross_tax > 0 and net_tax > 0 else 0.0
-    return net_tax, net_muni
-
-
-def calculate_capital_gains_tax(capital_gains):
-    return max(0, capital_gains - FREE_CAPITAL_GAINS_LIMIT) * CAPITAL_GAINS_TAX_RATE
-
-
-def calculate_fixed_fees(age):
-    return RADIO_FEE + ELDERLY_FUND_FEE if age >= 18 else 0
-
-
 def plot_to_base64(fig):
     buf = io.BytesIO()
     fig.tight_layout()
@@ -296,7 +237,7 @@ def compare_income_by_age(original_df, population_df):
         if orig_col not in original_df.columns or gen_col not in population_df.columns:
             continue
         orig = original_df.groupby("Aldur")[orig_col].mean()
-        gen = population_df.groupby("age")[gen_col].mean()
+        gen = weighted_group_means(population_df, ["age"], [gen_col]).set_index("age")[gen_col]
 
         ages = sorted(set(orig.index).union(set(gen.index)))
         # Keep NaNs for missing ages so lines stop instead of dropping to zero
@@ -337,7 +278,7 @@ def compare_income_by_age_gender(original_df, population_df):
             if orig_col not in orig_g.columns or gen_col not in gen_g.columns:
                 continue
             orig = orig_g.groupby("Aldur")[orig_col].mean()
-            gen = gen_g.groupby("age")[gen_col].mean()
+            gen = weighted_group_means(gen_g, ["age"], [gen_col]).set_index("age")[gen_col]
             ages = sorted(set(orig.index).union(set(gen.index)))
             # Keep NaNs for missing ages so lines stop instead of dropping to zero
             orig = orig.reindex(ages)
@@ -358,7 +299,8 @@ def compare_income_by_age_gender(original_df, population_df):
 def occupation_distribution(population_df):
     if population_df is None or "occupation" not in population_df.columns:
         return None
-    counts = population_df["occupation"].value_counts().sort_values(ascending=False)
+    weights = pd.Series(population_weights(population_df), index=population_df.index)
+    counts = weights.groupby(population_df["occupation"]).sum().sort_values(ascending=False)
     fig, ax = plt.subplots(figsize=(8, 4))
     counts.plot(kind="bar", ax=ax)
     ax.set_title("Generated population by occupation")
@@ -370,24 +312,7 @@ def occupation_distribution(population_df):
 def compute_taxes_from_population(population_df):
     if population_df is None or population_df.empty:
         return {}
-    muni_rate = load_municipal_tax_rate()
-    income_tax_total = 0.0
-    muni_tax_total = 0.0
-    cg_tax_total = 0.0
-    fees_total = 0.0
-    for _, row in population_df.iterrows():
-        net_tax, net_muni = calculate_income_tax(row.get("total_income", 0), row.get("age", 0), muni_rate)
-        income_tax_total += net_tax
-        muni_tax_total += net_muni
-        cg_tax_total += calculate_capital_gains_tax(row.get("capital_gains", 0))
-        fees_total += calculate_fixed_fees(row.get("age", 0))
-    return {
-        "income_tax": income_tax_total,
-        "municipal_tax": muni_tax_total,
-        "capital_gains_tax": cg_tax_total,
-        "fixed_fees": fees_total,
-        "total_tax": income_tax_total + cg_tax_total + fees_total,
-    }
+    return tax_totals(compute_taxes(population_df))
 
 
 def taxes_summary(original_df, tax_df, population_df):
@@ -400,7 +325,7 @@ def taxes_summary(original_df, tax_df, population_df):
     if tax_df is not None:
         for col in ["income_tax", "capital_gains_tax", "broadcasting_fee", "elderly_fund_fee", "total_tax", "municipal_tax"]:
             if col in tax_df.columns:
-                computed[col] = tax_df[col].sum()
+                computed[col] = (tax_df[col] * population_weights(tax_df)).sum()
     if not computed:
         computed = compute_taxes_from_population(population_df)
     # Convert to m.kr for consistent display with budget targets
@@ -409,6 +334,17 @@ def taxes_summary(original_df, tax_df, population_df):
     return assumed_income_table_mkr, computed_mkr
 
 
+def distribution_by_decile(conn, tax_df, population_df):
+    """Tax rates by decile of total income (one sort, reused from the income_ranks cache if valid)."""
+    if tax_df is None or tax_df.empty or "total_tax" not in tax_df.columns:
+        if population_df is None or population_df.empty:
+            return None
+        tax_df = compute_taxes(population_df)
+    rankings, _ = rank_population(tax_df, conn, measures=["total_income"])
+    ranking = rankings["total_income"]
+    return decile_table(tax_df, ranking), ranking.gini()
+
+
 def load_budget_targets():
     """Return state and municipal revenue targets in m.kr if available."""
     state_target = None
@@ -485,7 +421,8 @@ def load_property_tax_analysis():
     return analysis
 
 
-def render_html(age_plots, gender_plots, occ_plot, assumed_tax, computed_taxes, budget_targets, property_tax_analysis):
+def render_html(age_plots, gender_plots, occ_plot, assumed_tax, computed_taxes, budget_targets, property_tax_analysis,
+                distribution=None):
     def img_tag(title, b64):
         return f"<h3>{title}</h3><img src='data:image/png;base64,{b64}' style='max-width:100%; height:auto;'/>"
 
@@ -555,6 +492,17 @@ def render_html(age_plots, gender_plots, occ_plot, assumed_tax, computed_taxes,
 
     body += "<h2>Taxes</h2><table border='1' cellpadding='6' cellspacing='0'>" + tax_rows + "</table>"
 
+    if distribution is not None:
+        deciles, gini = distribution
+        body += f"<h2>Distribution by total income decile</h2><p>Gini coefficient: {gini:.3f}</p>"
+        body += "<table border='1' cellpadding='6' cellspacing='0'><tr><th>Decile</th><th>Income share</th>"
+        body += "<th>Mean income</th><th>Effective tax rate</th><th>Average tax rate</th></tr>"
+        for _, row in deciles.iterrows():
+            rates = [f"{rate * 100:.1f}%" if pd.notna(rate) else "-" for rate in (row["effective_tax_rate"], row["average_tax_rate"])]
+            body += (f"<tr><td>{int(row['decile'])}</td><td>{row['income_share'] * 100:.1f}%</td>"
+                     f"<td>{format_number(row['total_income'] / row['people'])}</td><td>{rates[0]}</td><td>{rates[1]}</td></tr>")
+        body += "</table>"
+
     html = f"""<!DOCTYPE html>
 <html>
 <head>
@@ -575,6 +523,7 @@ def main():
     original_df = load_table(conn, "gender_and_age_income_distribution")
     population_df = load_table(conn, "population")
     tax_df = load_table(conn, "population_with_taxes")
+    distribution = distribution_by_decile(conn, tax_df, population_df)
     conn.close()
 
     age_plots = compare_income_by_age(original_df, population_df)
@@ -592,6 +541,7 @@ def main():
         computed_taxes,
         budget_targets,
         property_tax_analysis,
+        distribution,
     )
     REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
     REPORT_PATH.write_text(html, encoding="utf-8")
@@ -0,0 +1,199 @@
+"""
+Scenario runner with a results cache.
+
+A scenario is a policy file (see policy.py) in SCENARIO_DIR, by default policies/. It may
+also carry a [benefits] table of benefit scheme changes in the form benefits.reform takes,
+e.g. [benefits.old_age_pension] rate = 0.4. Each result is keyed by
+- population_hash: sha256 of the population table's contents, recorded when the population
+  is written (generate_population.write_population), so a cache hit never reads the table,
+- policy_hash: sha256 of the scenario's merged spec (JSON with sorted keys, without `name`,
+  so renaming a file or reaching the same rules through another base keeps the key),
+- code_version: sha256 of the source files that compute the results: scenarios.py and every
+  repo module it imports, directly or through other repo modules (code_files), plus the
+  municipal rate file compute_taxes reads at import (CODE_DATA).
+run_scenarios looks every key up in `scenario_results` first and sends only the missing
+ones to a pool of SCENARIO_WORKERS processes. The parent loads the population once and
+publishes it in shared memory (shared_population.py); each worker attaches to it, so no
+worker holds its own copy, and returns one row of aggregates per scenario, which the parent
+inserts as it arrives. Running
+the same directory again returns everything from the cache; after an edit only the changed
+scenarios (or, after a new population or code change, all of them) are computed.
+"""
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, load_population_hash, population_weights, store_population_hash
+from calculate_taxes import MUNICIPAL_TAX_PATH, TAX_COLUMNS, compute_taxes, tax_totals
+from benefits import reform, with_benefit_policy
+from distribution import IncomeRanking
+from policy import DEFAULT_POLICY, POLICY_DIR, TaxPolicy, read_spec
+from population_store import load_population
+from shared_population import SharedPopulation
+
+SCENARIO_DIR = Path(os.getenv("SCENARIO_DIR", str(POLICY_DIR)))
+SCENARIO_WORKERS = int(os.getenv("SCENARIO_WORKERS", str(os.cpu_count() or 1)))
+RESULTS_TABLE = "scenario_results"
+KEY_COLUMNS = ['population_hash', 'policy_hash', 'code_version']
+RESULT_COLUMNS = TAX_COLUMNS + ['benefits', 'disposable_income', 'gini_disposable']
+CODE_ROOT = Path(__file__).parent
+CODE_DATA = [MUNICIPAL_TAX_PATH]
+
+_worker_state = {}
+
+
+def load_scenarios(directory: Path = SCENARIO_DIR) -> dict:
+    """Merged spec of every .toml file in `directory`, by file stem."""
+    return {path.stem: read_spec(path) for path in sorted(directory.glob("*.toml"))}
+
+
+def population_fingerprint(conn) -> str:
+    """Content hash of the population recorded by write_population, computed (and recorded) if missing."""
+    digest = load_population_hash(conn)
+    if digest is None:
+        digest = store_population_hash(conn, pd.read_sql_query("SELECT * FROM population", conn))
+    return digest
+
+
+def policy_hash(spec: dict) -> str:
+    rules = {key: value for key, value in spec.items() if key != 'name'}
+    return hashlib.sha256(json.dumps(rules, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def code_files(entry: str = 'scenarios.py', root: Path = CODE_ROOT) -> list:
+    """`entry` and every module of the repo it imports, followed through their own imports."""
+    files, pending = set(), [entry]
+    while pending:
+        name = pending.pop()
+        if name in files:
+            continue
+        files.add(name)
+        for node in ast.walk(ast.parse((root / name).read_bytes())):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules = [node.module]
+            else:
+                continue
+            pending += [f"{module}.py" for module in modules if (root / f"{module}.py").is_file()]
+    return sorted(files)
+
+
+def code_version(files: list | None = None) -> str:
+    digest = hashlib.sha256()
+    for name in (code_files() if files is None else files) + [str(path) for path in CODE_DATA]:
+        digest.update(name.encode())
+        digest.update((CODE_ROOT / name).read_bytes())
+    return digest.hexdigest()
+
+
+def evaluate(population_df: pd.DataFrame, spec: dict) -> dict:
+    """Aggregates of one scenario: tax totals, benefits, disposable income and its Gini."""
+    if 'benefits' in spec:
+        population_df = with_benefit_policy(population_df, reform(**spec['benefits']))
+    taxed = compute_taxes(population_df, policy=TaxPolicy(spec))
+    weights = population_weights(taxed)
+    disposable = (taxed['total_income'] - taxed['total_tax']).to_numpy(dtype=float)
+    benefits = taxed['benefits'].to_numpy() if 'benefits' in taxed.columns else np.zeros(len(taxed))
+    return {
+        **tax_totals(taxed),
+        'benefits': float(benefits @ weights),
+        'disposable_income': float(disposable @ weights),
+        'gini_disposable': IncomeRanking(disposable, weights).gini(),
+    }
+
+
+def _init_worker(spec: dict) -> None:
+    """Attach to the population the parent published."""
+    _worker_state['shared'] = SharedPopulation.attach(spec)
+    _worker_state['population'] = _worker_state['shared'].frame()
+
+
+def run_scenario(task) -> tuple[str, dict]:
+    name, spec = task
+    return name, evaluate(_worker_state['population'], spec)
+
+
+def ensure_results_table(conn) -> None:
+    columns = ", ".join(f"{column} TEXT" for column in KEY_COLUMNS + ['scenario'])
+    values = ", ".join(f"{column} REAL" for column in RESULT_COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} ({columns}, {values}, computed_at TEXT, "
+                 f"PRIMARY KEY ({', '.join(KEY_COLUMNS)}))")
+
+
+def cached_results(conn, population: str, code: str) -> dict:
+    """Stored result rows for this population and code version, by policy hash."""
+    rows = conn.execute(f"SELECT policy_hash, {', '.join(RESULT_COLUMNS)} FROM {RESULTS_TABLE} "
+                        "WHERE population_hash = ? AND code_version = ?", (population, code)).fetchall()
+    return {row[0]: dict(zip(RESULT_COLUMNS, row[1:])) for row in rows}
+
+
+def run_scenarios(db_path: str, scenarios: dict, workers: int = SCENARIO_WORKERS) -> pd.DataFrame:
+    """Results of every scenario (name -> spec), computing only those not in the cache."""
+    conn = sqlite3.connect(db_path)
+    ensure_results_table(conn)
+    keys = {'population_hash': population_fingerprint(conn), 'code_version': code_version()}
+    hashes = {name: policy_hash(spec) for name, spec in scenarios.items()}
+    results = cached_results(conn, keys['population_hash'], keys['code_version'])
+    cached = {name for name, digest in hashes.items() if digest in results}
+
+    # One task per distinct policy; scenarios with identical rules share it
+    tasks = {hashes[name]: (name, spec) for name, spec in scenarios.items() if name not in cached}
+    insert = (f"INSERT OR REPLACE INTO {RESULTS_TABLE} VALUES "
+              f"({', '.join('?' * (len(KEY_COLUMNS) + len(RESULT_COLUMNS) + 2))})")
+
+    def store(name, result):
+        results[hashes[name]] = result
+        conn.execute(insert, (keys['population_hash'], hashes[name], keys['code_version'], name,
+                              *(result[column] for column in RESULT_COLUMNS), time.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+
+    if workers > 1 and len(tasks) > 1:
+        with SharedPopulation.publish(load_population(conn)) as shared, \
+                Pool(processes=min(workers, len(tasks)), initializer=_init_worker, initargs=(shared.spec,)) as pool:
+            for name, result in pool.imap_unordered(run_scenario, list(tasks.values())):
+                store(name, result)
+    elif tasks:
+        population_df = load_population(conn)
+        for name, spec in tasks.values():
+            store(name, evaluate(population_df, spec))
+    conn.close()
+
+    table = pd.DataFrame([{'scenario': name, 'cached': name in cached, **results[digest]}
+                          for name, digest in hashes.items()])
+    return table
+
+
+def main():
+    scenarios = load_scenarios()
+    if not scenarios:
+        print(f"No scenarios found in {SCENARIO_DIR}.")
+        return
+    start = time.perf_counter()
+    table = run_scenarios(get_db_path(), scenarios)
+    elapsed = time.perf_counter() - start
+
+    baseline = table[table['scenario'] == DEFAULT_POLICY]
+    base_tax = float(baseline['total_tax'].iloc[0]) if not baseline.empty else None
+    print(f"{len(table)} scenarios from {SCENARIO_DIR} in {elapsed:.2f}s "
+          f"({int(table['cached'].sum())} from cache, {int((~table['cached']).sum())} computed):")
+    for _, row in table.iterrows():
+        difference = row['total_tax'] - base_tax if base_tax is not None else None
+        change = (f" ({'+' if difference >= 0 else '-'}{format_number(abs(difference))} vs {DEFAULT_POLICY})"
+                  if difference is not None else "")
+        print(f"  {row['scenario']}: total tax {format_number(row['total_tax'])}{change}, benefits "
+              f"{format_number(row['benefits'])}, Gini {row['gini_disposable']:.3f}"
+              f"{' [cached]' if row['cached'] else ''}")
+    print(f"Results stored in the {RESULTS_TABLE} table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+A population shared between processes through multiprocessing.shared_memory.
+
+SharedPopulation.publish copies a population frame once into a single shared memory block:
+numeric columns back to back (each starting on an ALIGNMENT-byte boundary) and text columns
+as int16 category codes, as in the column store (population_store.py). Its `spec` (block
+name, record count, and each column's dtype, offset and text labels) is a small dict, so a
+runner hands it to its pool initializer and every worker attaches by name. Numeric columns
+are then read-only, zero-copy NumPy views of the same physical pages, and text columns are
+decoded from their codes. No population frame is pickled to the workers, so adding workers
+adds no population copies.
+
+The runner that publishes owns the block. Use the handle as a context manager around the
+pool: the block is unlinked when the `with` ends, also on errors, and workers only map it.
+Attach from the publisher's pool workers. They share its resource tracker, which would
+otherwise unlink the block when an unrelated attaching process exits.
+"""
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from population_store import decode_text, is_text
+
+ALIGNMENT = 64  # bytes; keeps every column on its own cache lines
+
+
+class SharedPopulation:
+    """Population columns in one shared memory block, published by a runner and attached by its workers."""
+
+    def __init__(self, spec: dict, memory: SharedMemory, owner: bool = False):
+        self.spec = spec
+        self.memory = memory
+        self.owner = owner
+        self.records = spec['records']
+        self.columns = list(spec['columns'])
+
+    @classmethod
+    def publish(cls, population_df: pd.DataFrame) -> "SharedPopulation":
+        """Copy the frame into a new block; the returned handle owns (and finally unlinks) it."""
+        layout, arrays, size = {}, {}, 0
+        for column in population_df.columns:
+            values = population_df[column]
+            if is_text(values):
+                categorical = pd.Categorical(values)
+                array = categorical.codes.astype(np.int16)
+                layout[column] = {'labels': [str(label) for label in categorical.categories]}
+            else:
+                array = np.ascontiguousarray(values.to_numpy())
+                layout[column] = {}
+            layout[column].update(dtype=array.dtype.str, offset=size)
+            arrays[column] = array
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        memory = SharedMemory(create=True, size=max(size, 1))
+        spec = {'name': memory.name, 'records': len(population_df), 'columns': layout}
+        shared = cls(spec, memory, owner=True)
+        for column, array in arrays.items():
+            shared._view(column)[:] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: dict) -> "SharedPopulation":
+        """Map a block published by another process from its spec."""
+        return cls(spec, SharedMemory(name=spec['name']))
+
+    def _view(self, column: str) -> np.ndarray:
+        layout = self.spec['columns'][column]
+        return np.ndarray(self.records, dtype=np.dtype(layout['dtype']), buffer=self.memory.buf,
+                          offset=layout['offset'])
+
+    def array(self, column: str) -> np.ndarray:
+        """Numeric columns as read-only views of the block; text columns decoded from their codes."""
+        values = self._view(column)
+        labels = self.spec['columns'][column].get('labels')
+        if labels is not None:
+            return decode_text(values, labels)
+        values.flags.writeable = False
+        return values
+
+    def frame(self, columns: list | None = None) -> pd.DataFrame:
+        """DataFrame over the columns without copying the numeric views."""
+        return pd.DataFrame({column: self.array(column) for column in columns or self.columns}, copy=False)
+
+    def close(self) -> None:
+        """Unmap the block, and unlink it if this handle published it."""
+        if self.owner:
+            self.memory.unlink()
+            self.owner = False
+        try:
+            self.memory.close()
+        except BufferError:
+            # Views handed out are still alive; the mapping goes away with them
+            pass
+
+    def __enter__(self) -> "SharedPopulation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,118 @@
+"""
+Monthly cash-flow simulation of withholding (staðgreiðsla) with year-end reconciliation.
+
+Annual incomes are split into monthly flows (people x 12 arrays):
+- wages follow WAGE_SEASONALITY (holiday pay in June, December bonus),
+- other income (pensions, benefits) is paid evenly,
+- capital gains accrue evenly and are withheld at source at the capital gains rate.
+
+Income tax is withheld every month on wages plus other income with the tax policy scaled to
+one month: the annual bracket thresholds divided by 12 give the statutory monthly
+thresholds (446,136 / 1,252,501 ISK in 2024), with one twelfth of the personal credit.
+At year end the annual assessment from calculate_taxes.py (including the fixed fees and the
+capital gains allowance) is compared with what was withheld; the difference is settled
+after the year. Unused monthly credit is not carried between months, so low or irregular
+earners are over-withheld during the year and refunded at settlement.
+
+The population is processed in chunks of WITHHOLDING_CHUNK_SIZE people so memory stays
+bounded at any population size. Run as a script to write the `monthly_withholding` table.
+"""
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers import get_db_path, format_number, population_weights
+from calculate_taxes import POLICY, calculate_income_tax_array, compute_taxes, municipal_rates
+from population_store import load_population
+
+WITHHOLDING_CHUNK_SIZE = int(os.getenv("WITHHOLDING_CHUNK_SIZE", "250000"))
+MONTHS = 12
+MONTHLY_POLICY = POLICY.scaled(1 / MONTHS)  # bracket thresholds, credit and allowances per month
+
+# Share of annual wages paid each month (sums to 1): holiday pay in June, December bonus
+WAGE_SEASONALITY = np.array([1.0, 1.0, 1.0, 1.0, 1.0, 1.05, 1.0, 1.0, 1.0, 1.0, 1.0, 1.1])
+WAGE_SEASONALITY = WAGE_SEASONALITY / WAGE_SEASONALITY.sum()
+
+MONTHLY_COLUMNS = ['wages', 'other_income', 'capital_gains', 'income_tax_withheld', 'municipal_share',
+                   'capital_gains_tax_withheld', 'total_withheld']
+
+
+def monthly_flows(population_df: pd.DataFrame) -> dict:
+    """Monthly income flows, each of shape (people, 12)."""
+    even = np.full(MONTHS, 1 / MONTHS)
+    return {
+        'wages': population_df['wages'].to_numpy(dtype=float)[:, None] * WAGE_SEASONALITY,
+        'other_income': population_df['other_income'].to_numpy(dtype=float)[:, None] * even,
+        'capital_gains': population_df['capital_gains'].to_numpy(dtype=float)[:, None] * even,
+    }
+
+
+def withhold(population_df: pd.DataFrame, municipal_tax_rate: float | None = None) -> dict:
+    """Per-person monthly withholding for one chunk, arrays of shape (people, 12)."""
+    flows = monthly_flows(population_df)
+    ages = population_df['age'].to_numpy()[:, None]
+    rates = np.asarray(municipal_rates(population_df, municipal_tax_rate))
+    income_tax, municipal = calculate_income_tax_array(
+        flows['wages'] + flows['other_income'], ages, rates[:, None] if rates.ndim else rates, MONTHLY_POLICY,
+    )
+    flows['income_tax_withheld'] = income_tax
+    flows['municipal_share'] = municipal
+    flows['capital_gains_tax_withheld'] = flows['capital_gains'] * POLICY.capital_gains_rate
+    flows['total_withheld'] = income_tax + flows['capital_gains_tax_withheld']
+    return flows
+
+
+def simulate_withholding(population_df: pd.DataFrame, municipal_tax_rate: float | None = None,
+                         chunk_size: int = WITHHOLDING_CHUNK_SIZE) -> tuple[pd.DataFrame, dict]:
+    """Weighted monthly totals (one row per month) and the year-end reconciliation."""
+    monthly = {column: np.zeros(MONTHS) for column in MONTHLY_COLUMNS}
+    reconciliation = {'withheld': 0.0, 'assessed': 0.0, 'payments': 0.0, 'refunds': 0.0,
+                      'people_paying': 0.0, 'people_refunded': 0.0}
+    for start in range(0, len(population_df), chunk_size):
+        chunk = population_df.iloc[start:start + chunk_size]
+        weights = population_weights(chunk)
+        flows = withhold(chunk, municipal_tax_rate)
+        for column in MONTHLY_COLUMNS:
+            monthly[column] += weights @ flows[column]
+
+        withheld = flows['total_withheld'].sum(axis=1)
+        assessed = compute_taxes(chunk, municipal_tax_rate)['total_tax'].to_numpy()
+        settlement = assessed - withheld
+        reconciliation['withheld'] += weights @ withheld
+        reconciliation['assessed'] += weights @ assessed
+        reconciliation['payments'] += weights @ np.maximum(settlement, 0)
+        reconciliation['refunds'] += weights @ np.maximum(-settlement, 0)
+        reconciliation['people_paying'] += weights[settlement > 0.5].sum()
+        reconciliation['people_refunded'] += weights[settlement < -0.5].sum()
+
+    monthly_df = pd.DataFrame({'month': np.arange(1, MONTHS + 1), **monthly})
+    return monthly_df, reconciliation
+
+
+def main():
+    conn = sqlite3.connect(get_db_path())
+    population_df = load_population(conn)
+
+    start = time.perf_counter()
+    monthly_df, reconciliation = simulate_withholding(population_df)
+    elapsed = time.perf_counter() - start
+    monthly_df.to_sql("monthly_withholding", conn, if_exists="replace", index=False)
+    conn.close()
+
+    print(f"Monthly withholding for {len(population_df)} records in {elapsed:.2f}s:")
+    for _, row in monthly_df.iterrows():
+        print(f"  month {int(row['month']):2d}: wages {format_number(row['wages'])}, "
+              f"withheld {format_number(row['total_withheld'])}")
+    print(f"Withheld during the year: {format_number(reconciliation['withheld'])}")
+    print(f"Assessed at year end:     {format_number(reconciliation['assessed'])}")
+    print(f"  Settlement payments: {format_number(reconciliation['payments'])} "
+          f"({format_number(reconciliation['people_paying'])} people)")
+    print(f"  Refunds:             {format_number(reconciliation['refunds'])} "
+          f"({format_number(reconciliation['people_refunded'])} people)")
+
+
+if __name__ == "__main__":
+    main()